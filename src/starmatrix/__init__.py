@@ -6,3 +6,17 @@ Modelling nucleosynthesis of galactic chemical elements
 
 """
 __version__ = "1.7.4"
+
+# Imported on first use, so importing starmatrix (or running `starmatrix --version`) does not load NumPy
+_lazy_attributes = {"load_qmatrices": "starmatrix.qmatrix_store"}
+
+
+def __getattr__(name):
+    if name in _lazy_attributes:
+        import importlib
+        return getattr(importlib.import_module(_lazy_attributes[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_lazy_attributes.keys()))
@@ -0,0 +1,299 @@
+"""
+On-disk caches of results and precomputed values
+
+Results are stored in entries named by a hash of the validated settings (excluding the ones not
+affecting the results, like output_dir), the content of the expelled elements file and the
+Starmatrix version, so identical runs are restored from the cache instead of recomputed.
+
+Entries are directories inside the cache directory. The least recently used ones are removed
+when the total size of the cache is bigger than its maximum size.
+
+The warm cache stores, with the same entries and eviction, deterministic values computed by every
+process (IMF normalizations, Strolger DTDs normalizations and parsed expelled elements files)
+so new processes read them instead of computing them again. It is only used inside
+using_warm_cache blocks, like the ones around the methods of a Model with the warm_cache setting on.
+
+"""
+
+import contextlib
+import contextvars
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+import numpy as np
+import starmatrix
+from starmatrix.results import Results
+
+CACHE_DIR_ENV_VAR = "STARMATRIX_CACHE_DIR"
+RESULTS_ENTRY_FILENAME = "results.npz"
+VALUES_ENTRY_FILENAME = "values.npz"
+
+# Version of the warm cache entries, part of their keys
+WARM_CACHE_FORMAT = 1
+# Maximum size of the warm cache in MB (or cache_max_size, if smaller): its entries take a few KB each
+WARM_CACHE_MAX_SIZE = 64
+# Directory of the warm cache inside the cache_dir setting (hidden from the result cache entries)
+WARM_CACHE_DIRNAME = ".warm"
+
+# Settings that do not change the results of a model
+KEY_IGNORED_SETTINGS = ["output_dir", "result_cache", "cache_dir", "cache_max_size", "deprecation_warnings", "workers", "warm_cache"]
+
+
+def default_cache_dir():
+    """
+    Base directory for Starmatrix caches: the STARMATRIX_CACHE_DIR environment variable if set,
+    or ~/.cache/starmatrix
+
+    """
+    return os.environ.get(CACHE_DIR_ENV_VAR) or os.path.join(os.path.expanduser("~"), ".cache", "starmatrix")
+
+
+@lru_cache(maxsize=32)
+def cached_file_hash(filename, modification_time, size):
+    file_hash = hashlib.sha256()
+    with open(filename, "rb") as hashed_file:
+        for chunk in iter(lambda: hashed_file.read(1 << 20), b""):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def file_hash(filename):
+    """
+    sha256 of the content of a file, computed once while the file is not modified
+
+    """
+    stat = os.stat(filename)
+    return cached_file_hash(filename, stat.st_mtime, stat.st_size)
+
+
+def settings_key(context, kind="files"):
+    """
+    Stable hash of the settings affecting the results of a model.
+    kind separates entries with output files from entries with in-memory results.
+
+    """
+    params = {key: value for key, value in context.items() if key not in KEY_IGNORED_SETTINGS}
+    params["expelled_elements_filename"] = file_hash(context["expelled_elements_filename"])
+
+    data = json.dumps({"kind": kind, "version": starmatrix.__version__, "settings": params}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(directory, name)) for directory, _, files in os.walk(path) for name in files)
+
+
+class ResultCache:
+    """
+    Cache entries in directory, with a maximum total size of max_size megabytes
+
+    """
+
+    def __init__(self, directory="", max_size=1024):
+        self.directory = directory or os.path.join(default_cache_dir(), "results")
+        self.max_size = max_size * 1024 * 1024
+        os.makedirs(self.directory, exist_ok=True)
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key)
+
+    def lookup(self, key):
+        """
+        Path of the entry for the key (marking it as recently used) or None if not present
+
+        """
+        path = self.entry_path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Not stored, or just evicted by another process
+            return None
+        return path if os.path.isdir(path) else None
+
+    def restore(self, key, output_dir):
+        """
+        Copies the output files of a cached entry to output_dir. Returns False if the key is not in the cache.
+
+        """
+        path = self.lookup(key)
+        if path is None:
+            return False
+
+        os.makedirs(output_dir, exist_ok=True)
+        try:
+            for name in os.listdir(path):
+                shutil.copy2(os.path.join(path, name), os.path.join(output_dir, name))
+        except FileNotFoundError:
+            # Evicted by another process while copying it
+            return False
+        return True
+
+    def store(self, key, output_dir):
+        """
+        Stores the files in output_dir as the entry for the key
+
+        """
+        self._store_entry(key, lambda entry: [shutil.copy2(os.path.join(output_dir, name), entry)
+                                              for name in os.listdir(output_dir) if os.path.isfile(os.path.join(output_dir, name))])
+
+    def load_results(self, key):
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            return Results.load(os.path.join(path, RESULTS_ENTRY_FILENAME))
+        except FileNotFoundError:
+            # Evicted by another process while reading it
+            return None
+
+    def store_results(self, key, results):
+        self._store_entry(key, lambda entry: results.save(entry, "npz"))
+
+    def _store_entry(self, key, write):
+        """
+        Writes the entry in a temporary directory and moves it into place,
+        so concurrent readers never see incomplete entries
+
+        """
+        temporary_entry = tempfile.mkdtemp(dir=self.directory, prefix=".tmp-")
+        stored = False
+        try:
+            write(temporary_entry)
+            os.replace(temporary_entry, self.entry_path(key))
+            stored = True
+        except OSError:
+            # Another process stored the same entry first
+            pass
+        finally:
+            # Also removed if write fails, as entries() does not list it for evict
+            if not stored:
+                shutil.rmtree(temporary_entry, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        return [name for name in os.listdir(self.directory) if not name.startswith(".")]
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in max_size
+
+        """
+        entries = []
+        for name in self.entries():
+            path = self.entry_path(name)
+            try:
+                entries.append((os.path.getmtime(path), directory_size(path), path))
+            except OSError:
+                continue
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total_size -= size
+
+    def clear(self):
+        for name in self.entries():
+            shutil.rmtree(self.entry_path(name), ignore_errors=True)
+
+
+def result_cache(context):
+    """
+    The ResultCache configured in the settings, or None if the result_cache setting is off
+
+    """
+    if not context.get("result_cache"):
+        return None
+    return ResultCache(context.get("cache_dir", ""), context.get("cache_max_size", 1024))
+
+
+class WarmCache(ResultCache):
+    """
+    Cache of precomputed values in directory (by default, warm inside the default cache directory),
+    with a maximum total size of max_size megabytes.
+    Every entry holds the arrays of a value in a npz file.
+
+    """
+
+    def __init__(self, directory="", max_size=WARM_CACHE_MAX_SIZE):
+        super().__init__(directory or os.path.join(default_cache_dir(), "warm"), max_size)
+
+    @staticmethod
+    def key(kind, inputs):
+        data = json.dumps({"kind": kind, "format": WARM_CACHE_FORMAT, "version": starmatrix.__version__, "inputs": inputs},
+                          sort_keys=True, default=str)
+        return f"{kind}-{hashlib.sha256(data.encode('utf-8')).hexdigest()}"
+
+    def load_values(self, key):
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            with np.load(os.path.join(path, VALUES_ENTRY_FILENAME)) as npz_file:
+                return {name: npz_file[name] for name in npz_file.files}
+        except (OSError, ValueError):
+            return None
+
+    def store_values(self, key, values):
+        self._store_entry(key, lambda entry: np.savez(os.path.join(entry, VALUES_ENTRY_FILENAME), **values))
+
+
+_active_warm_cache = contextvars.ContextVar("active_warm_cache", default=None)
+
+
+def warm_cache(context):
+    """
+    The WarmCache configured in the settings (in cache_dir if set, limited to WARM_CACHE_MAX_SIZE
+    or cache_max_size if it is smaller), or None if the warm_cache setting is off
+
+    """
+    if not context.get("warm_cache"):
+        return None
+    cache_dir = context.get("cache_dir", "")
+    directory = os.path.join(cache_dir, WARM_CACHE_DIRNAME) if cache_dir else ""
+    return WarmCache(directory, min(context.get("cache_max_size", WARM_CACHE_MAX_SIZE), WARM_CACHE_MAX_SIZE))
+
+
+@contextlib.contextmanager
+def using_warm_cache(cache):
+    """
+    Makes the WarmCache the one used by warm_values inside the block (only in the current thread),
+    restoring the previous one when the block ends
+
+    """
+    token = _active_warm_cache.set(cache)
+    try:
+        yield cache
+    finally:
+        _active_warm_cache.reset(token)
+
+
+def active_warm_cache():
+    """
+    The WarmCache of the current using_warm_cache block, or None
+
+    """
+    return _active_warm_cache.get()
+
+
+def warm_values(kind, inputs, compute):
+    """
+    Dict of arrays returned by compute(), read from the active warm cache (if any) when it has an entry
+    for the kind of value and its inputs (any data serializable as JSON), or computed and stored otherwise.
+    Values read from the cache are numpy arrays (0-d for scalars).
+
+    """
+    cache = active_warm_cache()
+    if cache is None:
+        return compute()
+
+    key = cache.key(kind, inputs)
+    values = cache.load_values(key)
+    if values is None:
+        values = compute()
+        cache.store_values(key, values)
+    return values
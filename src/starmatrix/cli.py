@@ -1,12 +1,12 @@
 import argparse
 import os
 import shutil
-import yaml
 from os.path import dirname, join, exists
 
 import starmatrix
-import starmatrix.settings as settings
-import starmatrix.model as model
+
+# Modules loading NumPy, SciPy or yaml (cache, settings, model, readers, sweep) are imported
+# only by the commands using them, so `starmatrix --version` and `--generate-config` start fast
 
 
 def main():
@@ -18,9 +18,27 @@ def main():
     parser.add_argument("-v", "--version", action="version", version=starmatrix.__version__)
     parser.add_argument("--config", metavar="FILENAME", help="configuration file to use containing model initial params")
     parser.add_argument("--generate-config", action="store_true", help="create a config.yml example file")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="number of parallel processes writing the output. Overrides the workers setting")
+
+    subparsers = parser.add_subparsers(dest="command", metavar="command")
+    convert_parser = subparsers.add_parser("convert", help="convert text results in a directory tree to a binary format")
+    convert_parser.add_argument("path", help="directory containing results directories")
+    convert_parser.add_argument("--format", default="npz", choices=["npz", "npy-dir", "mmap"], help="binary format. Default: npz")
+    convert_parser.add_argument("-j", "--jobs", type=int, default=None, help="number of parallel processes. Default: number of CPUs")
+
+    sweep_parser = subparsers.add_parser("sweep", help="run a model for every combination of values of the settings in an axes file")
+    sweep_parser.add_argument("--config", metavar="FILENAME", help="base configuration file")
+    sweep_parser.add_argument("--axes", metavar="FILENAME", required=True, help="yaml file with a list of values for every setting to sweep")
+    sweep_parser.add_argument("-j", "--jobs", type=int, default=None, help="number of parallel processes. Default: number of CPUs")
 
     args = parser.parse_args()
 
+    if getattr(args, "command", None) == "convert":
+        return convert_results(args.path, args.format, args.jobs)
+
+    if getattr(args, "command", None) == "sweep":
+        return run_sweep(args.config, args.axes, args.jobs)
+
     if args.generate_config:
         return create_template_config_file()
 
@@ -28,6 +46,13 @@ def main():
     if args.config is not None:
         input_params = read_config_file(args.config)
 
+    if getattr(args, "jobs", None) is not None:
+        input_params["workers"] = args.jobs
+
+    import starmatrix.cache as cache
+    import starmatrix.model as model
+    import starmatrix.settings as settings
+
     context = settings.validate(input_params)
 
     print("Running model with settings:")
@@ -38,8 +63,51 @@ def main():
 
     create_output_directory(context['output_dir'])
 
-    model.Model(context).run()
-    print(f"Done. Output files ready in '{context['output_dir']}' directory.")
+    results_cache = cache.result_cache(context)
+    if results_cache is not None:
+        cache_key = cache.settings_key(context)
+        if results_cache.restore(cache_key, context['output_dir']):
+            print(f"Done. Output files restored from cache in '{context['output_dir']}' directory.")
+            return
+
+    if context["z_grid"]:
+        library = model.Model(context).run_metallicity_grid(context["z_grid"])
+        library.save(context['output_dir'])
+        message = f"Done. Library of {len(library)} metallicities ready in '{context['output_dir']}' directory."
+    else:
+        model.Model(context).run()
+        message = f"Done. Output files ready in '{context['output_dir']}' directory."
+
+    if results_cache is not None:
+        results_cache.store(cache_key, context['output_dir'])
+    print(message)
+
+
+def convert_results(path, output_format, jobs=None):
+    import starmatrix.readers as readers
+
+    converted = readers.convert_tree(path, output_format, workers=jobs)
+    for directory in converted:
+        print(f"Converted: {directory}")
+    print(f"Done. {len(converted)} results directories converted to {output_format}.")
+    return converted
+
+
+def run_sweep(config_filename, axes_filename, jobs=None):
+    import starmatrix.settings as settings
+    import starmatrix.sweep as sweep
+
+    base_params = {}
+    if config_filename is not None:
+        base_params = read_config_file(config_filename)
+    axes = read_config_file(axes_filename)
+    output_dir = base_params.get("output_dir", settings.default["output_dir"])
+
+    print(f"Running sweep over: {', '.join(axes.keys())}")
+    create_output_directory(output_dir)
+    configs, _ = sweep.run_sweep(base_params, axes, output_dir=output_dir, workers=jobs)
+    print(f"Done. Results of {len(configs)} runs ready in '{output_dir}' directory.")
+    return configs
 
 
 def create_output_directory(output_dir):
@@ -54,6 +122,8 @@ def create_template_config_file():
 
 
 def read_config_file(name):
+    import yaml
+
     with open(name, "r") as params_file:
         input_params = yaml.safe_load(params_file)
     return input_params
@@ -12,7 +12,9 @@ Contains some predefined DTDs from different papers/authors:
 """
 
 import math
-import scipy.integrate
+import numpy as np
+import scipy.special
+import starmatrix.cache as cache
 import starmatrix.constants as constants
 import starmatrix.functions as functions
 from functools import lru_cache
@@ -47,9 +49,56 @@ def dtd_capped_at_max_mass(dtd, z, max_mass=constants.B_MAX):
     bigger than the age of a star with mass max_mass (default: Binary max mass),
     or 0.0 otherwise.
 
+    """
+    return CappedDTD(dtd, z, max_mass)
+
+
+class CappedDTD:
+    """
+    A DTD that is zero for times smaller than the age of a star with mass max_mass.
+    Unlike a closure it can be pickled (if the DTD can) and sent to other processes.
+
+    """
+
+    def __init__(self, dtd, z, max_mass=constants.B_MAX):
+        self.dtd = dtd
+        self.z = z
+        self.max_mass = max_mass
+        self.min_age = functions.stellar_lifetime(max_mass, z)
+
+    def __call__(self, t):
+        t = np.asarray(t, dtype=float)
+        return np.where(t < self.min_age, 0.0, self.dtd(t))[()]
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.parameters() == other.parameters()
+
+    def __hash__(self):
+        return hash((type(self), self.parameters()))
+
+    def __reduce__(self):
+        return (type(self), self.parameters())
+
+    def parameters(self):
+        return (self.dtd, self.z, self.max_mass)
+
+
+@lru_cache(maxsize=64)
+def dtd_integration_table(dtd, z, max_mass=constants.B_MAX):
+    """
+    Cumulative integral of the passed DTD capped at max_mass (see dtd_capped_at_max_mass),
+    tabulated once in a log(t) grid from the age of a star with mass max_mass up to constants.TOTAL_TIME.
+    The integral of the capped DTD in any time interval is then a difference of two interpolated values:
+
+        dtd_integration_table(dtd, z, max_mass).integral(t_inf, t_sup)
+
+    Tables are cached per (dtd, z, max_mass).
+
     """
     min_age = functions.stellar_lifetime(max_mass, z)
-    return lambda t: 0.0 if t < min_age else dtd(t)
+    edges = functions.integration_grid(min_age, max(constants.TOTAL_TIME, min_age * 1.01), dtd_breakpoints.get(dtd, []))
+
+    return functions.IntegrationTable(edges, dtd)
 
 
 def dtd_correction(params):
@@ -64,30 +113,34 @@ def dtd_correction(params):
     return 1.0
 
 
+def log_times(t):
+    """
+    Times (in Gyrs) as an array and log10 of the times in years (0 for non positive times)
+
+    """
+    t = np.asarray(t, dtype=float)
+    return t, np.log10(np.where(t > 0, t, 1e-9)) + 9
+
+
 def dtd_ruiz_lapuente(t):
     """
     Delay Time Distribution (DTD) from Ruiz Lapuente & Canal (2000)
 
     """
-    if t <= 0:
-        return 0.0
+    t, logt = log_times(t)
 
-    logt = math.log10(t) + 9
-    if logt < 7.8:
-        return 0.0
-
-    f1 = 0.170e-11 * math.exp(-0.5 * ((logt - 7.744) / 0.08198) ** 2)
-    f2 = 0.338e-11 * math.exp(-0.5 * ((logt - 7.9867) / 0.12489) ** 2)
-    f3 = 0.115e-11 * math.exp(-0.5 * ((logt - 8.3477) / 0.14675) ** 2)
-    f4 = 0.160e-11 * math.exp(-0.5 * ((logt - 9.08) / 0.23) ** 2)
-    f5 = 0.020e-11 * math.exp(-0.5 * ((logt - 9.58) / 0.17) ** 2)
+    f1 = 0.170e-11 * np.exp(-0.5 * ((logt - 7.744) / 0.08198) ** 2)
+    f2 = 0.338e-11 * np.exp(-0.5 * ((logt - 7.9867) / 0.12489) ** 2)
+    f3 = 0.115e-11 * np.exp(-0.5 * ((logt - 8.3477) / 0.14675) ** 2)
+    f4 = 0.160e-11 * np.exp(-0.5 * ((logt - 9.08) / 0.23) ** 2)
+    f5 = 0.020e-11 * np.exp(-0.5 * ((logt - 9.58) / 0.17) ** 2)
 
     dtd = (f1 + f2 + f3 + f4 + f5) * 1e9
 
     # Normalization using 1.03e-3 SN/M* as Hubble-time-integrated production efficiency SN/Mo
     rate = 0.2440759  # [SN / Yr / M*]
 
-    return rate * dtd
+    return np.where((t > 0) & (logt >= 7.8), rate * dtd, 0.0)[()]
 
 
 def dtd_maoz_graur(t):
@@ -95,15 +148,13 @@ def dtd_maoz_graur(t):
     Delay Time Distribution (DTD) from Maoz & Graur (2017)
 
     """
-    if t <= 0.05:
-        return 0.0
-
-    dtd = math.pow(t, -1.1)
+    t = np.asarray(t, dtype=float)
+    dtd = np.power(np.where(t > 0.05, t, 1.0), -1.1)
 
     # Normalization using 1.03e-3 SN/M* as Hubble-time-integrated production efficiency SN/Mo
     rate = 1.793e-4  # [SN / Yr / M*]
 
-    return rate * dtd
+    return np.where(t > 0.05, rate * dtd, 0.0)[()]
 
 
 def dtd_castrillo(t):
@@ -111,15 +162,13 @@ def dtd_castrillo(t):
     Delay Time Distribution (DTD) from Castrillo et al (2021)
 
     """
-    if t <= 0.04:
-        return 0.0
-
-    dtd = math.pow(t, -1.2)
+    t = np.asarray(t, dtype=float)
+    dtd = np.power(np.where(t > 0.04, t, 1.0), -1.2)
 
     # Normalization using 1.03e-3 SN/M* as Hubble-time-integrated production efficiency SN/Mo
     rate = 1.5879e-4  # [SN / Yr / M*]
 
-    return rate * dtd
+    return np.where(t > 0.04, rate * dtd, 0.0)[()]
 
 
 def dtd_greggio(t):
@@ -127,74 +176,65 @@ def dtd_greggio(t):
     Delay Time Distribution (DTD) from Laura Greggio, A&A 441, 1055–1078 (2005)
 
     """
-    if t <= 0:
-        return 0.0
+    t, logt = log_times(t)
 
-    logt = math.log10(t) + 9
-    if logt < 7.45:
-        dtd = 0
-    elif 7.45 <= logt <= 7.735:
-        dtd = (0.00215/(7.776-7.516)) * (logt-7.50)
-    elif 7.735 < logt <= 8.55:
-        dtd = 0.003335 * math.exp(((-0.5 * (logt-8.22))/0.47) ** 2)
-    elif 8.55 < logt <= 8.61:
-        dtd = 0.002618 - ((0.002618-0.001129)/(8.6398-8.55)) * (logt-8.55)
-    elif 8.61 < logt:
-        dtd = math.pow(10, ((-1.0615 * logt) + 6))
+    with np.errstate(over="ignore"):
+        dtd = np.select(
+            [logt < 7.45, logt <= 7.735, logt <= 8.55, logt <= 8.61],
+            [0.0,
+             (0.00215/(7.776-7.516)) * (logt-7.50),
+             0.003335 * np.exp(((-0.5 * (logt-8.22))/0.47) ** 2),
+             0.002618 - ((0.002618-0.001129)/(8.6398-8.55)) * (logt-8.55)],
+            np.power(10, ((-1.0615 * logt) + 6)))
 
     # Normalization
-    return dtd * 0.524563739
+    return np.where(t > 0, dtd * 0.524563739, 0.0)[()]
 
 
-def dtd_close_dd_04(t):
+def greggio_dtd(t, limits, log_dtds, normalization):
     """
-    Delay Time Distribution (DTD) from Laura Greggio, A&A 441, 1055–1078 (2005)
-    Model Close Double Degenerate 0.4 Gyrs
+    DTD from the pieces of its log10 (in the intervals between limits of log(t) in years),
+    with log_dtd = -20 for times before the first limit.
+    log_dtds are the functions of log(t) for every interval, the last one for times after the last limit.
 
     """
-    if t <= 0:
-        return 0.0
-
-    logt = math.log10(t) + 9
-    if logt < 7.657:
-        log_dtd = -20
-    elif 7.657 <= logt < 8.6:
-        log_dtd = -0.8373*(logt**2) + 13.217*logt - 51.878
-    elif 8.6 <= logt:
-        log_dtd = 10.914 - 1.2964*logt
+    t, logt = log_times(t)
 
-    dtd = math.pow(10, log_dtd)
+    # Every piece is evaluated for all the times, so values out of its interval may overflow
+    with np.errstate(over="ignore", invalid="ignore"):
+        log_dtd = np.select([logt < limits[0]] + [logt < limit for limit in limits[1:]],
+                            [-20.0] + [log_dtd(logt) for log_dtd in log_dtds[:-1]],
+                            log_dtds[-1](logt))
+        dtd = np.power(10, log_dtd)
 
     # Normalization using 1.03e-3 SN/M* as Hubble-time-integrated production efficiency SN/Mo
-    return dtd * 1.059e-3
+    return np.where(t > 0, dtd * normalization, 0.0)[()]
 
 
-def dtd_close_dd_1(t):
+def dtd_close_dd_04(t):
     """
     Delay Time Distribution (DTD) from Laura Greggio, A&A 441, 1055–1078 (2005)
-    Model Close Double Degenerate 1 Gyr
+    Model Close Double Degenerate 0.4 Gyrs
 
     """
-    if t <= 0:
-        return 0.0
-
-    logt = math.log10(t) + 9
+    return greggio_dtd(t, [7.657, 8.6], [
+        lambda logt: -0.8373*(logt**2) + 13.217*logt - 51.878,
+        lambda logt: 10.914 - 1.2964*logt,
+    ], 1.059e-3)
 
-    if logt < 6.32:
-        log_dtd = -20
-    elif 6.32 <= logt < 7.9:
-        log_dtd = 4.68e-3 + 4.86e-2*(logt-6.32)
-    elif 7.9 <= logt < 8.987:
-        log_dtd = 4.117 - 0.5092*logt
-    elif 8.987 <= logt < 9.16:
-        log_dtd = -97.15408482273*(logt**3) + 2653.445666247*(logt**2) - 24157.97809549*logt + 73317.50108578
-    elif 9.16 <= logt:
-        log_dtd = 8.8761 - 1.0656*logt
 
-    dtd = math.pow(10, log_dtd)
+def dtd_close_dd_1(t):
+    """
+    Delay Time Distribution (DTD) from Laura Greggio, A&A 441, 1055–1078 (2005)
+    Model Close Double Degenerate 1 Gyr
 
-    # Normalization using 1.03e-3 SN/M* as Hubble-time-integrated production efficiency SN/Mo
-    return dtd * 9.8400244741154628e-4
+    """
+    return greggio_dtd(t, [6.32, 7.9, 8.987, 9.16], [
+        lambda logt: 4.68e-3 + 4.86e-2*(logt-6.32),
+        lambda logt: 4.117 - 0.5092*logt,
+        lambda logt: -97.15408482273*(logt**3) + 2653.445666247*(logt**2) - 24157.97809549*logt + 73317.50108578,
+        lambda logt: 8.8761 - 1.0656*logt,
+    ], 9.8400244741154628e-4)
 
 
 def dtd_wide_dd_04(t):
@@ -203,21 +243,10 @@ def dtd_wide_dd_04(t):
     Model Wide Double Degenerate 0.4 Gyrs
 
     """
-    if t <= 0:
-        return 0.0
-
-    logt = math.log10(t) + 9
-    if logt < 7.5:
-        log_dtd = -20
-    elif 7.5 <= logt < 8.746:
-        log_dtd = -1.194384*(logt**4) + 37.542520*(logt**3) - 442.490023*(logt**2) + 2318.164371*logt - 4555.628418
-    elif 8.746 <= logt:
-        log_dtd = -0.81857*logt + 6.60771
-
-    dtd = math.pow(10, log_dtd)
-
-    # Normalization using 1.03e-3 SN/M* as Hubble-time-integrated production efficiency SN/Mo
-    return dtd * 9.92573144e-4
+    return greggio_dtd(t, [7.5, 8.746], [
+        lambda logt: -1.194384*(logt**4) + 37.542520*(logt**3) - 442.490023*(logt**2) + 2318.164371*logt - 4555.628418,
+        lambda logt: -0.81857*logt + 6.60771,
+    ], 9.92573144e-4)
 
 
 def dtd_wide_dd_1(t):
@@ -226,21 +255,10 @@ def dtd_wide_dd_1(t):
     Model Wide Double Degenerate 1 Gyr
 
     """
-    if t <= 0:
-        return 0.0
-
-    logt = math.log10(t) + 9
-    if logt < 7.69:
-        log_dtd = -20
-    elif 7.69 <= logt < 8.99:
-        log_dtd = 0.130499*(logt**4) - 4.295277*(logt**3) + 52.687732*(logt**2) - 285.362875*logt + 575.188754
-    elif 8.99 <= logt:
-        log_dtd = 1.061260*(logt**4) - 41.103454*(logt**3) + 596.908266*(logt**2) - 3852.941647*logt + 9327.789697
-
-    dtd = math.pow(10, log_dtd)
-
-    # Normalization using 1.03e-3 SN/M* as Hubble-time-integrated production efficiency SN/Mo
-    return dtd * 1.1169615977359982e-3
+    return greggio_dtd(t, [7.69, 8.99], [
+        lambda logt: 0.130499*(logt**4) - 4.295277*(logt**3) + 52.687732*(logt**2) - 285.362875*logt + 575.188754,
+        lambda logt: 1.061260*(logt**4) - 41.103454*(logt**3) + 596.908266*(logt**2) - 3852.941647*logt + 9327.789697,
+    ], 1.1169615977359982e-3)
 
 
 def dtd_sd_chandra(t):
@@ -249,24 +267,11 @@ def dtd_sd_chandra(t):
     Model Single Degenerate Chandra Mass
 
     """
-    if t <= 0:
-        return 0.0
-
-    logt = math.log10(t) + 9
-
-    if logt < 7.89:
-        log_dtd = -20
-    elif 7.89 <= logt < 9.1:
-        log_dtd = -0.0869*(logt**3) + 1.9168*(logt**2) - 14.187*logt + 35.319
-    elif 9.1 <= logt < 9.89:
-        log_dtd = -1.7291*logt + 15.144
-    elif 9.89 <= logt:
-        log_dtd = -5.1962*logt + 49.362
-
-    dtd = math.pow(10, log_dtd)
-
-    # Normalization using 1.03e-3 SN/M* as Hubble-time-integrated production efficiency SN/Mo
-    return dtd * 1.064741165931863e-3
+    return greggio_dtd(t, [7.89, 9.1, 9.89], [
+        lambda logt: -0.0869*(logt**3) + 1.9168*(logt**2) - 14.187*logt + 35.319,
+        lambda logt: -1.7291*logt + 15.144,
+        lambda logt: -5.1962*logt + 49.362,
+    ], 1.064741165931863e-3)
 
 
 def dtd_sd_subchandra(t):
@@ -275,21 +280,10 @@ def dtd_sd_subchandra(t):
     Model Single Degenerate Sub-Chandra Mass
 
     """
-    if t <= 0:
-        return 0.0
-
-    logt = math.log10(t) + 9
-    if logt < 7.60:
-        log_dtd = -20
-    elif 7.60 <= logt < 8.58:
-        log_dtd = 0.2564*(logt**3) - 6.8315*(logt**2) + 59.975*logt - 173.57
-    elif 8.58 <= logt:
-        log_dtd = -1.733*logt + 14.852
-
-    dtd = math.pow(10, log_dtd)
-
-    # Normalization using 1.03e-3 SN/M* as Hubble-time-integrated production efficiency SN/Mo
-    return dtd * 1.0354065248871394e-3
+    return greggio_dtd(t, [7.60, 8.58], [
+        lambda logt: 0.2564*(logt**3) - 6.8315*(logt**2) + 59.975*logt - 173.57,
+        lambda logt: -1.733*logt + 14.852,
+    ], 1.0354065248871394e-3)
 
 
 def dtd_chen(t):
@@ -297,15 +291,29 @@ def dtd_chen(t):
     Delay Time Distribution (DTD) from Chen, Hu and Wang, 2021, ApJ
 
     """
-    if t <= 0.12:
-        return 0.0
-
-    dtd = math.pow(t, -1.41)
+    t = np.asarray(t, dtype=float)
+    dtd = np.power(np.where(t > 0.12, t, 1.0), -1.41)
 
     # Normalization using 1.03e-3 SN/M* as Hubble-time-integrated production efficiency SN/Mo
     rate = 2.069e-4  # [SN / Yr / M*]
 
-    return rate * dtd
+    return np.where(t > 0.12, rate * dtd, 0.0)[()]
+
+
+# Times (in Gyrs) where the DTDs change their expression
+dtd_breakpoints = {
+    dtd_ruiz_lapuente: [10 ** (7.8 - 9)],
+    dtd_maoz_graur: [0.05],
+    dtd_castrillo: [0.04],
+    dtd_greggio: [10 ** (logt - 9) for logt in [7.45, 7.735, 8.55, 8.61]],
+    dtd_close_dd_04: [10 ** (logt - 9) for logt in [7.657, 8.6]],
+    dtd_close_dd_1: [10 ** (logt - 9) for logt in [6.32, 7.9, 8.987, 9.16]],
+    dtd_wide_dd_04: [10 ** (logt - 9) for logt in [7.5, 8.746]],
+    dtd_wide_dd_1: [10 ** (logt - 9) for logt in [7.69, 8.99]],
+    dtd_sd_chandra: [10 ** (logt - 9) for logt in [7.89, 9.1, 9.89]],
+    dtd_sd_subchandra: [10 ** (logt - 9) for logt in [7.60, 8.58]],
+    dtd_chen: [0.12],
+}
 
 
 class Strolger:
@@ -314,50 +322,82 @@ class Strolger:
         self.omega = omega
         self.alpha = alpha
 
+    def __eq__(self, other):
+        return type(self) is type(other) and self.parameters() == other.parameters()
+
+    def __hash__(self):
+        return hash((type(self), self.parameters()))
+
+    def __reduce__(self):
+        return (type(self), self.parameters())
+
+    def __call__(self, t):
+        return self.at_time(t)
+
+    def parameters(self):
+        return (self.psi, self.omega, self.alpha)
+
     def description(self):
         return ("Delay Time Distributions (DTDs) from Strolger et al, "
                 "The Astrophysical Journal, 2020, 890, 2. "
                 "DOI: 10.3847/1538-4357/ab6a97")
 
     def phi(self, t_gyrs):
-        t_myrs = t_gyrs * 1e3
+        """
+        Phi function from Strolger et al, for a time or an array of times (in Gyrs).
+        The integral of the gaussian kernel in the second term is computed analytically:
+
+            integral(exp(-t'^2 / 2), -inf, t_up) = sqrt(pi / 2) * erfc(-t_up / sqrt(2))
+
+        """
+        t_myrs = np.asarray(t_gyrs, dtype=float) * 1e3
 
         u = t_myrs - self.psi
-        term_1 = (1/(self.omega * math.pi)) * math.exp((-(u**2))/(2*(self.omega**2)))
+        term_1 = (1/(self.omega * math.pi)) * np.exp((-(u**2))/(2*(self.omega**2)))
 
-        t_low = -math.inf
         t_up = self.alpha*(u/self.omega)
-
-        if 12 < t_up:
-            term_2 = 2 * scipy.integrate.quad(self.term_2_f, t_low, 0)[0]
-        else:
-            term_2 = scipy.integrate.quad(self.term_2_f, t_low, t_up)[0]
+        term_2 = math.sqrt(math.pi / 2) * scipy.special.erfc(-t_up / math.sqrt(2))
 
         return term_1 * term_2
 
-    def term_2_f(self, t_prime):
-        return math.exp(-math.pow(t_prime, 2)/2)
-
-    @lru_cache(maxsize=128)
     def normalization_rate(self):
-        return self.efficiency() / self.phi_integrated()
+        return strolger_normalization_rate(self)
 
     def efficiency(self):
         # SN/M* as Hubble-time-integrated production efficiency SN/Mo
         return 1.03e-3
 
     def phi_integrated(self):
-        return scipy.integrate.quad(self.phi, 0, constants.TOTAL_TIME)[0]
+        """
+        Integral of phi in [0, constants.TOTAL_TIME], computed with a single vectorized
+        evaluation of phi in all the nodes of a grid of 1 Myr cells.
+
+        """
+        edges = np.linspace(0, constants.TOTAL_TIME, round(constants.TOTAL_TIME * 1e3) + 1)
+        return float(functions.IntegrationTable(edges, self.phi).integral(0, constants.TOTAL_TIME))
 
     def at_time(self, t):
         return self.normalization_rate() * self.phi(t)
 
 
+@lru_cache(maxsize=128)
+def strolger_normalization_rate(strolger):
+    """
+    Normalization rate of a Strolger DTD, cached per set of parameters
+    (and in the warm cache when it is enabled)
+
+    """
+    values = cache.warm_values("strolger", strolger.parameters(),
+                               lambda: {"normalization_rate": strolger.efficiency() / strolger.phi_integrated()})
+    return float(values["normalization_rate"])
+
+
+# Strolger instances are callable DTDs (see Strolger.at_time)
 dtds_strolger = {
-    "fit_1": Strolger(10, 600, 220).at_time,
-    "fit_2": Strolger(110, 1000, 2).at_time,
-    "fit_3": Strolger(350, 1200, 20).at_time,
-    "fit_4": Strolger(6000, 6000, -2).at_time,
-    "fit_5": Strolger(-650, 2200, 1100).at_time,
-    "optimized": Strolger(-1518, 51, 50).at_time,
+    "fit_1": Strolger(10, 600, 220),
+    "fit_2": Strolger(110, 1000, 2),
+    "fit_3": Strolger(350, 1200, 20),
+    "fit_4": Strolger(6000, 6000, -2),
+    "fit_5": Strolger(-650, 2200, 1100),
+    "optimized": Strolger(-1518, 51, 50),
 }
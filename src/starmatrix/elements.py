@@ -1,4 +1,36 @@
+import os
 from bisect import bisect
+from functools import lru_cache
+import numpy as np
+import starmatrix.cache as cache
+
+
+def load_expelled(expelled_elements_filename):
+    """
+    Expelled data read from a file, parsed only once per process while the file is not modified
+    (or read from the warm cache when it is enabled).
+    The returned instance is shared, so it should not be modified.
+
+    """
+    return cached_expelled(expelled_elements_filename, os.path.getmtime(expelled_elements_filename))
+
+
+@lru_cache(maxsize=32)
+def cached_expelled(expelled_elements_filename, modification_time):
+    if cache.active_warm_cache() is None:
+        return Expelled(expelled_elements_filename)
+
+    def compute():
+        expelled = Expelled(expelled_elements_filename)
+        return {"masses": expelled.masses, "yields": expelled.yields}
+
+    values = cache.warm_values("expelled", cache.file_hash(expelled_elements_filename), compute)
+    return Expelled.from_arrays(values["masses"], values["yields"], expelled_elements_filename)
+
+
+def cri_lim_filename(expelled_elements_filename):
+    upcased_filename = expelled_elements_filename.upper()
+    return "CRI-LIM" in upcased_filename or "CRI_LIM" in upcased_filename
 
 
 class Expelled:
@@ -6,18 +38,36 @@ class Expelled:
     elements_list = ["H", "D", "He3", "He4", "C12", "C13",
                      "N14p", "n.r.", "O16", "Ne", "Mg", "Si",
                      "S", "Ca", "Fe", "remnants", "C13s", "N14s"]
-    mass_points = []
-    by_mass = {}
-    cri_lim_yields = False
 
     def __init__(self, expelled_elements_filename="expelled_elements"):
         self.mass_points = []
         self.by_mass = {}
+        self.masses = np.zeros(0)
+        self.yields = np.zeros((0, len(self.elements_list)))
         self.read_expelled_elements_file(expelled_elements_filename)
+        self.cri_lim_yields = cri_lim_filename(expelled_elements_filename)
 
-        upcased_filename = expelled_elements_filename.upper()
-        if "CRI-LIM" in upcased_filename or "CRI_LIM" in upcased_filename:
-            self.cri_lim_yields = True
+    @classmethod
+    def from_arrays(cls, masses, yields, expelled_elements_filename="expelled_elements"):
+        """
+        Expelled data from already parsed arrays of masses and yields (one row per mass) of a file
+
+        """
+        expelled = cls.__new__(cls)
+        expelled.__setstate__({"masses": masses, "yields": yields, "cri_lim_yields": cri_lim_filename(expelled_elements_filename)})
+        return expelled
+
+    def __getstate__(self):
+        """
+        Only the data arrays are pickled: mass_points and by_mass are rebuilt from them
+
+        """
+        return {"masses": self.masses, "yields": self.yields, "cri_lim_yields": self.cri_lim_yields}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.mass_points = self.masses.tolist()
+        self.by_mass = {mass: dict(zip(self.elements_list, data_row)) for mass, data_row in zip(self.mass_points, self.yields.tolist())}
 
     def read_expelled_elements_file(self, filename):
         """
@@ -31,23 +81,64 @@ class Expelled:
                  "N14primary", "n.r.", "O16", "Ne", "Mg", "Si",
                  "S", "Ca", "Fe", "remnants", "C13secondary", "N14secondary"]
 
+        Data is stored as a (n_masses, n_elements) array in self.yields,
+        with the corresponding masses in self.masses.
+
         """
 
         expelled_data = open(filename, "r")
 
+        rows = []
         for line in expelled_data:
             data_row = [max(0.0, float(data)) for data in line.split()]
             if data_row:
-                mass = data_row.pop(0)  # the first column is the mass
-                self.mass_points.append(mass)
-                self.by_mass[mass] = dict(zip(self.elements_list, data_row))
+                rows.append(data_row)
 
         expelled_data.close()
 
+        if rows:
+            table = np.array(rows, dtype=float)
+            self.masses = np.ascontiguousarray(table[:, 0])
+            self.yields = np.ascontiguousarray(table[:, 1:])
+            self.mass_points = self.masses.tolist()
+            self.by_mass = {mass: dict(zip(self.elements_list, data_row[1:])) for mass, data_row in zip(self.mass_points, rows)}
+
+    def corrections_vector(self, yield_corrections={}):
+        """
+        Column-scale vector with the correction factor for every element in elements_list
+
+        """
+        return np.array([yield_corrections.get(element, 1.0) for element in self.elements_list], dtype=float)
+
+    def for_masses(self, masses, yield_corrections={}):
+        """
+        Interpolates expelled mass (per solar mass) for all elements for an array of
+        stellar masses, using the data from the class' expelled_elements input file.
+        Returns an array of shape (len(masses), len(elements_list)).
+
+        """
+        masses = np.asarray(masses, dtype=float)
+
+        index = np.searchsorted(self.masses, masses, side="right")
+        index[index == len(self.masses)] -= 1
+
+        mass_prev = self.masses[index - 1]
+        mass_next = self.masses[index]
+        elements_prev = self.yields[index - 1]
+        elements_next = self.yields[index]
+        p = ((mass_next - masses) / (mass_next - mass_prev))[:, np.newaxis]
+
+        interpolations = (elements_next - (p * (elements_next - elements_prev))) / masses[:, np.newaxis]
+        if yield_corrections:
+            interpolations *= self.corrections_vector(yield_corrections)
+
+        return interpolations
+
     def for_mass(self, m, yield_corrections={}):
         """
         Interpolates expelled mass (per solar mass) for all elements for a given
         stellar mass, using the data from the class' expelled_elements input file.
+        Returns a dict view of the same interpolation computed by for_masses.
 
         """
 
@@ -57,15 +148,15 @@ class Expelled:
 
         mass_prev = self.mass_points[index - 1]
         mass_next = self.mass_points[index]
-        elements_prev = self.by_mass[mass_prev]
-        elements_next = self.by_mass[mass_next]
-        interpolations = {"mass": m}
+        elements_prev = self.yields[index - 1]
+        elements_next = self.yields[index]
         p = (mass_next - m) / (mass_next - mass_prev)
 
-        for element in self.elements_list:
-            d = elements_next[element] - elements_prev[element]
-            interpolations[element] = (elements_next[element] - (p * d)) / m
-            if element in yield_corrections:
-                interpolations[element] = interpolations[element] * yield_corrections[element]
+        values = (elements_next - (p * (elements_next - elements_prev))) / m
+        if yield_corrections:
+            values *= self.corrections_vector(yield_corrections)
+
+        interpolations = {"mass": m}
+        interpolations.update(zip(self.elements_list, values.tolist()))
 
         return interpolations
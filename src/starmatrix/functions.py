@@ -1,7 +1,20 @@
-import math
+import numpy as np
+from functools import lru_cache
 
 import starmatrix.constants as constants
 
+NEWTON_COTES_POINTS = 7
+NEWTON_COTES_COEFFICIENTS = [0.29285714, 1.54285714, 0.19285714, 1.94285714, 0.19285714, 1.54285714, 0.29285714]
+
+GAUSS_LEGENDRE_POINTS = 5
+CELLS_PER_DEX = 100
+
+# Gauss-Legendre points used to integrate over the binary mass in the binary IMF tables
+BINARY_IMF_POINTS = 16
+
+# Masses where global_imf and imf_supernovae_II change their expression (1.0 is a break of several IMFs)
+IMF_MASS_BREAKPOINTS = [1.0, 1.5, constants.B_MIN, constants.M_SNII, constants.B_MAX]
+
 
 def value_in_interval(value, interval=[]):
     return min(max(interval[0], value), interval[1])
@@ -23,9 +36,10 @@ def tau_polinomyal_coefficients(z):
     """
     Coefficients (z-dependent) for the log(tau) formula from
     Raiteri C.M., Villata M. & Navarro J.F., 1996, A&A 315, 105-115
+    z can be a number or an array of metallicities
 
     """
-    log_z = math.log10(z)
+    log_z = np.log10(z)
     log_z_2 = log_z ** 2
 
     a0 = 10.13 + 0.07547 * log_z - 0.008084 * log_z_2
@@ -39,14 +53,15 @@ def stellar_lifetime(stellar_m, z):
     """
     Empirical formula for stellar lifetimes from
     Raiteri C.M., Villata M. & Navarro J.F., 1996, A&A 315, 105-115
+    stellar_m and z can be numbers or arrays (broadcast together)
 
     """
-    log_m = math.log10(stellar_m)
+    log_m = np.log10(stellar_m)
     a0, a1, a2 = tau_polinomyal_coefficients(z)
 
     log_tau = a0 + a1 * log_m + a2 * (log_m ** 2)
 
-    return math.pow(10, log_tau - 9)
+    return np.power(10, log_tau - 9)[()]
 
 
 def stellar_mass(tau, z):
@@ -56,26 +71,26 @@ def stellar_mass(tau, z):
     solving the equation for the log(M).
     This function returns always the smaller root, as that is the
     good fit for masses up to the max_mass_allowed(z)
+    tau and z can be numbers or arrays (broadcast together)
 
     """
-    log_tau = math.log10(tau * 1e9)  # years to Gyrs
+    log_tau = np.log10(np.asarray(tau, dtype=float) * 1e9)  # years to Gyrs
     a0, a1, a2 = tau_polinomyal_coefficients(z)
-    square = math.sqrt((a1 ** 2) - (4 * a2 * (a0 - log_tau)))
+    square = np.sqrt((a1 ** 2) - (4 * a2 * (a0 - log_tau)))
     log_mass_minus = (-a1 - square) / (2 * a2)
 
-    return round(math.pow(10, log_mass_minus), 10)
+    return np.round(np.power(10, log_mass_minus), 10)[()]
 
 
 def max_mass_allowed(z):
     """
     The formula for stellar lifetimes from Raiteri et al is a good fit up until
     a (dependent on z) critical mass. After it tau increases and we consider it non valid.
+    z can be a number or an array of metallicities
 
     """
-    log_z = math.log10(z)
-    log_z_2 = log_z ** 2
-    _, a1, a2 = tau_polinomyal_coefficients(z)
-    return float(math.floor((math.pow(10, -a1/(2 * a2)))))
+    _, a1, a2 = tau_polinomyal_coefficients(np.asarray(z, dtype=float))
+    return np.floor(np.power(10, -a1/(2 * a2)))[()]
 
 
 def total_energy_ejected(t):
@@ -83,17 +98,16 @@ def total_energy_ejected(t):
     Thermal and kinetic energy released by each type of SN up to the time t after the explosion
     where tc is the characteristic cooling time of the shell surrounding the remnant (53000 yrs)
     from Ferrini & Poggiantti, 1993, ApJ, 410, 44F
+    t can be a number or an array of times
 
     """
-    if t <= 0:
-        return 0.0
-
+    t = np.asarray(t, dtype=float)
     tc = 5.3e-5
-    if t > tc:
-        rt = (tc / t) ** 0.4
-        return 1 - 0.44 * (rt ** 2) * (1 - 0.41 * rt) - 0.22 * (rt ** 2)
-    else:
-        return 9811.32 * t
+
+    rt = (tc / np.maximum(t, tc)) ** 0.4
+    energy = np.where(t > tc, 1 - 0.44 * (rt ** 2) * (1 - 0.41 * rt) - 0.22 * (rt ** 2), 9811.32 * t)
+
+    return np.where(t <= 0, 0.0, energy)[()]
 
 
 def newton_cotes(a, b, f):
@@ -101,9 +115,6 @@ def newton_cotes(a, b, f):
     Integration using Newton-Cotes formula with degree 6 (7 points)
 
     """
-    NEWTON_COTES_POINTS = 7
-    NEWTON_COTES_COEFFICIENTS = [0.29285714, 1.54285714, 0.19285714, 1.94285714, 0.19285714, 1.54285714, 0.29285714]
-
     h = (b - a) / (NEWTON_COTES_POINTS - 1)
     sum_fs = 0.0
     for i in range(0, NEWTON_COTES_POINTS):
@@ -112,6 +123,107 @@ def newton_cotes(a, b, f):
     return h * sum_fs
 
 
+def integration_grid(lower, upper, breakpoints=[], cells_per_dex=CELLS_PER_DEX):
+    """
+    Edges of a grid of cells covering [lower, upper] (both > 0), evenly spaced in log scale
+    with at least cells_per_dex cells per decade. Every breakpoint inside the interval
+    is an edge of the grid, so functions with discontinuities there are smooth in every cell.
+
+    """
+    points = np.unique([lower, upper] + [point for point in breakpoints if lower < point < upper])
+    left, right = points[:-1], points[1:]
+    cells = np.maximum(1, np.ceil(np.log10(right / left) * cells_per_dex)).astype(int)
+
+    # Every interval between points split in log scale (as np.geomspace would), built for all of them at once
+    interval = np.repeat(np.arange(len(cells)), cells)
+    cell = np.arange(len(interval)) - np.repeat(np.cumsum(cells) - cells, cells) + 1
+    log_left = np.log10(left)
+    log_steps = (np.log10(right) - log_left) / cells
+    edges = 10.0 ** (cell * log_steps[interval] + log_left[interval])
+    edges[np.cumsum(cells) - 1] = right
+
+    return np.concatenate([points[:1], edges])
+
+
+class IntegrationTable:
+    """
+    Cumulative integral of a function f over a grid of cells.
+
+    f is evaluated once, at the Gauss-Legendre nodes of every cell of the grid.
+    Inside each cell f is represented by its interpolating polynomial through those nodes,
+    so the cumulative integral is known at any point and the integral in any interval [a, b]
+    is a difference of two interpolated cumulative values.
+    The integral of a whole cell is the Gauss-Legendre quadrature of degree 2 * GAUSS_LEGENDRE_POINTS - 1.
+
+    f receives an array of points and must return an array with one item (scalar or array) per point.
+    Outside the grid f is considered to be zero.
+
+    """
+
+    def __init__(self, edges, f, points=GAUSS_LEGENDRE_POINTS):
+        self.edges = np.asarray(edges, dtype=float)
+        self.widths = np.diff(self.edges)
+
+        legendre_nodes, legendre_weights = np.polynomial.legendre.leggauss(points)
+        self.unit_nodes = (legendre_nodes + 1) / 2
+        self.unit_weights = legendre_weights / 2
+
+        # Coefficients of the Lagrange polynomials for the unit nodes: l_j(s) = sum_k basis[k, j] * s^k
+        self.basis = np.linalg.inv(np.vander(self.unit_nodes, increasing=True))
+
+        nodes = self.edges[:-1, np.newaxis] + (self.widths[:, np.newaxis] * self.unit_nodes)
+        values = np.asarray(f(nodes.ravel()), dtype=float)
+        self.values = values.reshape(nodes.shape + values.shape[1:])
+
+        cells_integrals = self.widths.reshape((-1,) + (1,) * (self.values.ndim - 2)) * \
+            np.tensordot(self.unit_weights, self.values, axes=([0], [1]))
+        self.cumulative_values = np.concatenate([np.zeros((1,) + cells_integrals.shape[1:]), np.cumsum(cells_integrals, axis=0)])
+
+    def cumulative(self, x):
+        """
+        Integral of f from the lower edge of the grid up to x
+
+        """
+        x = np.clip(np.asarray(x, dtype=float), self.edges[0], self.edges[-1])
+        cell = np.clip(np.searchsorted(self.edges, x, side="right") - 1, 0, len(self.widths) - 1)
+        s = (x - self.edges[cell]) / self.widths[cell]
+
+        # Integrals from 0 to s of the Lagrange polynomials of the cell nodes
+        powers = np.arange(1, len(self.unit_nodes) + 1)
+        partial_weights = ((s[..., np.newaxis] ** powers) / powers) @ self.basis
+
+        value_dims = (1,) * (self.values.ndim - 2)
+        partial_integral = np.sum(partial_weights.reshape(partial_weights.shape + value_dims) * self.values[cell], axis=x.ndim)
+        width = self.widths[cell].reshape(x.shape + value_dims)
+
+        return self.cumulative_values[cell] + width * partial_integral
+
+    def integral(self, a, b):
+        """
+        Integral of f in the intervals [a, b] (arrays)
+
+        """
+        return self.cumulative(b) - self.cumulative(a)
+
+    def interpolate(self, x):
+        """
+        Value of f at x, from the interpolating polynomial of the cell containing x.
+        Zero outside the grid.
+
+        """
+        x = np.asarray(x, dtype=float)
+        inside = (self.edges[0] <= x) & (x <= self.edges[-1])
+        cell = np.clip(np.searchsorted(self.edges, x, side="right") - 1, 0, len(self.widths) - 1)
+        s = np.clip((x - self.edges[cell]) / self.widths[cell], 0, 1)
+
+        weights = (s[..., np.newaxis] ** np.arange(len(self.unit_nodes))) @ self.basis
+
+        value_dims = (1,) * (self.values.ndim - 2)
+        values = np.sum(weights.reshape(weights.shape + value_dims) * self.values[cell], axis=x.ndim)
+
+        return np.where(inside.reshape(x.shape + value_dims), values, 0.0)
+
+
 def imf_binary_primary(m, imf, binary_fraction=constants.BIN_FRACTION):
     """
     Initial mass function for primary stars of binary systems
@@ -158,21 +270,111 @@ def imf_zero(m, imf, binary_fraction=constants.BIN_FRACTION):
         return imf.for_mass(m)
 
 
+def binary_imf_integral(masses, imf, lower, upper, mass_fraction):
+    """
+    Integral over the binary mass mb in [lower, upper] of mass_fraction(mb) * imf(mb) * m / mb^2
+    for every mass m, using Gauss-Legendre with BINARY_IMF_POINTS points.
+    mass_fraction receives the masses and the binary masses as 2D arrays.
+
+    """
+    nodes, weights = np.polynomial.legendre.leggauss(BINARY_IMF_POINTS)
+    m = masses[:, np.newaxis]
+    widths = np.maximum(upper - lower, 0.0)[:, np.newaxis]
+    binary_masses = lower[:, np.newaxis] + widths * (nodes + 1) / 2
+
+    integrand = mass_fraction(m, binary_masses) * imf.for_masses(binary_masses.ravel()).reshape(binary_masses.shape) * m / (binary_masses ** 2)
+
+    return np.sum(integrand * weights, axis=1) * widths[:, 0] / 2
+
+
+@lru_cache(maxsize=32)
+def binary_imf_tables(imf):
+    """
+    Tables of the IMFs for primary and secondary stars of binary systems giving rise to SN I events
+    (imf_binary_primary and imf_binary_secondary with binary_fraction = 1) in [M_MIN, B_MAX].
+    Both are linear in the binary fraction, so one pair of tables per IMF serves any binary fraction.
+    Tables are cached by the parameters of the IMF (see IMF.parameters), so they are shared by equal IMFs of different models.
+
+    """
+    edges = integration_grid(constants.M_MIN, constants.B_MAX, IMF_MASS_BREAKPOINTS)
+
+    def primary(masses):
+        return binary_imf_integral(masses, imf,
+                                   np.maximum(constants.B_MIN, masses),
+                                   np.minimum(constants.B_MAX, 2 * masses),
+                                   lambda m, binary_m: secondary_mass_fraction(1.0 - (m / binary_m)))
+
+    def secondary(masses):
+        return binary_imf_integral(masses, imf,
+                                   np.maximum(constants.B_MIN, 2 * masses),
+                                   np.minimum(constants.B_MAX, constants.M_SNII + masses),
+                                   lambda m, binary_m: secondary_mass_fraction(m / binary_m))
+
+    return IntegrationTable(edges, primary), IntegrationTable(edges, secondary)
+
+
 def global_imf(m, imf, binary_fraction=constants.BIN_FRACTION):
     """
     global initial mass function from Ferrini et al.*,1992, ApJ, 387, 138
+    The contributions of binary systems are interpolated from binary_imf_tables
 
     """
     if m < constants.M_MIN:
         return 0.0
-    if constants.M_MIN <= m < 1.5:
-        return imf_zero(m, imf, binary_fraction) + imf_binary_secondary(m, imf, binary_fraction)
-    elif 1.5 <= m < 8:
-        return imf_zero(m, imf, binary_fraction) + imf_binary_secondary(m, imf, binary_fraction) + imf_binary_primary(m, imf, binary_fraction)
-    elif 8 <= m < 16:
-        return imf_zero(m, imf, binary_fraction) + imf_binary_primary(m, imf, binary_fraction)
-    elif 16 <= m:
-        return imf_zero(m, imf, binary_fraction)
+
+    return float(global_imf_for_masses(m, imf, binary_fraction))
+
+
+def global_imf_for_masses(masses, imf, binary_fraction=constants.BIN_FRACTION):
+    """
+    Vectorized global_imf for an array of masses
+
+    """
+    return imf_weights_for_masses(masses, imf, binary_fraction)[0]
+
+
+def imf_weights_for_masses(masses, imf, binary_fraction=constants.BIN_FRACTION):
+    """
+    global_imf and imf_supernovae_II for an array of masses,
+    evaluating the IMF and the binary IMF tables once for both
+
+    """
+    single, binary = imf_weight_components_for_masses(masses, imf)
+    global_values, supernovae_II_values = single + binary_fraction * binary
+
+    return global_values, supernovae_II_values
+
+
+def imf_weight_components_for_masses(masses, imf):
+    """
+    Single stars and binary systems components of global_imf and imf_supernovae_II for an array of masses.
+    Both are affine in the binary fraction: for any binary_fraction their values are
+
+        single + binary_fraction * binary
+
+    where single and binary are arrays of shape (2, len(masses)) with the global_imf and imf_supernovae_II rows.
+
+    """
+    masses = np.asarray(masses, dtype=float)
+    primary, secondary = binary_imf_tables(imf)
+    imf_values = imf.for_masses(masses)
+    in_binaries = (constants.B_MIN <= masses) & (masses <= constants.B_MAX)
+    supernovae_II = masses > constants.M_SNII
+    valid = masses >= constants.M_MIN
+
+    binary_zero = np.where(in_binaries, -imf_values, 0.0)
+    binary_primaries = binary_zero + primary.interpolate(masses)
+
+    single = np.array([
+        np.where(valid, imf_values, 0.0),
+        np.divide(imf_values, masses, out=np.zeros_like(imf_values), where=supernovae_II),
+    ])
+    binary = np.array([
+        np.where(valid, binary_primaries + secondary.interpolate(masses), 0.0),
+        np.divide(binary_primaries, masses, out=np.zeros_like(imf_values), where=supernovae_II),
+    ])
+
+    return single, binary
 
 
 def phi_primary(m, imf):
@@ -197,11 +399,19 @@ def phi_secondary(m, imf):
 
 def imf_supernovae_II(m, imf, binary_fraction=constants.BIN_FRACTION):
     if m > constants.M_SNII:
-        return (imf_zero(m, imf, binary_fraction) + imf_binary_primary(m, imf, binary_fraction)) / m
+        return float(imf_supernovae_II_for_masses(m, imf, binary_fraction))
     else:
         return 0
 
 
+def imf_supernovae_II_for_masses(masses, imf, binary_fraction=constants.BIN_FRACTION):
+    """
+    Vectorized imf_supernovae_II for an array of masses
+
+    """
+    return imf_weights_for_masses(masses, imf, binary_fraction)[1]
+
+
 def return_fraction(m_inf, m_sup, expelled, imf, binary_fraction=constants.BIN_FRACTION):
     r = newton_cotes(
         m_inf,
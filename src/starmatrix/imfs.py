@@ -15,7 +15,9 @@ and a way to define new functions subclassing IMF
 
 """
 import math
+import numpy as np
 import scipy.integrate
+import starmatrix.cache as cache
 import starmatrix.settings
 
 
@@ -37,9 +39,54 @@ class IMF:
     def __init__(self, params={}):
         self.params = params
         self.set_mass_limits()
-        self.normalization_factor = 1.0 / self.integrated_m_phi_in_mass_interval()
-        self.stars_per_mass_unit = self.normalization_factor * self.integrated_phi_in_mass_interval()
         self.set_params()
+        self.vectorized_m_phi = has_vectorized_m_phi(type(self))
+        self.normalization_factor, self.stars_per_mass_unit = self.normalization()
+
+    def __getstate__(self):
+        """
+        The IMF is pickled with its computed normalization and only the imf_* settings of its params,
+        so it is not normalized again when unpickled
+
+        """
+        state = dict(self.__dict__)
+        state["params"] = self.imf_params()
+        return state
+
+    def __eq__(self, other):
+        return type(self) is type(other) and self.parameters() == other.parameters()
+
+    def __hash__(self):
+        return hash(self.parameters())
+
+    def imf_params(self):
+        return {name: value for name, value in self.params.items() if name.startswith("imf")}
+
+    def parameters(self):
+        """
+        The class, mass limits and imf_* settings defining the IMF: IMFs with equal parameters
+        are equal, so values cached per IMF (like functions.binary_imf_tables) are shared by all of them
+
+        """
+        return (type(self), self.m_low, self.m_up, tuple(sorted(self.imf_params().items())))
+
+    def normalization(self):
+        """
+        Normalization factor and stars per mass unit of the IMF.
+        For the predefined IMFs they are read from the warm cache when it is enabled (see cache.warm_values).
+
+        """
+        def compute():
+            normalization_factor = 1.0 / self.integrated_m_phi_in_mass_interval()
+            return {"normalization_factor": normalization_factor,
+                    "stars_per_mass_unit": normalization_factor * self.integrated_phi_in_mass_interval()}
+
+        if type(self).__module__ == __name__:
+            values = cache.warm_values("imf", [type(self).__name__, self.m_low, self.m_up, self.imf_params()], compute)
+        else:
+            values = compute()
+
+        return float(values["normalization_factor"]), float(values["stars_per_mass_unit"])
 
     def integrated_m_phi_in_mass_interval(self):
         return scipy.integrate.quad(self.m_phi, self.m_low, self.m_up)[0]
@@ -57,6 +104,23 @@ class IMF:
 
         return self.normalization_factor * self.m_phi(m)
 
+    def for_masses(self, masses):
+        """
+        The value of (m * imf) normalized so integral(m * imf) = 1 in [m_low, m_up]
+        for an array of masses
+
+        """
+        masses = np.asarray(masses, dtype=float)
+        values = np.zeros(masses.shape)
+        positive = masses > 0
+
+        if self.vectorized_m_phi:
+            values[positive] = self.normalization_factor * self.m_phi_array(masses[positive])
+        else:
+            values[positive] = self.normalization_factor * IMF.m_phi_array(self, masses[positive])
+
+        return values
+
     def set_mass_limits(self):
         if "imf_m_low" in self.params:
             self.m_low = self.params["imf_m_low"]
@@ -74,6 +138,14 @@ class IMF:
     def m_phi(self, m):
         return m
 
+    def m_phi_array(self, masses):
+        """
+        m_phi for an array of positive masses. Subclasses should override it with a vectorized
+        version of their m_phi. If a subclass only defines m_phi, m_phi is evaluated for each mass.
+
+        """
+        return np.array([self.m_phi(m) for m in masses], dtype=float)
+
     def phi(self, m):
         return self.m_phi(m) / m
 
@@ -82,8 +154,14 @@ class IMF:
 
 
 class Salpeter(IMF):
+    def set_params(self):
+        self.exponent = -(self.alpha())
+
     def m_phi(self, m):
-        return m * (m ** -(self.alpha()))
+        return m * (m ** self.exponent)
+
+    def m_phi_array(self, masses):
+        return masses * (masses ** self.exponent)
 
     def alpha(self):
         if "imf_alpha" in self.params:
@@ -109,6 +187,9 @@ class MillerScalo(IMF):
     def m_phi(self, m):
         return math.exp(-((math.log10(m) + 1.02) ** 2) / (2 * (0.68 ** 2)))
 
+    def m_phi_array(self, masses):
+        return np.exp(-((np.log10(masses) + 1.02) ** 2) / (2 * (0.68 ** 2)))
+
     def description(self):
         return "IMF from Miller & Scalo 1979"
 
@@ -117,6 +198,10 @@ class Ferrini(IMF):
     def m_phi(self, m):
         return 10 ** (-math.sqrt(0.73 + math.log10(m) * (1.92 + math.log10(m) * 2.07))) / m ** 0.52
 
+    def m_phi_array(self, masses):
+        log_m = np.log10(masses)
+        return 10 ** (-np.sqrt(0.73 + log_m * (1.92 + log_m * 2.07))) / masses ** 0.52
+
     def description(self):
         return "IMF Ferrini, Palla & Penco 1998"
 
@@ -134,6 +219,19 @@ class Kroupa2002(IMF):
         else:
             return 0
 
+    def m_phi_array(self, masses):
+        return np.piecewise(masses, [
+            (0.015 <= masses) & (masses < 0.08),
+            (0.08 <= masses) & (masses < 0.5),
+            (0.5 <= masses) & (masses < 1.0),
+            1 <= masses,
+        ], [
+            lambda m: m * (m ** -0.35),
+            lambda m: m * 0.08 * (m ** -1.3),
+            lambda m: m * 0.04 * (m ** -2.3),
+            lambda m: m * 0.04 * (m ** -2.7),
+        ])
+
     def description(self):
         return "IMF from Kroupa 2002"
 
@@ -149,6 +247,17 @@ class Kroupa2001(IMF):
         else:
             return 0
 
+    def m_phi_array(self, masses):
+        return np.piecewise(masses, [
+            (0.015 <= masses) & (masses < 0.08),
+            (0.08 <= masses) & (masses < 0.5),
+            0.5 <= masses,
+        ], [
+            lambda m: m * (m ** -0.35),
+            lambda m: m * 0.08 * (m ** -1.3),
+            lambda m: m * 0.04 * (m ** -2.3),
+        ])
+
     def description(self):
         return "IMF from Kroupa 2001"
 
@@ -160,6 +269,12 @@ class Chabrier(IMF):
         else:
             return m*0.0443*(m**(-2.3))
 
+    def m_phi_array(self, masses):
+        return np.piecewise(masses, [masses <= 1, masses > 1], [
+            lambda m: 0.086*np.exp(-((np.log10(m) - math.log10(0.22))**2)/(2*(0.57**2))),
+            lambda m: m*0.0443*(m**(-2.3)),
+        ])
+
     def description(self):
         return "IMF from Chabrier 2003"
 
@@ -169,13 +284,25 @@ class Maschberger(IMF):
         self.m_low = 0.15
         self.m_up = 100.0
 
+    def set_params(self):
+        self.mu_value = self.mu()
+        self.aalfa_value = self.aalfa()
+        self.beta_value = self.beta()
+        self.a_value = self.a()
+
     def m_phi(self, m):
-        return m * self.a() * \
-               (self.m_mu(m) ** (-self.aalfa())) * \
-               ((1 + (self.m_mu(m) ** (1 - self.aalfa()))) ** (-self.beta()))
+        return m * self.a_value * \
+               (self.m_mu(m) ** (-self.aalfa_value)) * \
+               ((1 + (self.m_mu(m) ** (1 - self.aalfa_value))) ** (-self.beta_value))
+
+    def m_phi_array(self, masses):
+        m_mu = masses / self.mu_value
+        return masses * self.a_value * \
+            (m_mu ** (-self.aalfa_value)) * \
+            ((1 + (m_mu ** (1 - self.aalfa_value))) ** (-self.beta_value))
 
     def m_mu(self, m):
-        return m / self.mu()
+        return m / self.mu_value
 
     def g1(self):
         return (1 + ((0.15 / 0.2) ** (1 - self.aalfa()))) ** (1 - self.beta())
@@ -197,3 +324,17 @@ class Maschberger(IMF):
 
     def description(self):
         return "IMF from Maschberger 2012"
+
+
+def has_vectorized_m_phi(imf_class):
+    """
+    True if the class' m_phi_array is a vectorized version of its m_phi:
+    m_phi_array is defined in the same class as m_phi or in one of its subclasses
+
+    """
+    for klass in imf_class.__mro__:
+        if "m_phi_array" in vars(klass):
+            return True
+        if "m_phi" in vars(klass):
+            return False
+    return True
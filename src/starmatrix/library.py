@@ -0,0 +1,93 @@
+"""
+Libraries of results for a grid of metallicities
+
+A QLibrary stacks the Results of a model for every metallicity of a grid (see Model.run_metallicity_grid)
+along a first axis, indexed by the z values, and interpolates them (step by step, see QLibrary.interpolate)
+for any metallicity inside the grid.
+Libraries are written as a single npz file, qm-library.npz, containing the z array,
+the stacked arrays (see results.stack_results) and the dtd_sn and sn_yields lists if present.
+
+"""
+
+import os
+import numpy as np
+from starmatrix.results import Results, stack_results
+
+LIBRARY_FILENAME = "qm-library.npz"
+
+
+class QLibrary:
+    """
+    Results for a grid of metallicities: z is the sorted array of metallicities and every array
+    (q, phi, sn_Ia_rates, ...) has a first axis with one item per z, padded with NaN to the longest run
+
+    """
+
+    def __init__(self, z, arrays, labels=None):
+        order = np.argsort(z)
+        self.z = np.asarray(z, dtype=float)[order]
+        self.arrays = {name: np.asarray(values)[order] for name, values in arrays.items()}
+        self.labels = labels or {}
+
+    @classmethod
+    def from_results(cls, z, results_list):
+        labels = {name: getattr(results_list[0], name) for name in Results.labels if getattr(results_list[0], name) is not None}
+        return cls(z, stack_results(results_list), labels)
+
+    @property
+    def q(self):
+        return self.arrays["q"]
+
+    def __len__(self):
+        return len(self.z)
+
+    def interpolate(self, z):
+        """
+        Results for a metallicity inside the grid, interpolating every array (mass_intervals included) step by step
+        linearly in log(z) between the two nearest metallicities of the grid.
+
+        Every metallicity has its own time grid: its steps go from the lifetime of m_max to the lifetime of m_min
+        at that z, so the same step is at a different time (and mass interval) for each z. Step i of the interpolated
+        Results is step i of the integration grid, and its mass interval is the interpolated mass_intervals[i].
+        Only the steps present in the runs of both metallicities are returned.
+
+        """
+        if not self.z[0] <= z <= self.z[-1]:
+            raise ValueError(f"z = {z} is outside the metallicity grid [{self.z[0]}, {self.z[-1]}]")
+
+        i = int(np.searchsorted(self.z, z))
+        if self.z[i] == z:
+            weights = {i: 1.0}
+        else:
+            log_z = np.log10(self.z[i - 1:i + 1])
+            weight = (np.log10(z) - log_z[0]) / (log_z[1] - log_z[0])
+            weights = {i - 1: 1 - weight, i: weight}
+
+        steps = min(int(self.arrays["steps"][j]) for j in weights.keys())
+        arrays = {}
+        for name in Results.arrays:
+            if name in self.arrays:
+                values = sum(weight * self.arrays[name][j] for j, weight in weights.items())
+                arrays[name] = values[(slice(None),) * Results.steps_axis(name, values.ndim) + (slice(0, steps),)]
+
+        return Results(**arrays, **self.labels)
+
+    def save(self, output_dir):
+        labels = {name: np.array(values) for name, values in self.labels.items()}
+        np.savez(os.path.join(output_dir, LIBRARY_FILENAME), z=self.z, **self.arrays, **labels)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Reads a library (path to the qm-library.npz file or to its directory)
+
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, LIBRARY_FILENAME)
+
+        with np.load(path) as npz_file:
+            arrays = {name: npz_file[name] for name in npz_file.files}
+
+        z = arrays.pop("z")
+        labels = {name: arrays.pop(name).tolist() for name in Results.labels if name in arrays}
+        return cls(z, arrays, labels)
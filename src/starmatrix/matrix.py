@@ -3,14 +3,19 @@ import starmatrix.constants as constants
 import starmatrix.functions as functions
 import starmatrix.supernovae as sn
 
+# Masses where the He3 core and the omega He3 expressions in q(m) change
+MASS_BREAKPOINTS = [2, 3, 5, 8, 15, 25, 50]
+
+# Elements of the rows (and, the first constants.Q_MATRIX_COLUMNS, of the columns) of the Q matrices
+Q_ELEMENTS = ["H", "D", "He3", "He4", "C12", "O16", "N14", "C13", "nr", "Ne", "Mg", "Si", "S", "Ca", "Fe"]
+
 
 def empty_q_matrix():
     return np.zeros((15, 15))
 
 
 def q_index(element):
-    q_elements = ["H", "D", "He3", "He4", "C12", "O16", "N14", "C13", "nr", "Ne", "Mg", "Si", "S", "Ca", "Fe"]
-    return q_elements.index(element)
+    return Q_ELEMENTS.index(element)
 
 
 def q(m, settings={}):
@@ -38,14 +43,30 @@ def q(m, settings={}):
     So element Q(1,1) (internally q(0,0) as numpy index starts at 0) is the H produced from H,
     and Q(14,4) is the Calcium created from Helium 4.
     Returned matrix is cropped to [constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS]
+    It is computed by q_batch for an array with only this mass.
 
     """
+    return q_batch(np.array([m], dtype=float), settings)[0]
 
-    q = empty_q_matrix()
-    if m < constants.M_MIN:
+
+def q_batch(masses, settings={}, yields=None):
+    """
+    Compute the Q Matrices of elements for an array of masses (without supernovae)
+
+    Every mass is processed at once using arrays (q(m, settings) is the Q Matrix of a single mass),
+    and the result is an array with shape (len(masses), constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    where item i is the Q Matrix for masses[i].
+    yields, if present, are the uncorrected settings["expelled"].for_masses(masses) already computed by the caller.
+
+    """
+    masses = np.asarray(masses, dtype=float)
+    q = np.zeros((len(masses), 15, 15))
+
+    valid = masses >= constants.M_MIN
+    if not np.any(valid):
         return resize_matrix(q)
 
-    z = settings["z"]
+    m = masses[valid]
     expelled = settings["expelled"]
 
     # Apply corrections if present
@@ -53,7 +74,12 @@ def q(m, settings={}):
     if "yield_corrections" in settings:
         yield_corrections = settings["yield_corrections"]
 
-    elements = expelled.for_mass(m, yield_corrections)
+    if yields is None:
+        yields = expelled.for_masses(m, yield_corrections)
+    else:
+        yields = yields[valid] * expelled.corrections_vector(yield_corrections)
+
+    elements = dict(zip(expelled.elements_list, yields.T))
     abundances = settings["abundances"].abundance()
 
     # CRI-LIM correction
@@ -64,22 +90,10 @@ def q(m, settings={}):
     remnant = elements["remnants"]
     he_core = 1 - (elements["H"] / abundances["H"])
     co_core = ((he_core * abundances["H"]) + abundances["He4"] - elements["He4"]) / h_he
-    new_metals_ejected = max(co_core - remnant, 0.0)
-
-    fractional_abundances = {
-        "D":   0.0,
-        "He3": 0.0,
-        "N":   0.0,
-        "C":   0.0,
-        "C13": 0.0,
-        "O":   0.0,
-        "Ne":  0.0,
-        "Mg":  0.0,
-        "Si":  0.0,
-        "S":   0.0,
-        "Ca":  0.0,
-        "Fe":  0.0
-    }
+    new_metals_ejected = np.maximum(co_core - remnant, 0.0)
+
+    fractional_abundances = {element: np.zeros(len(m)) for element in
+                             ["D", "He3", "N", "C", "C13", "O", "Ne", "Mg", "Si", "S", "Ca", "Fe"]}
 
     # Secondary production of N and C
     secondary_n_core = (
@@ -93,113 +107,104 @@ def q(m, settings={}):
         secondary_n_core
     )
 
-    if new_metals_ejected > 0:
-        fractional_abundances["N"] = elements["N14p"] / (h_he * new_metals_ejected)
-        fractional_abundances["C13"] = elements["C13"] / (h_he * new_metals_ejected)
-        fractional_abundances["C"] = (
-            (elements["C12"] / (h_he * new_metals_ejected)) -
-            ((1 - secondary_c13_core) * abundances["C"] / (h_he * new_metals_ejected))
-        )
-        fractional_abundances["O"] = (
-            (elements["O16"] / (h_he * new_metals_ejected)) -
-            ((1 - secondary_n_core) * abundances["O"] / (h_he * new_metals_ejected))
-        )
-
-        for element in ["Ne", "Mg", "Si", "S", "Ca", "Fe"]:
-            fractional_abundances[element] = (
-                (elements[element] - ((1 - remnant) * abundances[element])) /
-                (h_he * new_metals_ejected)
-            )
+    ejecting = new_metals_ejected > 0
+    metals_den = np.where(ejecting, h_he * new_metals_ejected, 1.0)
+    fractional_abundances["N"] = np.where(ejecting, elements["N14p"] / metals_den, 0.0)
+    fractional_abundances["C13"] = np.where(ejecting, elements["C13"] / metals_den, 0.0)
+    fractional_abundances["C"] = np.where(ejecting, (
+        (elements["C12"] / metals_den) -
+        ((1 - secondary_c13_core) * abundances["C"] / metals_den)
+    ), 0.0)
+    fractional_abundances["O"] = np.where(ejecting, (
+        (elements["O16"] / metals_den) -
+        ((1 - secondary_n_core) * abundances["O"] / metals_den)
+    ), 0.0)
+
+    for element in ["Ne", "Mg", "Si", "S", "Ca", "Fe"]:
+        fractional_abundances[element] = np.where(ejecting, (
+            (elements[element] - ((1 - remnant) * abundances[element])) /
+            metals_den
+        ), 0.0)
 
     # Make sure all values are in [0, 1] and normalize:
     for key, value in fractional_abundances.items():
-        fractional_abundances[key] = functions.value_in_interval(value, [0.0, 1.0])
+        fractional_abundances[key] = np.clip(value, 0.0, 1.0)
 
     total_abundances = sum(fractional_abundances.values())
-    if total_abundances > 1:
-        for key, value in fractional_abundances.items():
-            fractional_abundances[key] = value / total_abundances
+    normalize = total_abundances > 1
+    for key, value in fractional_abundances.items():
+        fractional_abundances[key] = np.where(normalize, value / np.where(normalize, total_abundances, 1.0), value)
 
     # He3 core:
-    if m <= 3:
-        he3_core = he_core
-    elif 3 < m <= 8:
-        he3_core = 0.282 + 0.026 * m
-    elif 8 < m <= 15:
-        he3_core = 0.33 + 0.02 * m
-    elif 15 < m <= 25:
-        he3_core = 0.525 + 0.007 * m
-    elif 25 < m <= 50:
-        he3_core = 0.63 + 0.00288 * m
-    elif 50 < m:
-        he3_core = 0.73 + 0.0008 * m
+    he3_core = np.select(
+        [m <= 3, m <= 8, m <= 15, m <= 25, m <= 50],
+        [he_core, 0.282 + 0.026 * m, 0.33 + 0.02 * m, 0.525 + 0.007 * m, 0.63 + 0.00288 * m],
+        0.73 + 0.0008 * m
+    )
 
     # Omega He3:
-    if constants.M_MIN <= m < 2:
-        w3 = (-3.47e-4 * m) + 7.79e-4
-    elif 2 <= m <= 3:
-        w3 = (-4.43e-5 * m) + 1.74e-4
-    elif 3 <= m <= 5:
-        w3 = (-1.15e-5 * m) + 7.53e-5
-    else:
-        w3 = 0.
+    w3 = np.select(
+        [m < 2, m <= 3, m <= 5],
+        [(-3.47e-4 * m) + 7.79e-4, (-4.43e-5 * m) + 1.74e-4, (-1.15e-5 * m) + 7.53e-5],
+        0.
+    )
 
     fractional_abundances["He3"] = w3 * (1 - remnant) / abundances["H"]
 
     # Q(i,j) values:
-    q[0, 0] = 1 - he_core - fractional_abundances["He3"]
-    q[0, 1] = -0.5 * (1 - remnant)
-    q[2, 0] = fractional_abundances["He3"]
-    q[2, 1] = 1.5 * (1 - he3_core)
-    q[2, 2] = 1 - he3_core
-    q[3, 0] = he_core - co_core
-    q[3, 1] = 1.5 * (he3_core - co_core)
-    q[3, 2] = he3_core - co_core
-    q[3, 3] = 1 - co_core
-
-    q[4, 0] = fractional_abundances["C"] * new_metals_ejected
-    q[5, 0] = fractional_abundances["O"] * new_metals_ejected
-    q[6, 0] = fractional_abundances["N"] * new_metals_ejected
-    q[7, 0] = fractional_abundances["C13"] * new_metals_ejected
-
-    q[9, 0] = fractional_abundances["Ne"] * new_metals_ejected
-    q[10, 0] = fractional_abundances["Mg"] * new_metals_ejected
-    q[11, 0] = fractional_abundances["Si"] * new_metals_ejected
-    q[12, 0] = fractional_abundances["S"] * new_metals_ejected
-    q[13, 0] = fractional_abundances["Ca"] * new_metals_ejected
-    q[14, 0] = fractional_abundances["Fe"] * new_metals_ejected
+    qm = np.zeros((len(m), 15, 15))
+    qm[:, 0, 0] = 1 - he_core - fractional_abundances["He3"]
+    qm[:, 0, 1] = -0.5 * (1 - remnant)
+    qm[:, 2, 0] = fractional_abundances["He3"]
+    qm[:, 2, 1] = 1.5 * (1 - he3_core)
+    qm[:, 2, 2] = 1 - he3_core
+    qm[:, 3, 0] = he_core - co_core
+    qm[:, 3, 1] = 1.5 * (he3_core - co_core)
+    qm[:, 3, 2] = he3_core - co_core
+    qm[:, 3, 3] = 1 - co_core
+
+    qm[:, 4, 0] = fractional_abundances["C"] * new_metals_ejected
+    qm[:, 5, 0] = fractional_abundances["O"] * new_metals_ejected
+    qm[:, 6, 0] = fractional_abundances["N"] * new_metals_ejected
+    qm[:, 7, 0] = fractional_abundances["C13"] * new_metals_ejected
+
+    qm[:, 9, 0] = fractional_abundances["Ne"] * new_metals_ejected
+    qm[:, 10, 0] = fractional_abundances["Mg"] * new_metals_ejected
+    qm[:, 11, 0] = fractional_abundances["Si"] * new_metals_ejected
+    qm[:, 12, 0] = fractional_abundances["S"] * new_metals_ejected
+    qm[:, 13, 0] = fractional_abundances["Ca"] * new_metals_ejected
+    qm[:, 14, 0] = fractional_abundances["Fe"] * new_metals_ejected
 
     # C12  O16  N14  C13  Ne  Mg  Si  S  Ca  Fe
-    for i in [4, 5, 6, 7, 9, 10, 11, 12, 13, 14]:
-        q[i, 1] = 1.5 * q[i, 0]
-        q[i, 2] = q[i, 0]
-        q[i, 3] = q[i, 0]
+    rows = [4, 5, 6, 7, 9, 10, 11, 12, 13, 14]
+    qm[:, rows, 1] = 1.5 * qm[:, rows, 0]
+    qm[:, rows, 2] = qm[:, rows, 0]
+    qm[:, rows, 3] = qm[:, rows, 0]
 
     # n.r.:
-    q[8][4] = new_metals_ejected
-    q[8][5] = new_metals_ejected
-    q[8][6] = new_metals_ejected
-    q[8][7] = new_metals_ejected
+    qm[:, 8, 4:8] = new_metals_ejected[:, np.newaxis]
 
     # Diagonal
-    for i in range(8, 15):
-        q[i][i] = 1 - remnant
+    diagonal = np.arange(8, 15)
+    qm[:, diagonal, diagonal] = (1 - remnant)[:, np.newaxis]
 
     # C-N-O cycle:
-    q[4, 4] = 1 - secondary_c13_core
-    q[5, 5] = 1 - secondary_n_core
-    q[6, 6] = 1 - co_core
-    q[7, 7] = 1 - secondary_n_core
-    q[6, 4] = secondary_n_core - co_core
-    q[6, 5] = secondary_n_core - co_core
-    q[6, 7] = secondary_n_core - co_core
-    q[7, 4] = secondary_c13_core - secondary_n_core
+    qm[:, 4, 4] = 1 - secondary_c13_core
+    qm[:, 5, 5] = 1 - secondary_n_core
+    qm[:, 6, 6] = 1 - co_core
+    qm[:, 7, 7] = 1 - secondary_n_core
+    qm[:, 6, 4] = secondary_n_core - co_core
+    qm[:, 6, 5] = secondary_n_core - co_core
+    qm[:, 6, 7] = secondary_n_core - co_core
+    qm[:, 7, 4] = secondary_c13_core - secondary_n_core
 
     # No negative values allowed except for H-D (q(0,1)):
-    for i in range(0, 15):
-        for j in range(0, 15):
-            if q[i, j] <= 0.0 and (i != 0 and j != 1):
-                q[i, j] = 0.0
+    clipped = np.ones((15, 15), dtype=bool)
+    clipped[0, :] = False
+    clipped[:, 1] = False
+    qm[(qm <= 0.0) & clipped] = 0.0
+
+    q[valid] = qm
 
     return resize_matrix(q)
 
@@ -238,4 +243,4 @@ def q_sn(m, feh=0.0, sn_yields="iwa1998"):
 
 
 def resize_matrix(complete_matrix):
-    return complete_matrix[0:constants.Q_MATRIX_ROWS, 0:constants.Q_MATRIX_COLUMNS]
+    return complete_matrix[..., 0:constants.Q_MATRIX_ROWS, 0:constants.Q_MATRIX_COLUMNS]
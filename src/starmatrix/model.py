@@ -1,96 +1,474 @@
-import math
+import functools
 import numpy as np
+from types import MappingProxyType
+import starmatrix.cache as cache
 import starmatrix.constants as constants
 import starmatrix.elements as elements
 import starmatrix.matrix as matrix
+import starmatrix.parallel as parallel
+import starmatrix.time_grids as time_grids
 from starmatrix.imfs import select_imf
+from starmatrix.results import Results
+from starmatrix.settings import ModelConfig
+from starmatrix.library import QLibrary
 from starmatrix.abundances import select_abundances
-from starmatrix.dtds import select_dtd, dtd_correction, dtd_capped_at_max_mass
-from starmatrix.functions import stellar_mass, stellar_lifetime, max_mass_allowed, return_fraction
-from starmatrix.functions import total_energy_ejected, newton_cotes, global_imf, imf_supernovae_II
+from starmatrix.dtds import select_dtd, dtd_correction, dtd_integration_table
+from starmatrix.functions import stellar_mass, stellar_lifetime, max_mass_allowed
+from starmatrix.functions import total_energy_ejected, imf_weight_components_for_masses
+from starmatrix.functions import IntegrationTable, integration_grid, IMF_MASS_BREAKPOINTS
+
+# Values of the stellar mass integrand: Q matrix and return fraction, for single stars and for binary systems
+MASS_INTEGRAND_SIZE = 2 * (constants.Q_MATRIX_ROWS * constants.Q_MATRIX_COLUMNS + 1)
+
+IMF_SETTINGS = ["imf", "imf_alpha", "imf_m_low", "imf_m_up"]
+
+# Stages of a model run, in dependency order: the settings each stage depends on and the stages whose
+# results it uses. Results of the stages are cached in Model.stages, and Model.update only drops the
+# stages affected by the changed settings. Assembling the Results from the stages is cheap and is always done.
+# The mass integrals are stored as single stars and binary systems components, combined in the assembly
+# for the binary_fraction, so they don't depend on it.
+STAGES = {
+    "time_grid": {
+        "settings": ["z", "m_min", "m_max", "integration_step", "total_time_steps",
+                     "integration_steps_stars_bigger_than_4Msun", "integration_steps_stars_smaller_than_4Msun"],
+        "stages": [],
+    },
+    "dtd_rates": {
+        "settings": ["z", "dtd_sn", "snia_m_max"],
+        "stages": ["time_grid"],
+    },
+    "imf_integrals": {
+        "settings": IMF_SETTINGS,
+        "stages": ["time_grid"],
+    },
+    "stellar_q_integrals": {
+        "settings": IMF_SETTINGS + ["z", "sol_ab", "expelled_elements_filename", "yield_corrections"],
+        "stages": ["time_grid"],
+    },
+    "sn_ia_q": {
+        "settings": ["z", "sol_ab", "sn_yields"],
+        "stages": [],
+    },
+}
+
+
+def dependent_stages(settings=(), stages=()):
+    """
+    Names of the stages depending on any of the settings, directly or through the results of other stages,
+    and the stages passed themselves
+
+    """
+    dependent = set(stages)
+    for name, stage in STAGES.items():
+        if set(stage["settings"]) & set(settings) or set(stage["stages"]) & dependent:
+            dependent.add(name)
+
+    return [name for name in STAGES.keys() if name in dependent]
+
+
+def with_warm_cache(method):
+    """
+    Runs a Model method using the warm cache of its settings, if the warm_cache setting is on (see cache.using_warm_cache)
+
+    """
+    @functools.wraps(method)
+    def method_with_warm_cache(self, *args, **kwargs):
+        warm_cache = cache.warm_cache(self.config)
+        if warm_cache is None:
+            return method(self, *args, **kwargs)
+        with cache.using_warm_cache(warm_cache):
+            return method(self, *args, **kwargs)
+
+    return method_with_warm_cache
 
 
 class Model:
+    """
+    A model for the (already validated) settings. The model keeps a read-only copy of them in config,
+    so the settings passed are never modified and can be shared by several models, even in different threads.
+    All the state derived from the settings belongs to the model, and the objects shared between models
+    (like the parsed expelled data or the DTD tables) are only read.
+
+    """
+
     def __init__(self, settings={}):
-        self.context = settings
+        self.config = settings if isinstance(settings, ModelConfig) else ModelConfig.from_mapping(settings)
         self.init_variables()
 
+    def __getstate__(self):
+        """
+        Models are pickled with their settings, the IMF, abundances and expelled data objects
+        and their cached stages, so a model can be sent to another process and run there without
+        recomputing anything. The last Results are not pickled: run assembles them again from the stages.
+
+        """
+        state = dict(self.__dict__)
+        state.pop("context")
+        state.pop("results", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.set_context()
+
+    @with_warm_cache
     def init_variables(self):
-        self.initial_mass_function = select_imf(self.context["imf"], self.context)
-        self.context["abundances"] = select_abundances(self.context["sol_ab"], float(self.context["z"]))
-        self.context["expelled"] = elements.Expelled(expelled_elements_filename=self.context["expelled_elements_filename"])
+        self.initial_mass_function = select_imf(self.config.imf, self.config)
+        self.abundances = select_abundances(self.config.sol_ab, float(self.config.z))
+        self.expelled = elements.load_expelled(self.config.expelled_elements_filename)
+        self.set_context()
 
         self.mass_intervals = []
         self.energies = []
         self.sn_Ia_rates = []
+        self.stages = {}
 
-        self.z = self.context["z"]
-        self.snia_m_max = self.context["snia_m_max"]
-        self.dtd = select_dtd(self.context["dtd_sn"])
-        self.m_min = self.context["m_min"]
-        self.m_max = self.context["m_max"]
-        self.integration_step = self.context["integration_step"]
+        self.set_parameters()
         self.total_time_steps = 0
-        if "total_time_steps" in self.context:
-            self.total_time_steps = self.context["total_time_steps"]
+        if self.config.total_time_steps is not None:
+            self.total_time_steps = self.config.total_time_steps
 
         self.bmaxm = constants.B_MAX / 2
+        self.write_output = True
 
-    def run(self):
-        self.explosive_nucleosynthesis()
-        self.create_q_matrices()
+    def set_context(self):
+        """
+        Read-only view of the config with the abundances and expelled data objects of the model,
+        the settings used by the matrix functions
+
+        """
+        self.context = MappingProxyType({**self.config, "abundances": self.abundances, "expelled": self.expelled})
+
+    def set_parameters(self):
+        self.z = self.config.z
+        self.snia_m_max = self.config.snia_m_max
+        if self.dtd_sn_options() is None:
+            self.dtd = select_dtd(self.config.dtd_sn)
+        else:
+            self.dtd = [select_dtd(dtd_sn) for dtd_sn in self.dtd_sn_options()]
+        self.m_min = self.config.m_min
+        self.m_max = self.config.m_max
+        self.integration_step = self.config.integration_step
+
+    @with_warm_cache
+    def run(self, write_output=True):
+        """
+        Runs the model and returns its Results. With write_output=False no output files are written.
+        Stages cached from a previous run (see update) are not computed again.
+
+        """
+        self.write_output = write_output
+        self._time_steps()
+        return self.create_q_matrices()
+
+    @with_warm_cache
+    def run_binary_fractions(self, binary_fractions):
+        """
+        Results for every binary fraction in the list, without writing output files.
+        The mass integrals are computed once and combined linearly for each binary fraction.
+
+        """
+        self.write_output = False
+        self._time_steps()
+        return [self.assemble_results(binary_fraction) for binary_fraction in binary_fractions]
+
+    @with_warm_cache
+    def run_metallicity_grid(self, zs, m_max=None):
+        """
+        QLibrary with the Results for every metallicity in zs, without writing output files.
+        The IMF and the expelled elements are loaded once for all the grid, and only the stages depending on z are recomputed.
+        m_max (by default the m_max setting) is limited for every z to the maximum mass allowed for that metallicity.
+        settings.validate limits the m_max setting only to the largest mass allowed in its z_grid, so pass
+        the requested m_max when running a grid over settings validated without it.
+
+        """
+        zs = np.asarray(zs, dtype=float)
+        z, config_m_max = self.config.z, self.config.m_max
+        grid_m_max = np.minimum(config_m_max if m_max is None else m_max, max_mass_allowed(zs))
+
+        results = []
+        for grid_z, grid_z_m_max in zip(zs.tolist(), grid_m_max.tolist()):
+            self.update(z=grid_z, m_max=grid_z_m_max)
+            results.append(self.run(write_output=False))
+
+        self.update(z=z, m_max=config_m_max)
+        return QLibrary.from_results(zs, results)
+
+    def _time_steps(self):
+        if "time_grid" in self.stages:
+            self.sn_Ia_rates = self.stage("dtd_rates").tolist()
+            self._write_mass_intervals(self.time_grid)
+        else:
+            self.explosive_nucleosynthesis()
+
+    @with_warm_cache
+    def update(self, **overrides):
+        """
+        Changes some (already valid) settings of the model, dropping the cached stages that depend on them,
+        so the next run only recomputes those. Returns the names of the dropped stages:
+
+            model.run()
+            model.update(sn_yields="sei2013")  # ["sn_ia_q"]
+            model.run()
+
+        """
+        config = self.config.replace(**overrides)
+        changed = {name for name in overrides.keys() if getattr(config, name) != getattr(self.config, name)}
+        self.config = config
+
+        if changed & set(IMF_SETTINGS):
+            self.initial_mass_function = select_imf(self.config.imf, self.config)
+        if changed & {"sol_ab", "z"}:
+            self.abundances = select_abundances(self.config.sol_ab, float(self.config.z))
+        if "expelled_elements_filename" in changed:
+            self.expelled = elements.load_expelled(self.config.expelled_elements_filename)
+        self.set_context()
+        if "total_time_steps" in changed:
+            self.total_time_steps = self.config.total_time_steps
+        self.set_parameters()
+
+        invalid_stages = dependent_stages(settings=changed)
+        self.drop_stages(invalid_stages)
+        return invalid_stages
+
+    def stage(self, name):
+        """
+        Result of a stage of the model (see STAGES), computed only if it is not cached
+
+        """
+        if name not in self.stages:
+            self.stages[name] = getattr(self, f"_{name}_stage")()
+        return self.stages[name]
+
+    def drop_stages(self, names):
+        for name in names:
+            self.stages.pop(name, None)
 
     def create_q_matrices(self):
-        q_sn_ia = matrix.q_sn(constants.CHANDRASEKHAR_LIMIT, feh=self.context["abundances"].feh(), sn_yields=self.context["sn_yields"])
-        imf_sn_file = open(f"{self.context['output_dir']}/imf_supernova_rates", "w+")
-        matrices_file = open(f"{self.context['output_dir']}/qm-matrices", "w+")
-        if self.context["return_fractions"] is True:
-            return_fraction_file = open(f"{self.context['output_dir']}/return_fractions", "w+")
-
-        for i in range(0, self.total_time_steps):
-            m_inf, m_sup = self.mass_intervals[i]
-            q = np.zeros((constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS))
-            phi, supernova_Ia_rates, supernova_II_rates, r = 0.0, 0.0, 0.0, 0.0
-
-            if m_sup > constants.M_MIN and m_sup > m_inf:
-                q += newton_cotes(
-                    m_inf,
-                    m_sup,
-                    lambda m:
-                        global_imf(m, self.initial_mass_function, self.context["binary_fraction"]) *
-                        matrix.q(m, self.context)
-                )
-
-                supernova_Ia_rates = self.sn_Ia_rates[i] * self.initial_mass_function.stars_per_mass_unit * dtd_correction(self.context)
-                q += q_sn_ia * supernova_Ia_rates
-
-                phi = newton_cotes(
-                    m_inf,
-                    m_sup,
-                    lambda m:
-                        global_imf(m, self.initial_mass_function, self.context["binary_fraction"])
-                )
-
-                supernova_II_rates = newton_cotes(
-                    m_inf,
-                    m_sup,
-                    lambda m:
-                        imf_supernovae_II(m, self.initial_mass_function, self.context["binary_fraction"])
-                )
-
-                if self.context["return_fractions"] is True:
-                    r = return_fraction(m_inf, m_sup, self.context["expelled"], self.initial_mass_function, self.context["binary_fraction"])
-
-            np.savetxt(matrices_file, q, fmt="%15.10f", header=self._matrix_header(m_sup, m_inf))
-            imf_sn_file.write(f"  {phi:.10f}  {supernova_Ia_rates:.10f}  {supernova_II_rates:.10f}  {self.energies[i]:.10f}\n")
-            if self.context["return_fractions"] is True:
-                return_fraction_file.write(f"{r:.10f}\n")
-
-        matrices_file.close()
-        imf_sn_file.close()
-        if self.context["return_fractions"] is True:
+        """
+        Q matrices, IMF integrals, supernovae rates and (optionally) return fractions for every step.
+        Returns them as a Results object and writes them in the configured output_format.
+
+        """
+        self.results = self.assemble_results(self.config.binary_fraction)
+
+        if self.write_output:
+            self._write_results(self.results)
+
+        return self.results
+
+    def assemble_results(self, binary_fraction):
+        """
+        Results for the binary_fraction from the stages of the model
+
+        """
+        q_sn_ia = self.stage("sn_ia_q")
+
+        integrals = self._mass_integrals(binary_fraction)
+        mass_intervals = np.array(self.mass_intervals[0:self.total_time_steps], dtype=float).reshape(-1, 2)
+        m_inf, m_sup = mass_intervals.T
+        valid = (m_sup > constants.M_MIN) & (m_sup > m_inf)
+
+        dtd_sn_options = self.dtd_sn_options()
+        sn_Ia_rates = np.zeros(len(mass_intervals) if dtd_sn_options is None else (len(dtd_sn_options), len(mass_intervals)))
+        if np.any(valid):
+            sn_Ia_rates[..., valid] = np.asarray(self.sn_Ia_rates, dtype=float)[..., :len(mass_intervals)][..., valid] * \
+                self.initial_mass_function.stars_per_mass_unit * dtd_correction(self.config)
+
+        # Q matrices have a leading axis for the DTDs, followed by one for the sn_yields datasets (if there are lists of them)
+        rates = sn_Ia_rates[..., np.newaxis, np.newaxis]
+        if dtd_sn_options is not None and self.sn_yields_datasets() is not None:
+            rates = rates[:, np.newaxis]
+        q = np.where(valid[:, np.newaxis, np.newaxis], integrals["q"] + q_sn_ia[..., np.newaxis, :, :] * rates, 0.0)
+
+        return_fractions = None
+        if self.config.return_fractions is True:
+            return_fractions = np.where(valid, integrals["return_fraction"], 0.0)
+
+        return Results(
+            q=q,
+            phi=np.where(valid, integrals["phi"], 0.0),
+            sn_Ia_rates=sn_Ia_rates,
+            sn_II_rates=np.where(valid, integrals["supernova_II"], 0.0),
+            energies=np.array(self.energies[0:self.total_time_steps], dtype=float),
+            mass_intervals=mass_intervals,
+            return_fractions=return_fractions,
+            sn_yields=self.sn_yields_datasets(),
+            dtd_sn=dtd_sn_options,
+        )
+
+    def dtd_sn_options(self):
+        """
+        List of DTDs if the model computes SN Ia rates for several of them, None otherwise
+
+        """
+        if isinstance(self.config.dtd_sn, tuple):
+            return list(self.config.dtd_sn)
+        return None
+
+    def sn_yields_datasets(self):
+        """
+        List of sn_yields datasets if the model computes Q matrices for several of them, None otherwise
+
+        """
+        if isinstance(self.config.sn_yields, tuple):
+            return list(self.config.sn_yields)
+        return None
+
+    def _write_results(self, results):
+        if self.config.output_format == "text":
+            self._write_text_results(results)
+        else:
+            results.save(self.config.output_dir, self.config.output_format)
+
+    def _write_text_results(self, results):
+        # With lists of DTDs or sn_yields datasets, files are suffixed with -<dtd_sn> and -<sn_yields>
+        if results.dtd_sn is None:
+            rates = [("", results.sn_Ia_rates)]
+            q_by_dtd = [("", results.q)]
+        else:
+            rates = [(f"-{dtd_sn}", sn_Ia_rates) for dtd_sn, sn_Ia_rates in zip(results.dtd_sn, results.sn_Ia_rates)]
+            q_by_dtd = [(f"-{dtd_sn}", q) for dtd_sn, q in zip(results.dtd_sn, results.q)]
+        if results.sn_yields is None:
+            q_stacks = q_by_dtd
+        else:
+            q_stacks = [(f"{suffix}-{sn_yields}", q[j]) for suffix, q in q_by_dtd for j, sn_yields in enumerate(results.sn_yields)]
+
+        imf_sn_files = [open(f"{self.config.output_dir}/imf_supernova_rates{suffix}", "w+") for suffix, _ in rates]
+        matrices_files = [open(f"{self.config.output_dir}/qm-matrices{suffix}", "w+") for suffix, _ in q_stacks]
+        if results.return_fractions is not None:
+            return_fraction_file = open(f"{self.config.output_dir}/return_fractions", "w+")
+
+        parallel.write_matrices_files(matrices_files, [q for _, q in q_stacks], self.mass_intervals[0:results.steps],
+                                      self.config.matrix_headers, self.config.workers)
+
+        for i in range(0, results.steps):
+            for imf_sn_file, (_, sn_Ia_rates) in zip(imf_sn_files, rates):
+                imf_sn_file.write(f"  {results.phi[i]:.10f}  {sn_Ia_rates[i]:.10f}  {results.sn_II_rates[i]:.10f}  {results.energies[i]:.10f}\n")
+            if results.return_fractions is not None:
+                return_fraction_file.write(f"{results.return_fractions[i]:.10f}\n")
+
+        for output_file in matrices_files + imf_sn_files:
+            output_file.close()
+        if results.return_fractions is not None:
             return_fraction_file.close()
 
+    def _mass_integrals(self, binary_fraction=None):
+        """
+        Integrals of (global_imf * Q), global_imf, imf_supernovae_II and the return fraction integrand
+        in every mass interval for the binary_fraction (by default the one in the settings),
+        from the imf_integrals and stellar_q_integrals stages
+
+        """
+        if binary_fraction is None:
+            binary_fraction = self.config.binary_fraction
+
+        return {
+            **self._split_imf_integrands(self.stage("imf_integrals"), binary_fraction),
+            **self._split_mass_integrands(self.stage("stellar_q_integrals"), binary_fraction),
+        }
+
+    def _integrals_in_mass_intervals(self, integration_table, size):
+        """
+        Integrals in every mass interval of the integrand tabulated by integration_table(m_up).
+        Each one is the difference of two interpolated values of the cumulative integrals,
+        so the cost barely depends on the number of steps.
+
+        """
+        mass_intervals = np.array(self.mass_intervals[0:self.total_time_steps], dtype=float).reshape(-1, 2)
+        m_inf, m_sup = mass_intervals.T
+        valid = (m_sup > constants.M_MIN) & (m_sup > m_inf)
+
+        if not np.any(valid):
+            return np.zeros((len(m_inf), size))
+
+        return integration_table(max(self.m_max, np.max(m_sup[valid]))).integral(m_inf, m_sup)
+
+    def _imf_integrals_stage(self):
+        return self._integrals_in_mass_intervals(self._imf_integration_table, 4)
+
+    def _stellar_q_integrals_stage(self):
+        return self._integrals_in_mass_intervals(self._mass_integration_table, MASS_INTEGRAND_SIZE)
+
+    def _sn_ia_q_stage(self):
+        """
+        SN Ia Q matrix, or one per dataset (stacked along a first axis) if there is a list of sn_yields
+
+        """
+        feh = self.abundances.feh()
+        if self.sn_yields_datasets() is None:
+            return matrix.q_sn(constants.CHANDRASEKHAR_LIMIT, feh=feh, sn_yields=self.config.sn_yields)
+
+        return np.array([matrix.q_sn(constants.CHANDRASEKHAR_LIMIT, feh=feh, sn_yields=sn_yields) for sn_yields in self.sn_yields_datasets()])
+
+    def _dtd_rates_stage(self):
+        return self._dtd_integral(self.time_grid.t_inf, self.time_grid.t_sup)
+
+    def _time_grid_stage(self):
+        self.explosive_nucleosynthesis()
+        return self.time_grid
+
+    def _imf_integration_table(self, m_up):
+        """
+        Cumulative integrals in [constants.M_MIN, m_up] of the single stars and binary systems components
+        of global_imf and imf_supernovae_II
+
+        """
+        imf = self.initial_mass_function
+        edges = integration_grid(constants.M_MIN, m_up, IMF_MASS_BREAKPOINTS)
+
+        return IntegrationTable(edges, lambda masses: np.vstack(imf_weight_components_for_masses(masses, imf)).T)
+
+    def _mass_integration_table(self, m_up):
+        """
+        Cumulative integrals in [constants.M_MIN, m_up] of the fused integrand for Q and return fractions:
+        the IMF weights, the Q matrix and the remnants are computed once per mass node and stacked
+        into MASS_INTEGRAND_SIZE values, the single stars component followed by the binary systems one.
+        The mass grid includes as edges all the masses where the integrands change their expression
+        and the mass points of the expelled elements data.
+
+        """
+        imf = self.initial_mass_function
+        expelled = self.expelled
+        breakpoints = matrix.MASS_BREAKPOINTS + IMF_MASS_BREAKPOINTS + expelled.mass_points
+        edges = integration_grid(constants.M_MIN, m_up, breakpoints)
+        remnants_column = expelled.elements_list.index("remnants")
+
+        def integrand(masses):
+            single, binary = imf_weight_components_for_masses(masses, imf)
+            yields = expelled.for_masses(masses)
+            q = matrix.q_batch(masses, self.context, yields=yields).reshape(len(masses), -1)
+            returned_mass_fraction = (masses - yields[:, remnants_column]) / masses
+
+            return np.column_stack([
+                single[0][:, np.newaxis] * q,
+                single[0] * returned_mass_fraction,
+                binary[0][:, np.newaxis] * q,
+                binary[0] * returned_mass_fraction,
+            ])
+
+        return IntegrationTable(edges, integrand)
+
+    def _split_imf_integrands(self, values, binary_fraction):
+        """
+        global_imf and imf_supernovae_II integrands (or their integrals) for the binary_fraction
+
+        """
+        combined = values[:, :2] + binary_fraction * values[:, 2:]
+        return {"phi": combined[:, 0], "supernova_II": combined[:, 1]}
+
+    def _split_mass_integrands(self, values, binary_fraction):
+        """
+        Named columns of the fused mass integrand (or its integrals) for the binary_fraction
+
+        """
+        q_size = constants.Q_MATRIX_ROWS * constants.Q_MATRIX_COLUMNS
+        values = values[:, :MASS_INTEGRAND_SIZE // 2] + binary_fraction * values[:, MASS_INTEGRAND_SIZE // 2:]
+        return {
+            "q": values[:, :q_size].reshape(-1, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS),
+            "return_fraction": values[:, q_size],
+        }
+
     def explosive_nucleosynthesis(self):
         if self.integration_step == "logt":
             self.explosive_nucleosynthesis_step_logt()
@@ -99,8 +477,8 @@ class Model:
         elif self.integration_step == "two_steps_t":
             self.explosive_nucleosynthesis_two_steps_t()
         elif self.integration_step == "fixed_n_steps":
-            steps_small_stars = self.context["integration_steps_stars_smaller_than_4Msun"]
-            steps_massive_stars = self.context["integration_steps_stars_bigger_than_4Msun"]
+            steps_small_stars = self.config.integration_steps_stars_smaller_than_4Msun
+            steps_massive_stars = self.config.integration_steps_stars_bigger_than_4Msun
             self.explosive_nucleosynthesis_fixed_n_steps(steps_massive_stars, steps_small_stars)
         else:
             raise ValueError("Invalid value for integration step. Should be one of: [logt, t, two_steps_t, fixed_n_steps]")
@@ -108,144 +486,68 @@ class Model:
     def explosive_nucleosynthesis_step_logt(self):
         t_ini = stellar_lifetime(min(self.m_max, max_mass_allowed(self.z)), self.z)
         t_end = min(stellar_lifetime(self.m_min, self.z), constants.TOTAL_TIME)
-        t_ini_log = math.log10(t_ini * 1e9)
-        t_end_log = math.log10(t_end * 1e9)
-
-        delta_t_log = (t_end_log - t_ini_log) / self.total_time_steps
-
-        mass_intervals_file = open(f"{self.context['output_dir']}/mass_intervals", "w+")
-        mass_intervals_file.write(" ".join([str(i) for i in [t_ini, t_end, self.total_time_steps, delta_t_log]]))
 
-        for step in range(0, self.total_time_steps):
-            t_inf_log = t_ini_log + (delta_t_log * step)
-            t_sup_log = t_ini_log + (delta_t_log * (step + 1))
-
-            t_inf = math.pow(10, t_inf_log - 9)
-            t_sup = math.pow(10, t_sup_log - 9)
-
-            m_inf = stellar_mass(t_sup, self.z)
-            m_sup = stellar_mass(t_inf, self.z)
-
-            mass_intervals_file.write('\n' + f'{m_sup:14.10f}  ' + f'{m_inf:14.10f}  ' + str(step + 1))
-
-            self.mass_intervals.append([m_inf, m_sup])
-            self.energies.append(total_energy_ejected(t_sup) - total_energy_ejected(t_inf))
-            self.sn_Ia_rates.append(newton_cotes(t_inf, t_sup, dtd_capped_at_max_mass(self.dtd, self.z, self.snia_m_max)))
-
-        mass_intervals_file.close()
+        self.explosive_nucleosynthesis_for_grid(time_grids.logt_grid(t_ini, t_end, self.total_time_steps))
 
     def explosive_nucleosynthesis_step_t(self):
         t_ini = stellar_lifetime(self.m_max, self.z)
         t_end = min(stellar_lifetime(self.m_min, self.z), constants.TOTAL_TIME)
 
-        delta_t = (t_end - t_ini) / self.total_time_steps
-
-        mass_intervals_file = open(f"{self.context['output_dir']}/mass_intervals", "w+")
-        mass_intervals_file.write(" ".join([str(i) for i in [t_ini, t_end, self.total_time_steps, delta_t]]))
-
-        for step in range(0, self.total_time_steps):
-            t_inf = t_ini + (delta_t * step)
-            t_sup = t_ini + (delta_t * (step + 1))
-
-            m_inf = stellar_mass(t_sup, self.z)
-            m_sup = stellar_mass(t_inf, self.z)
-
-            mass_intervals_file.write('\n' + f'{m_sup:14.10f}  ' + f'{m_inf:14.10f}  ' + str(step + 1))
-
-            self.mass_intervals.append([m_inf, m_sup])
-            self.energies.append(total_energy_ejected(t_sup) - total_energy_ejected(t_inf))
-            self.sn_Ia_rates.append(newton_cotes(t_inf, t_sup, dtd_capped_at_max_mass(self.dtd, self.z, self.snia_m_max)))
-
-        mass_intervals_file.close()
+        self.explosive_nucleosynthesis_for_grid(time_grids.t_grid(t_ini, t_end, self.total_time_steps))
 
     def explosive_nucleosynthesis_two_steps_t(self):
         t_ini = stellar_lifetime(self.m_max, self.z)
         t_limit_massive = stellar_lifetime(4.0, self.z)
         t_end = min(stellar_lifetime(self.m_min, self.z), constants.TOTAL_TIME)
-
         delta_t_1 = stellar_lifetime(100.0, self.z) / 2
-        delta_t_2 = 50 * delta_t_1
-
-        steps_with_delta_t_1 = math.ceil((t_limit_massive - t_ini) / delta_t_1)
-        t_ini_for_delta_2 = t_ini + (delta_t_1 * steps_with_delta_t_1)
-        steps_with_delta_t_2 = math.ceil((t_end - t_ini_for_delta_2) / delta_t_2)
-        delta_t_2 = (t_end - t_ini_for_delta_2) / steps_with_delta_t_2
-        self.total_time_steps = steps_with_delta_t_1 + steps_with_delta_t_2
-
-        mass_intervals_file = open(f"{self.context['output_dir']}/mass_intervals", "w+")
-        mass_intervals_file.write(" ".join([str(i) for i in [t_ini, t_end, steps_with_delta_t_1, steps_with_delta_t_2, delta_t_1, delta_t_2]]))
-
-        for step in range(0, steps_with_delta_t_1):
-            t_inf = t_ini + (delta_t_1 * step)
-            t_sup = t_ini + (delta_t_1 * (step + 1))
-
-            m_inf = stellar_mass(t_sup, self.z)
-            m_sup = stellar_mass(t_inf, self.z)
-
-            mass_intervals_file.write('\n' + f'{m_sup:14.10f}  ' + f'{m_inf:14.10f}  ' + str(step + 1))
-
-            self.mass_intervals.append([m_inf, m_sup])
-            self.energies.append(total_energy_ejected(t_sup) - total_energy_ejected(t_inf))
-            self.sn_Ia_rates.append(newton_cotes(t_inf, t_sup, dtd_capped_at_max_mass(self.dtd, self.z, self.snia_m_max)))
 
-        for step in range(0, steps_with_delta_t_2):
-            t_inf = t_ini_for_delta_2 + (delta_t_2 * step)
-            t_sup = t_ini_for_delta_2 + (delta_t_2 * (step + 1))
-
-            m_inf = stellar_mass(t_sup, self.z)
-            m_sup = stellar_mass(t_inf, self.z)
-
-            mass_intervals_file.write('\n' + f'{m_sup:14.10f}  ' + f'{m_inf:14.10f}  ' + str(step + 1))
-
-            self.mass_intervals.append([m_inf, m_sup])
-            self.energies.append(total_energy_ejected(t_sup) - total_energy_ejected(t_inf))
-            self.sn_Ia_rates.append(newton_cotes(t_inf, t_sup, dtd_capped_at_max_mass(self.dtd, self.z, self.snia_m_max)))
-
-        mass_intervals_file.close()
+        self.explosive_nucleosynthesis_for_grid(time_grids.two_steps_t_grid(t_ini, t_limit_massive, t_end, delta_t_1))
 
     def explosive_nucleosynthesis_fixed_n_steps(self, n_massive, n_small):
         t_ini = stellar_lifetime(self.m_max, self.z)
         t_limit_massive = stellar_lifetime(4.0, self.z)
         t_end = min(stellar_lifetime(self.m_min, self.z), constants.TOTAL_TIME)
 
-        delta_t_1 = (t_limit_massive - t_ini) / n_massive
-        delta_t_2 = (t_end - t_limit_massive) / n_small
-
-        self.total_time_steps = n_massive + n_small
-
-        mass_intervals_file = open(f"{self.context['output_dir']}/mass_intervals", "w+")
-        mass_intervals_file.write(" ".join([str(i) for i in [t_ini, t_end, n_massive, n_small, delta_t_1, delta_t_2]]))
-
-        for step in range(0, n_massive):
-            t_inf = t_ini + (delta_t_1 * step)
-            t_sup = t_ini + (delta_t_1 * (step + 1))
-
-            m_inf = stellar_mass(t_sup, self.z)
-            m_sup = stellar_mass(t_inf, self.z)
-
-            mass_intervals_file.write('\n' + f'{m_sup:14.10f}  ' + f'{m_inf:14.10f}  ' + str(step + 1))
-
-            self.mass_intervals.append([m_inf, m_sup])
-            self.energies.append(total_energy_ejected(t_sup) - total_energy_ejected(t_inf))
-            self.sn_Ia_rates.append(newton_cotes(t_inf, t_sup, dtd_capped_at_max_mass(self.dtd, self.z, self.snia_m_max)))
-
-        for step in range(0, n_small):
-            t_inf = t_limit_massive + (delta_t_2 * step)
-            t_sup = t_limit_massive + (delta_t_2 * (step + 1))
-
-            m_inf = stellar_mass(t_sup, self.z)
-            m_sup = stellar_mass(t_inf, self.z)
-
-            mass_intervals_file.write('\n' + f'{m_sup:14.10f}  ' + f'{m_inf:14.10f}  ' + str(step + 1))
-
-            self.mass_intervals.append([m_inf, m_sup])
-            self.energies.append(total_energy_ejected(t_sup) - total_energy_ejected(t_inf))
-            self.sn_Ia_rates.append(newton_cotes(t_inf, t_sup, dtd_capped_at_max_mass(self.dtd, self.z, self.snia_m_max)))
-
-        mass_intervals_file.close()
-
-    def _matrix_header(self, m_sup, m_inf):
-        if self.context["matrix_headers"] is True:
-            return f"Q matrix for mass interval: [{m_sup}, {m_inf}]"
-        else:
-            return ""
+        self.explosive_nucleosynthesis_for_grid(time_grids.fixed_n_steps_grid(t_ini, t_limit_massive, t_end, n_massive, n_small))
+
+    def explosive_nucleosynthesis_for_grid(self, time_grid):
+        """
+        Mass intervals, energies and SN Ia rates for every step of a TimeGrid, computed at once
+        for all the steps. Any grid of time edges can be used, not only the integration_step options.
+
+        """
+        t_inf, t_sup = time_grid.t_inf, time_grid.t_sup
+
+        m_inf = stellar_mass(t_sup, self.z)
+        m_sup = stellar_mass(t_inf, self.z)
+        energies = total_energy_ejected(t_sup) - total_energy_ejected(t_inf)
+
+        self.drop_stages(dependent_stages(stages=["time_grid"]))
+        self.stages["time_grid"] = time_grid
+        self.time_grid = time_grid
+        self.total_time_steps = time_grid.steps
+        self.mass_intervals = np.column_stack([m_inf, m_sup]).tolist()
+        self.energies = energies.tolist()
+        self.sn_Ia_rates = self.stage("dtd_rates").tolist()
+
+        self._write_mass_intervals(time_grid)
+
+    def _write_mass_intervals(self, time_grid):
+        if self.write_output and self.config.output_format == "text":
+            lines = [" ".join([str(i) for i in time_grid.header])]
+            lines += [f'{m_sup:14.10f}  ' + f'{m_inf:14.10f}  ' + str(step)
+                      for (m_inf, m_sup), step in zip(self.mass_intervals, time_grid.step_numbers())]
+
+            mass_intervals_file = open(f"{self.config.output_dir}/mass_intervals", "w+")
+            mass_intervals_file.write("\n".join(lines))
+            mass_intervals_file.close()
+
+    def _dtd_integral(self, t_inf, t_sup):
+        """
+        Integrals of the DTD in the time intervals, or of every DTD (stacked along a first axis) if there is a list of them.
+        Each DTD is tabulated once (with a single vectorized evaluation) and cached for any time grid.
+
+        """
+        if isinstance(self.dtd, list):
+            return np.array([dtd_integration_table(dtd, self.z, self.snia_m_max).integral(t_inf, t_sup) for dtd in self.dtd])
+        return dtd_integration_table(self.dtd, self.z, self.snia_m_max).integral(t_inf, t_sup)
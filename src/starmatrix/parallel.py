@@ -0,0 +1,106 @@
+"""
+Text output written by several processes
+
+Writing the Q matrices as text is the part of a model run growing with the number of steps.
+With workers > 1 the steps are split in contiguous chunks, one per process. The Q matrices are
+shared with the processes in a shared memory block (so they are not pickled), every process
+writes its chunk of steps in a part file and the parts are joined in step order.
+
+"""
+
+import os
+import shutil
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    # Python < 3.8: the text output is written by a single process
+    shared_memory = None
+
+# Smaller chunks of steps are not worth starting a process
+MIN_STEPS_PER_WORKER = 500
+
+
+def matrix_header(m_sup, m_inf, matrix_headers=True):
+    if matrix_headers is True:
+        return f"Q matrix for mass interval: [{m_sup}, {m_inf}]"
+    else:
+        return ""
+
+
+def write_matrices(output_file, q, mass_intervals, matrix_headers=True):
+    """
+    Writes the Q matrices of consecutive steps, each one with the header for its [m_inf, m_sup] mass interval
+
+    """
+    for matrix, (m_inf, m_sup) in zip(q, mass_intervals):
+        np.savetxt(output_file, matrix, fmt="%15.10f", header=matrix_header(m_sup, m_inf, matrix_headers))
+
+
+def step_chunks(steps, workers):
+    """
+    [start, stop) limits of the contiguous chunks of steps for (at most) workers processes
+
+    """
+    chunks = max(1, min(workers, steps // MIN_STEPS_PER_WORKER))
+    limits = [steps * i // chunks for i in range(chunks + 1)]
+    return list(zip(limits[:-1], limits[1:]))
+
+
+def part_path(path, start):
+    return f"{path}.part-{start}"
+
+
+def write_matrices_chunk(shared_name, shape, paths, mass_intervals, matrix_headers, start):
+    """
+    Writes the Q matrices of the steps from start (one per mass interval) of every stack in the shared
+    memory block to the part files of paths
+
+    """
+    block = shared_memory.SharedMemory(name=shared_name)
+    try:
+        q = np.ndarray(shape, dtype=float, buffer=block.buf)
+        for i, path in enumerate(paths):
+            with open(part_path(path, start), "w") as part_file:
+                write_matrices(part_file, q[i, start:start + len(mass_intervals)], mass_intervals, matrix_headers)
+        # The block can't be closed while arrays use its buffer
+        del q
+    finally:
+        block.close()
+
+
+def write_matrices_files(matrices_files, q_stacks, mass_intervals, matrix_headers=True, workers=1):
+    """
+    Writes every stack of Q matrices (arrays of shape (steps, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS))
+    to its open file, splitting the steps among workers processes
+    (only one process in Python versions without multiprocessing.shared_memory)
+
+    """
+    q = np.ascontiguousarray(q_stacks, dtype=float)
+    chunks = step_chunks(q.shape[1], workers if shared_memory is not None else 1)
+    if len(chunks) == 1:
+        for matrices_file, stack in zip(matrices_files, q):
+            write_matrices(matrices_file, stack, mass_intervals, matrix_headers)
+        return
+
+    paths = [matrices_file.name for matrices_file in matrices_files]
+    block = shared_memory.SharedMemory(create=True, size=q.nbytes)
+    try:
+        np.ndarray(q.shape, dtype=float, buffer=block.buf)[:] = q
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            futures = [executor.submit(write_matrices_chunk, block.name, q.shape, paths, mass_intervals[start:stop], matrix_headers, start)
+                       for start, stop in chunks]
+            for future in futures:
+                future.result()
+    finally:
+        block.close()
+        block.unlink()
+
+    for matrices_file, path in zip(matrices_files, paths):
+        matrices_file.flush()
+        for start, _ in chunks:
+            with open(part_path(path, start), "r") as part_file:
+                shutil.copyfileobj(part_file, matrices_file)
+            os.remove(part_path(path, start))
@@ -0,0 +1,123 @@
+"""
+Memory-mapped store for Q matrices
+
+A binary file with a small self-describing header followed by the Q matrices of all the steps
+as a contiguous float64 array, so they can be read as a NumPy memory map without parsing or copying.
+It is a read format: the matrices are computed in memory by the model and written at once.
+
+File layout:
+
+* MAGIC
+* header length (little-endian uint32)
+* header: JSON with the shape and dtype of the array, the elements of the rows and columns
+  (in the order of matrix.q_index), the mass intervals, the DTDs and the sn_yields datasets (null if the model
+  was run with only one), padded so data is 64-byte aligned
+* data: array of shape (steps, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS), with extra leading axes
+  (one item per DTD and one item per sn_yields dataset, in that order) if the header has lists of them
+
+"""
+
+import json
+import os
+import struct
+import numpy as np
+import starmatrix.constants as constants
+from starmatrix.matrix import Q_ELEMENTS
+
+MAGIC = b"\x93STARMATRIX-Q"
+VERSION = 1
+QMATRICES_FILENAME = "qm-matrices.mmap"
+DTYPE = "<f8"
+ALIGNMENT = 64
+
+
+class QMatrices:
+    """
+    Q matrices read from a store: q is an array (a read-only memory map unless loaded with mmap=False)
+    of shape (steps, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS), with leading axes of length len(dtd_sn)
+    and len(sn_yields) if they are not None. len() and indexing are by step, whatever the leading axes.
+
+    """
+
+    def __init__(self, q, header):
+        self.q = q
+        self.header = header
+        self.rows = header["rows"]
+        self.columns = header["columns"]
+        self.mass_intervals = np.array(header["mass_intervals"], dtype=float).reshape(-1, 2)
+        self.sn_yields = header.get("sn_yields")
+        self.dtd_sn = header.get("dtd_sn")
+
+    def __len__(self):
+        """
+        Number of steps
+
+        """
+        return self.q.shape[-3]
+
+    def __getitem__(self, step):
+        """
+        Q matrices of a step (or steps, with a slice), for every DTD and sn_yields dataset if there are lists of them
+
+        """
+        return self.q[..., step, :, :]
+
+
+def write_qmatrices(path, q, mass_intervals, sn_yields=None, dtd_sn=None):
+    """
+    Writes the Q matrices of a model (computed in memory, see Model.assemble_results) as a store.
+    q has shape (steps, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS), with leading axes
+    for the lists of DTDs and sn_yields datasets if they are not None.
+
+    """
+    q = np.ascontiguousarray(q, dtype=DTYPE)
+    header = {
+        "version": VERSION,
+        "shape": list(q.shape),
+        "dtype": DTYPE,
+        "rows": Q_ELEMENTS[:constants.Q_MATRIX_ROWS],
+        "columns": Q_ELEMENTS[:constants.Q_MATRIX_COLUMNS],
+        "mass_intervals": np.asarray(mass_intervals, dtype=float).reshape(-1, 2).tolist(),
+        "sn_yields": sn_yields,
+        "dtd_sn": dtd_sn,
+    }
+    encoded_header = json.dumps(header).encode("utf-8")
+    prefix_size = len(MAGIC) + 4
+    padding = -(prefix_size + len(encoded_header) + 1) % ALIGNMENT
+    encoded_header += b" " * padding + b"\n"
+
+    with open(path, "wb") as store_file:
+        store_file.write(MAGIC)
+        store_file.write(struct.pack("<I", len(encoded_header)))
+        store_file.write(encoded_header)
+        q.tofile(store_file)
+
+
+def read_header(path):
+    with open(path, "rb") as store_file:
+        if store_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a Q matrices store")
+        header_length, = struct.unpack("<I", store_file.read(4))
+        header = json.loads(store_file.read(header_length).decode("utf-8"))
+
+    return header, len(MAGIC) + 4 + header_length
+
+
+def load_qmatrices(path, mmap=True):
+    """
+    Reads a Q matrices store (path to the file or to the output directory containing it).
+    With mmap=True the matrices are a read-only view of the file: nothing is read until used.
+
+    """
+    if os.path.isdir(path):
+        path = os.path.join(path, QMATRICES_FILENAME)
+
+    header, offset = read_header(path)
+    shape = tuple(header["shape"])
+
+    if mmap and np.prod(shape) > 0:
+        q = np.memmap(path, dtype=header["dtype"], mode="r", offset=offset, shape=shape)
+    else:
+        q = np.fromfile(path, dtype=header["dtype"], count=int(np.prod(shape)), offset=offset).reshape(shape)
+
+    return QMatrices(q, header)
@@ -0,0 +1,162 @@
+"""
+Readers for the text output files written by Model
+
+Every file is parsed in bulk into NumPy arrays, and a whole results directory can be read
+as a Results object or converted to one of the binary output formats.
+
+"""
+
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import starmatrix.constants as constants
+from starmatrix.results import Results
+from starmatrix.settings import valid_values
+
+QMATRICES_FILE = "qm-matrices"
+IMF_SUPERNOVA_RATES_FILE = "imf_supernova_rates"
+MASS_INTERVALS_FILE = "mass_intervals"
+RETURN_FRACTIONS_FILE = "return_fractions"
+
+
+def parse_values(lines):
+    """
+    All the numbers in the lines (excluding # comment lines) as a flat array,
+    parsed at once with the C parser of np.loadtxt
+
+    """
+    return np.loadtxt(lines, dtype=float, comments="#", ndmin=1).ravel()
+
+
+def read_lines(path):
+    with open(path, "r") as text_file:
+        return text_file.read().splitlines()
+
+
+def read_qmatrices(path):
+    """
+    Q matrices from a qm-matrices file, with or without matrix headers.
+    Returns an array of shape (steps, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+
+    """
+    return parse_values(read_lines(path)).reshape(-1, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+
+
+def read_imf_supernova_rates(path):
+    """
+    Columns of the imf_supernova_rates file: phi, SN Ia rates, SN II rates and energies
+
+    """
+    return parse_values(read_lines(path)).reshape(-1, 4).T
+
+
+def read_mass_intervals(path):
+    """
+    Mass intervals file: returns the values of the header line (4 values for the logt and t integration steps,
+    6 for two_steps_t and fixed_n_steps) and an array of shape (steps, 2) with the [m_inf, m_sup] intervals
+
+    """
+    lines = read_lines(path)
+    if not lines:
+        return [], np.zeros((0, 2))
+
+    header = [float(value) for value in lines[0].split()]
+    rows = parse_values(lines[1:]).reshape(-1, 3)
+
+    return header, rows[:, [1, 0]]
+
+
+def read_return_fractions(path):
+    return parse_values(read_lines(path))
+
+
+def file_suffixes(directory, name, values):
+    """
+    The values (in their order) with a <name>-<value> file in the directory.
+    Models run with lists of DTDs or sn_yields datasets write a file per value with those suffixes.
+
+    """
+    return [value for value in values if os.path.exists(os.path.join(directory, f"{name}-{value}"))]
+
+
+def read_qmatrices_stack(directory, name):
+    """
+    sn_yields datasets (None if there is only one) and Q matrices from the name file,
+    or from the name-<sn_yields> files stacked along a first axis
+
+    """
+    if os.path.exists(os.path.join(directory, name)):
+        return None, read_qmatrices(os.path.join(directory, name))
+
+    sn_yields = file_suffixes(directory, name, valid_values["sn_yields"])
+    if not sn_yields:
+        raise FileNotFoundError(f"No {name} file (or {name}-<sn_yields> files) in {directory}")
+    return sn_yields, np.array([read_qmatrices(os.path.join(directory, f"{name}-{dataset}")) for dataset in sn_yields])
+
+
+def read_text_results(directory):
+    """
+    Results of a model written in text format in a directory
+
+    """
+    dtd_sn = None
+    if os.path.exists(os.path.join(directory, IMF_SUPERNOVA_RATES_FILE)):
+        phi, sn_Ia_rates, sn_II_rates, energies = read_imf_supernova_rates(os.path.join(directory, IMF_SUPERNOVA_RATES_FILE))
+        sn_yields, q = read_qmatrices_stack(directory, QMATRICES_FILE)
+    else:
+        dtd_sn = file_suffixes(directory, IMF_SUPERNOVA_RATES_FILE, valid_values["dtd_sn"])
+        if not dtd_sn:
+            raise FileNotFoundError(f"No {IMF_SUPERNOVA_RATES_FILE} file (or {IMF_SUPERNOVA_RATES_FILE}-<dtd> files) in {directory}")
+        rates = [read_imf_supernova_rates(os.path.join(directory, f"{IMF_SUPERNOVA_RATES_FILE}-{dtd}")) for dtd in dtd_sn]
+        phi, _, sn_II_rates, energies = rates[0]
+        sn_Ia_rates = np.array([dtd_rates[1] for dtd_rates in rates])
+        stacks = [read_qmatrices_stack(directory, f"{QMATRICES_FILE}-{dtd}") for dtd in dtd_sn]
+        sn_yields, q = stacks[0][0], np.array([stack[1] for stack in stacks])
+
+    _, mass_intervals = read_mass_intervals(os.path.join(directory, MASS_INTERVALS_FILE))
+
+    return_fractions = None
+    if os.path.exists(os.path.join(directory, RETURN_FRACTIONS_FILE)):
+        return_fractions = read_return_fractions(os.path.join(directory, RETURN_FRACTIONS_FILE))
+
+    return Results(
+        q=q,
+        phi=phi,
+        sn_Ia_rates=sn_Ia_rates,
+        sn_II_rates=sn_II_rates,
+        energies=energies,
+        mass_intervals=mass_intervals,
+        return_fractions=return_fractions,
+        sn_yields=sn_yields,
+        dtd_sn=dtd_sn,
+    )
+
+
+def results_directories(root):
+    """
+    All the directories in the tree under root containing text results
+
+    """
+    return sorted(directory for directory, _, files in os.walk(root)
+                  if any(name == QMATRICES_FILE or name.startswith(QMATRICES_FILE + "-") for name in files))
+
+
+def convert_directory(directory, output_format="npz"):
+    read_text_results(directory).save(directory, output_format)
+    return directory
+
+
+def convert_tree(root, output_format="npz", workers=None):
+    """
+    Converts every text results directory under root to a binary output_format,
+    writing the binary files next to the text ones. Directories are converted in parallel
+    by workers processes (by default, the number of CPUs).
+    Returns the list of converted directories.
+
+    """
+    directories = results_directories(root)
+    if workers == 1 or len(directories) < 2:
+        return [convert_directory(directory, output_format) for directory in directories]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(convert_directory, directories, [output_format] * len(directories)))
@@ -0,0 +1,150 @@
+"""
+Results of a model run as NumPy arrays
+
+The results can be written as:
+
+* npz: a single (uncompressed) numpy archive, results.npz
+* npy-dir: one .npy file per array, in the output directory
+* mmap: the Q matrices in a memory-mappable store (see qmatrix_store) and the rest of arrays in results.npz
+
+"""
+
+import os
+import numpy as np
+from starmatrix.qmatrix_store import QMATRICES_FILENAME, write_qmatrices, load_qmatrices
+
+OUTPUT_FORMATS = ["text", "npz", "npy-dir", "mmap"]
+NPZ_FILENAME = "results.npz"
+
+
+class Results:
+    """
+    Outputs of a model, one item per integration step:
+
+    q: Q matrices, array of shape (steps, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    phi: integral of the global IMF in the mass interval
+    sn_Ia_rates, sn_II_rates: supernovae rates
+    energies: energy released by supernovae
+    mass_intervals: array of shape (steps, 2) with the [m_inf, m_sup] mass interval
+    return_fractions: None unless the model is run with return_fractions: true
+    sn_yields: None unless the model is run with a list of sn_yields datasets. Then q has an extra
+               leading axis, with shape (len(sn_yields), steps, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    dtd_sn: None unless the model is run with a list of DTDs. Then sn_Ia_rates has shape (len(dtd_sn), steps)
+            and q has an extra leading axis (before the sn_yields one, if present) with an item per DTD
+
+    """
+    arrays = ["q", "phi", "sn_Ia_rates", "sn_II_rates", "energies", "mass_intervals", "return_fractions"]
+    labels = ["dtd_sn", "sn_yields"]
+
+    def __init__(self, q, phi, sn_Ia_rates, sn_II_rates, energies, mass_intervals, return_fractions=None, sn_yields=None, dtd_sn=None):
+        self.q = q
+        self.phi = phi
+        self.sn_Ia_rates = sn_Ia_rates
+        self.sn_II_rates = sn_II_rates
+        self.energies = energies
+        self.mass_intervals = mass_intervals
+        self.return_fractions = return_fractions
+        self.sn_yields = sn_yields
+        self.dtd_sn = dtd_sn
+
+    @property
+    def steps(self):
+        return np.shape(self.q)[-3]
+
+    @staticmethod
+    def steps_axis(name, ndim):
+        """
+        Axis of the steps in an array with ndim dimensions: the extra axes for lists of DTDs
+        and sn_yields datasets go before it
+
+        """
+        if name == "q":
+            return ndim - 3
+        if name == "sn_Ia_rates":
+            return ndim - 1
+        return 0
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.arrays if getattr(self, name) is not None}
+
+    def _saved_arrays(self):
+        arrays = self.as_dict()
+        for name in self.labels:
+            if getattr(self, name) is not None:
+                arrays[name] = np.array(getattr(self, name))
+        return arrays
+
+    def save(self, output_dir, output_format="npz"):
+        if output_format == "npz":
+            np.savez(os.path.join(output_dir, NPZ_FILENAME), **self._saved_arrays())
+        elif output_format == "npy-dir":
+            for name, values in self._saved_arrays().items():
+                np.save(os.path.join(output_dir, f"{name}.npy"), values)
+        elif output_format == "mmap":
+            write_qmatrices(os.path.join(output_dir, QMATRICES_FILENAME), self.q, self.mass_intervals, self.sn_yields, self.dtd_sn)
+            arrays = self._saved_arrays()
+            arrays.pop("q")
+            np.savez(os.path.join(output_dir, NPZ_FILENAME), **arrays)
+        else:
+            raise ValueError(f"Invalid binary output format. Should be one of: {OUTPUT_FORMATS[1:]}")
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read results saved as npz (path to the .npz file or to its directory), npy-dir or mmap.
+        Q matrices saved as mmap are loaded as a read-only memory map.
+
+        """
+        q = None
+        if os.path.isdir(path) and os.path.exists(os.path.join(path, QMATRICES_FILENAME)):
+            q = load_qmatrices(path).q
+
+        if os.path.isdir(path) and os.path.exists(os.path.join(path, NPZ_FILENAME)):
+            path = os.path.join(path, NPZ_FILENAME)
+
+        if os.path.isdir(path):
+            arrays = {name: np.load(os.path.join(path, f"{name}.npy"))
+                      for name in cls.arrays + cls.labels if os.path.exists(os.path.join(path, f"{name}.npy"))}
+        else:
+            with np.load(path) as npz_file:
+                arrays = {name: npz_file[name] for name in npz_file.files}
+
+        if q is not None:
+            arrays["q"] = q
+        for name in cls.labels:
+            if name in arrays:
+                arrays[name] = arrays[name].tolist()
+
+        return cls(**arrays)
+
+
+def stack_results(results_list):
+    """
+    Arrays of every Results stacked along a first axis, padded with NaN up to the longest run,
+    and the number of steps of every run.
+    Arrays of runs with lists of DTDs or sn_yields keep their extra axes before the steps axis,
+    so all the runs should have the same lists (a ValueError is raised if their shapes differ in other axes).
+
+    """
+    steps = np.array([results.steps for results in results_list], dtype=int)
+    max_steps = int(np.max(steps, initial=0))
+    names = [name for name in Results.arrays if any(getattr(results, name) is not None for results in results_list)]
+
+    arrays = {"steps": steps}
+    for name in names:
+        shapes = [np.shape(getattr(results, name)) for results in results_list if getattr(results, name) is not None]
+        shape = shapes[0]
+        steps_axis = Results.steps_axis(name, len(shape))
+        item_shapes = {item_shape[:steps_axis] + item_shape[steps_axis + 1:] for item_shape in shapes if len(item_shape) == len(shape)}
+        if len(item_shapes) > 1 or any(len(item_shape) != len(shape) for item_shape in shapes):
+            raise ValueError(f"Results can't be stacked: the shapes of {name} differ in more than the number of steps "
+                             f"({', '.join(sorted(set(str(item_shape) for item_shape in shapes)))})")
+        item_shape = shape[:steps_axis] + (max_steps,) + shape[steps_axis + 1:]
+        stacked = np.full((len(results_list),) + item_shape, np.nan)
+        for i, results in enumerate(results_list):
+            values = getattr(results, name)
+            if values is not None:
+                stacked[(i,) + (slice(None),) * steps_axis + (slice(0, results.steps),)] = values
+        arrays[name] = stacked
+
+    return arrays
@@ -4,6 +4,8 @@ Default settings and initial parameters
 All the values set here can be overwritten via the input file: params.yml
 
 """
+import dataclasses
+from collections.abc import Mapping
 from os.path import dirname, join
 from starmatrix import constants as constants
 from starmatrix import elements
@@ -27,9 +29,16 @@ default = {
     "matrix_headers": True,
     "return_fractions": False,
     "integration_step": "logt",
+    "output_format": "text",
+    "workers": 1,
+    "result_cache": False,
+    "cache_dir": "",
+    "cache_max_size": 1024,
+    "warm_cache": False,
     "deprecation_warnings": True,
     "expelled_elements_filename": join(dirname(__file__), "sample_input", "expelled_elements"),
     "yield_corrections": {},
+    "z_grid": [],
 }
 
 valid_values = {
@@ -46,8 +55,12 @@ valid_values = {
                   "mor2018-1", "mor2018-2"],
     "sol_ab": ["ag89", "gs98", "as05", "as09", "he10", "lo19"],
     "integration_step": ["logt", "t", "two_steps_t", "fixed_n_steps"],
+    "output_format": ["text", "npz", "npy-dir", "mmap"],
 }
 
+# Params that can be a list of valid values (or "all" of them) to get results for each one in the same run
+multiple_values = ["dtd_sn", "sn_yields"]
+
 default_extraparams = {
     "integration_step": {
         "fixed_n_steps": {
@@ -64,6 +77,107 @@ default_extraparams = {
 }
 
 
+# Settings only present for some values of other settings (see default_extraparams) or if set
+optional_settings = ["total_time_steps", "integration_steps_stars_bigger_than_4Msun",
+                     "integration_steps_stars_smaller_than_4Msun", "yield_corrections"]
+
+
+@dataclasses.dataclass(frozen=True, eq=False)
+class ModelConfig(Mapping):
+    """
+    Validated settings of a model (see validate): immutable and hashable, so they can be used as cache keys.
+
+    Settings are read as attributes (config.z) or through the read-only dict interface (config["z"]).
+    Attributes hold lists as tuples, yield_corrections as a tuple of (element, value) pairs
+    and None for the optional settings not set. The dict interface returns lists and dicts,
+    and the optional settings not set are missing from it.
+
+    """
+    __slots__ = ("z", "sol_ab", "imf", "imf_alpha", "imf_m_low", "imf_m_up", "m_min", "m_max", "binary_fraction", "snia_m_max",
+                 "dtd_sn", "dtd_correction_factor", "sn_yields", "output_dir", "matrix_headers", "return_fractions",
+                 "integration_step", "output_format", "workers", "result_cache", "cache_dir", "cache_max_size",
+                 "warm_cache", "deprecation_warnings", "expelled_elements_filename", "yield_corrections", "z_grid", "total_time_steps",
+                 "integration_steps_stars_bigger_than_4Msun", "integration_steps_stars_smaller_than_4Msun")
+
+    z: float
+    sol_ab: str
+    imf: str
+    imf_alpha: float
+    imf_m_low: float
+    imf_m_up: float
+    m_min: float
+    m_max: float
+    binary_fraction: float
+    snia_m_max: float
+    dtd_sn: object
+    dtd_correction_factor: float
+    sn_yields: object
+    output_dir: str
+    matrix_headers: bool
+    return_fractions: bool
+    integration_step: str
+    output_format: str
+    workers: int
+    result_cache: bool
+    cache_dir: str
+    cache_max_size: int
+    warm_cache: bool
+    deprecation_warnings: object
+    expelled_elements_filename: str
+    yield_corrections: tuple
+    z_grid: tuple
+    total_time_steps: int
+    integration_steps_stars_bigger_than_4Msun: int
+    integration_steps_stars_smaller_than_4Msun: int
+
+    def __post_init__(self):
+        for name in self.__slots__:
+            value = getattr(self, name)
+            if isinstance(value, dict):
+                object.__setattr__(self, name, tuple(value.items()))
+            elif isinstance(value, list):
+                object.__setattr__(self, name, tuple(value))
+
+    @classmethod
+    def from_mapping(cls, params):
+        """
+        ModelConfig with the settings in params, using the default values for the missing ones
+
+        """
+        invalid_params = params.keys() - set(cls.__slots__)
+        if invalid_params:
+            raise ValueError(f"Invalid settings: {', '.join(sorted(invalid_params))}")
+
+        return cls(**{name: params[name] if name in params else (None if name in optional_settings else default[name])
+                      for name in cls.__slots__})
+
+    def replace(self, **changes):
+        return dataclasses.replace(self, **changes)
+
+    def __getitem__(self, name):
+        value = getattr(self, name, None) if name in self.__slots__ else None
+        if value is None:
+            raise KeyError(name)
+
+        if name == "yield_corrections":
+            return dict(value)
+        if isinstance(value, tuple):
+            return list(value)
+        return value
+
+    def __iter__(self):
+        return (name for name in self.__slots__ if getattr(self, name) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __hash__(self):
+        return hash(self.__reduce__()[1])
+
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, name) for name in self.__slots__))
+
+
 def default_settings(params=default):
     default_params = default
     params = {**default_params, **params}
@@ -77,21 +191,44 @@ def default_settings(params=default):
 
 
 def validate(params):
+    """
+    ModelConfig with the params, after replacing the invalid values by the default ones
+    and completing them with the default values of the missing settings
+
+    """
     default_params = default_settings(params)
     params = {**default_params, **params}
 
+    for param in multiple_values:
+        if params[param] == "all":
+            params[param] = list(valid_values[param])
+        if isinstance(params[param], list):
+            params[param] = validate_list_of_values(param, params[param], default_params[param])
+
     for param in valid_values.keys():
+        if param in multiple_values and isinstance(params[param], list):
+            continue
         if params[param] not in valid_values[param]:
             print(f"Provided value for {param} is incorrect.")
             print(f"  Valid values for {param} are: {valid_values[param]}")
             print(f"  Using default value: {default_params[param]}")
             params[param] = default_params[param]
 
-    if params["m_max"] > max_mass_allowed(params["z"]):
-        params["m_max"] = max_mass_allowed(params["z"])
-        print(f"Maximum mass is bigger than the allowed mass for z: {params['z']}")
+    if params["z_grid"]:
+        params["z_grid"] = validate_z_grid(params["z_grid"])
+
+    # With a z_grid m_max is limited for every metallicity of the grid when running it (see Model.run_metallicity_grid)
+    grid_max_mass_allowed = max(max_mass_allowed(params["z_grid"] or [params["z"]]))
+    if params["m_max"] > grid_max_mass_allowed:
+        params["m_max"] = float(grid_max_mass_allowed)
+        print(f"Maximum mass is bigger than the allowed mass for z: {params['z_grid'] or params['z']}")
         print(f"  Using m_max value: {params['m_max']} solar masses")
 
+    if type(params["workers"]) is not int or params["workers"] < 1:
+        print(f"Invalid number of workers: {params['workers']}")
+        print(f"  Using default value: {default_params['workers']}")
+        params["workers"] = default_params["workers"]
+
     if params["imf"] == "starburst":
         params["imf_m_low"] = 1.0
         params["imf_m_up"] = 120.0
@@ -109,7 +246,48 @@ def validate(params):
     print("")
     deprecation_warnings(params)
 
-    return params
+    return ModelConfig.from_mapping(params)
+
+
+def validate_list_of_values(param, values, default_value):
+    """
+    Valid values of a list for a param accepting multiple values, without repetitions.
+    Results for every value of the list are computed in the same run.
+
+    """
+    valid_list = []
+    for value in values:
+        if value not in valid_values[param]:
+            print(f"Ignoring invalid value for {param}: {value}")
+        elif value not in valid_list:
+            valid_list.append(value)
+
+    if not valid_list:
+        print(f"No valid values provided for {param}.")
+        print(f"  Valid values for {param} are: {valid_values[param]}")
+        print(f"  Using default value: {default_value}")
+        return default_value
+
+    return valid_list
+
+
+def validate_z_grid(z_grid):
+    """
+    Sorted list of the valid (positive) metallicities of the grid, without repetitions
+
+    """
+    if not isinstance(z_grid, list):
+        print("Invalid z_grid: it should be a list of metallicities")
+        return []
+
+    valid_z = set()
+    for z in z_grid:
+        if type(z) in (int, float) and z > 0:
+            valid_z.add(float(z))
+        else:
+            print(f"Ignoring invalid metallicity in z_grid: {z}")
+
+    return sorted(valid_z)
 
 
 def validate_yield_corrections(corrections):
@@ -0,0 +1,173 @@
+"""
+Parameter sweeps
+
+Runs a model for every combination of values of some settings (the axes of the sweep)
+over a base configuration, in parallel processes, and writes all the results in one output:
+
+* sweep.npz: the arrays of every Results stacked along a first axis (one item per run).
+  Runs with fewer steps than the longest one are padded with NaN, and the steps array
+  contains the number of steps of every run.
+* sweep.yml: the base configuration, the axes and the values of the axes for every run,
+  in the same order as the arrays.
+
+Runs differing only in binary_fraction are computed with one model, combining its mass integrals
+for every binary fraction (see Model.run_binary_fractions).
+
+"""
+
+import contextlib
+import io
+import itertools
+import os
+import yaml
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+import starmatrix.cache as cache
+import starmatrix.settings as settings
+from starmatrix.model import Model
+from starmatrix.results import stack_results
+from starmatrix.settings import ModelConfig
+
+SWEEP_ARRAYS_FILENAME = "sweep.npz"
+SWEEP_INDEX_FILENAME = "sweep.yml"
+
+
+def valid_setting_names():
+    names = set(settings.default.keys())
+    for extraparams in settings.default_extraparams.values():
+        for option_params in extraparams.values():
+            if isinstance(option_params, dict):
+                names.update(option_params.keys())
+    return names
+
+
+def expand_axes(base, axes):
+    """
+    List of configurations, one for every combination of values of the axes (a dict of setting: list of values)
+    applied over the base configuration. The last axis changes fastest.
+
+    """
+    invalid_axes = set(axes.keys()) - valid_setting_names()
+    if invalid_axes:
+        raise ValueError(f"Invalid settings as sweep axes: {', '.join(sorted(invalid_axes))}")
+
+    names = list(axes.keys())
+    return [{**base, **dict(zip(names, values))} for values in itertools.product(*[axes[name] for name in names])]
+
+
+def validate_config(params):
+    """
+    The validated settings (a ModelConfig) of a configuration, without printing the validation messages
+
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        return settings.validate(params)
+
+
+def run_config(params):
+    """
+    Validates the params (unless they are already a validated ModelConfig) and runs a model in memory,
+    without writing output files. If the result_cache setting is on, results are read from (or stored in) the cache.
+
+    """
+    context = params if isinstance(params, ModelConfig) else validate_config(params)
+
+    results_cache = cache.result_cache(context)
+    if results_cache is None:
+        return Model(context).run(write_output=False)
+
+    cache_key = cache.settings_key(context, kind="results")
+    results = results_cache.load_results(cache_key)
+    if results is None:
+        results = Model(context).run(write_output=False)
+        results_cache.store_results(cache_key, results)
+    return results
+
+
+def run_config_group(configs):
+    """
+    Results of validated configurations differing only in binary_fraction, running the model once.
+    If the result_cache setting is on, every configuration is run (or read from the cache) separately.
+
+    """
+    if len(configs) == 1 or cache.result_cache(configs[0]) is not None:
+        return [run_config(config) for config in configs]
+
+    return Model(configs[0]).run_binary_fractions([config.binary_fraction for config in configs])
+
+
+def group_by_binary_fraction(configs):
+    """
+    Lists of indexes of the validated configurations equal except for their binary_fraction
+
+    """
+    groups = {}
+    for i, config in enumerate(configs):
+        groups.setdefault(config.replace(binary_fraction=0.0), []).append(i)
+
+    return list(groups.values())
+
+
+def run_configs(configs, workers=None):
+    """
+    Results of every configuration, in order, using workers processes (by default, the number of CPUs)
+
+    """
+    validated_configs = [validate_config(config) for config in configs]
+    groups = group_by_binary_fraction(validated_configs)
+    grouped_configs = [[validated_configs[i] for i in group] for group in groups]
+
+    if workers == 1 or len(grouped_configs) < 2:
+        grouped_results = [run_config_group(group_configs) for group_configs in grouped_configs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            grouped_results = list(executor.map(run_config_group, grouped_configs))
+
+    results_list = [None] * len(configs)
+    for group, group_results in zip(groups, grouped_results):
+        for i, results in zip(group, group_results):
+            results_list[i] = results
+
+    return results_list
+
+
+def run_sweep(base, axes, output_dir=None, workers=None):
+    """
+    Runs the sweep and, if output_dir is given, writes the consolidated output there.
+    Returns the list of configurations and the list of their Results.
+
+    """
+    configs = expand_axes(base, axes)
+    results_list = run_configs(configs, workers)
+
+    if output_dir is not None:
+        write_sweep(output_dir, base, axes, configs, results_list)
+
+    return configs, results_list
+
+
+def write_sweep(output_dir, base, axes, configs, results_list):
+    os.makedirs(output_dir, exist_ok=True)
+    np.savez(os.path.join(output_dir, SWEEP_ARRAYS_FILENAME), **stack_results(results_list))
+
+    index = {
+        "base": base,
+        "axes": axes,
+        "runs": [{name: config[name] for name in axes.keys()} for config in configs],
+    }
+    with open(os.path.join(output_dir, SWEEP_INDEX_FILENAME), "w") as index_file:
+        yaml.safe_dump(index, index_file, sort_keys=False)
+
+
+def load_sweep(output_dir):
+    """
+    Returns the index (base, axes and runs) and the stacked arrays of a sweep written by write_sweep
+
+    """
+    with open(os.path.join(output_dir, SWEEP_INDEX_FILENAME), "r") as index_file:
+        index = yaml.safe_load(index_file)
+
+    with np.load(os.path.join(output_dir, SWEEP_ARRAYS_FILENAME)) as npz_file:
+        arrays = {name: npz_file[name] for name in npz_file.files}
+
+    return index, arrays
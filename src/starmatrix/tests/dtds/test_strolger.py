@@ -1,5 +1,8 @@
 import pytest
-from starmatrix.dtds import Strolger
+import math
+import numpy as np
+import scipy.integrate
+from starmatrix.dtds import Strolger, strolger_normalization_rate
 
 
 def test_parameters_initialization():
@@ -24,3 +27,38 @@ def test_is_normalized():
 def test_normalization_rate_uses_hubble_efficiency():
     dtd = Strolger(6000, 6000, -2)
     assert dtd.normalization_rate() == 1.03e-3 / dtd.phi_integrated()
+
+
+def test_phi_matches_integral_of_gaussian_kernel():
+    dtd = Strolger(350, 1200, 20)
+    for t in [0.01, 0.3, 1.5, 9.]:
+        u = t * 1e3 - dtd.psi
+        kernel_integral = scipy.integrate.quad(lambda x: math.exp(-x ** 2 / 2), -math.inf, dtd.alpha * u / dtd.omega)[0]
+        expected = (1 / (dtd.omega * math.pi)) * math.exp(-(u ** 2) / (2 * dtd.omega ** 2)) * kernel_integral
+        assert np.isclose(dtd.phi(t), expected, rtol=1e-8)
+
+
+def test_phi_accepts_arrays():
+    dtd = Strolger(110, 1000, 2)
+    times = np.array([0.001, 0.5, 2.0, 13.])
+    phis = dtd.phi(times)
+
+    assert phis.shape == times.shape
+    for i in range(len(times)):
+        assert phis[i] == dtd.phi(times[i])
+
+
+def test_normalization_rate_is_cached_per_parameters_set():
+    strolger_normalization_rate.cache_clear()
+    Strolger(10, 600, 220).normalization_rate()
+    Strolger(10, 600, 220).normalization_rate()
+    Strolger(10, 600, 221).normalization_rate()
+
+    assert strolger_normalization_rate.cache_info().hits == 1
+    assert strolger_normalization_rate.cache_info().misses == 2
+
+
+def test_equality():
+    assert Strolger(10, 600, 220) == Strolger(10, 600, 220)
+    assert hash(Strolger(10, 600, 220)) == hash(Strolger(10, 600, 220))
+    assert Strolger(10, 600, 220) != Strolger(10, 600, 22)
@@ -0,0 +1,202 @@
+import os
+import time
+import pytest
+import numpy as np
+import starmatrix.settings as settings
+import starmatrix.cache as cache
+import starmatrix.dtds as dtds
+import starmatrix.elements as elements
+from starmatrix.imfs import Kroupa2002
+from starmatrix.model import Model
+from starmatrix.results import Results
+
+
+def test_default_cache_dir(monkeypatch):
+    monkeypatch.setenv(cache.CACHE_DIR_ENV_VAR, "/tmp/starmatrix-test-cache")
+    assert cache.default_cache_dir() == "/tmp/starmatrix-test-cache"
+
+    monkeypatch.delenv(cache.CACHE_DIR_ENV_VAR)
+    assert cache.default_cache_dir() == os.path.join(os.path.expanduser("~"), ".cache", "starmatrix")
+
+
+def test_settings_key():
+    context = settings.default_settings()
+    key = cache.settings_key(context)
+
+    assert key == cache.settings_key({**context, "output_dir": "other-results", "result_cache": True})
+    assert key != cache.settings_key({**context, "z": 0.01})
+    assert key != cache.settings_key(context, kind="results")
+
+
+def test_settings_key_depends_on_expelled_file_content(tmp_path):
+    expelled_file = tmp_path / "expelled"
+    expelled_file.write_text("1.0 0.5\n")
+    context = {**settings.default_settings(), "expelled_elements_filename": str(expelled_file)}
+    key = cache.settings_key(context)
+
+    expelled_file.write_text("1.0 0.6\n")
+    os.utime(expelled_file, (time.time() + 10, time.time() + 10))
+
+    assert cache.settings_key(context) != key
+
+
+def test_store_and_restore_files(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path / "cache"))
+    output_dir = tmp_path / "results"
+    output_dir.mkdir()
+    (output_dir / "qm-matrices").write_text("0.1 0.2")
+
+    assert result_cache.restore("abc", str(tmp_path / "restored")) is False
+    result_cache.store("abc", str(output_dir))
+
+    assert result_cache.restore("abc", str(tmp_path / "restored")) is True
+    assert (tmp_path / "restored" / "qm-matrices").read_text() == "0.1 0.2"
+
+
+def test_store_and_load_results(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path))
+    results = Results(q=np.ones((2, 15, 9)), phi=np.ones(2), sn_Ia_rates=np.ones(2), sn_II_rates=np.ones(2),
+                      energies=np.ones(2), mass_intervals=np.ones((2, 2)))
+
+    assert result_cache.load_results("abc") is None
+    result_cache.store_results("abc", results)
+
+    assert np.array_equal(result_cache.load_results("abc").q, results.q)
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path), max_size=0.0025)
+    output_dir = tmp_path.parent / (tmp_path.name + "-output")
+    output_dir.mkdir()
+    (output_dir / "data").write_bytes(b"0" * 1000)
+
+    for key in ["a", "b"]:
+        result_cache.store(key, str(output_dir))
+        os.utime(result_cache.entry_path(key), (time.time() - 100, time.time() - 100))
+    result_cache.lookup("a")
+    result_cache.store("c", str(output_dir))
+
+    assert sorted(result_cache.entries()) == ["a", "c"]
+
+
+def test_failed_writes_do_not_leave_temporary_entries(tmp_path):
+    result_cache = cache.ResultCache(str(tmp_path))
+
+    def failed_write(entry):
+        raise ValueError("Invalid results")
+
+    with pytest.raises(ValueError):
+        result_cache._store_entry("abc", failed_write)
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_entries_evicted_while_read_are_cache_misses(tmp_path, mocker):
+    result_cache = cache.ResultCache(str(tmp_path / "cache"))
+    results = Results(q=np.ones((2, 15, 9)), phi=np.ones(2), sn_Ia_rates=np.ones(2), sn_II_rates=np.ones(2),
+                      energies=np.ones(2), mass_intervals=np.ones((2, 2)))
+    result_cache.store_results("abc", results)
+
+    mocker.patch.object(Results, "load", side_effect=FileNotFoundError)
+    assert result_cache.load_results("abc") is None
+
+    mocker.patch.object(cache.shutil, "copy2", side_effect=FileNotFoundError)
+    assert result_cache.restore("abc", str(tmp_path / "restored")) is False
+
+    mocker.patch.object(cache.os, "utime", side_effect=FileNotFoundError)
+    assert result_cache.lookup("abc") is None
+
+
+def test_result_cache_from_settings(tmp_path):
+    assert cache.result_cache(settings.default) is None
+
+    result_cache = cache.result_cache({**settings.default, "result_cache": True, "cache_dir": str(tmp_path), "cache_max_size": 10})
+    assert result_cache.directory == str(tmp_path)
+    assert result_cache.max_size == 10 * 1024 * 1024
+
+
+@pytest.fixture
+def warm_cache(tmp_path):
+    with cache.using_warm_cache(cache.WarmCache(str(tmp_path))) as warm_cache:
+        yield warm_cache
+
+
+def test_warm_values_are_computed_only_once(warm_cache, mocker):
+    compute = mocker.Mock(return_value={"value": 2.5})
+
+    assert cache.warm_values("test", [1, 2], compute) == {"value": 2.5}
+    assert cache.warm_values("test", [1, 2], compute)["value"] == 2.5
+    assert compute.call_count == 1
+
+    cache.warm_values("test", [1, 3], compute)
+    assert compute.call_count == 2
+    assert len(warm_cache.entries()) == 2
+
+
+def test_warm_values_without_warm_cache(mocker):
+    compute = mocker.Mock(return_value={"value": 2.5})
+    cache.warm_values("test", [1, 2], compute)
+    cache.warm_values("test", [1, 2], compute)
+
+    assert cache.active_warm_cache() is None
+    assert compute.call_count == 2
+
+
+def test_warm_cache_keys_depend_on_version(mocker):
+    key = cache.WarmCache.key("imf", ["Salpeter", 0.1, 100])
+    assert key.startswith("imf-")
+    assert key != cache.WarmCache.key("imf", ["Salpeter", 0.1, 120])
+
+    mocker.patch("starmatrix.__version__", "0.0.0")
+    assert key != cache.WarmCache.key("imf", ["Salpeter", 0.1, 100])
+
+
+def test_precomputations_read_from_warm_cache(warm_cache, mocker):
+    imf = Kroupa2002(settings.default)
+    strolger = dtds.Strolger(10, 600, 220)
+    normalization_rate = dtds.strolger_normalization_rate.__wrapped__(strolger)
+    expelled = elements.cached_expelled.__wrapped__(settings.default["expelled_elements_filename"], 0)
+
+    integration = mocker.spy(Kroupa2002, "integrated_m_phi_in_mass_interval")
+    phi_integrated = mocker.spy(dtds.Strolger, "phi_integrated")
+    parsing = mocker.spy(elements.Expelled, "read_expelled_elements_file")
+
+    assert Kroupa2002(settings.default).normalization_factor == imf.normalization_factor
+    assert dtds.strolger_normalization_rate.__wrapped__(strolger) == normalization_rate
+    cached_expelled = elements.cached_expelled.__wrapped__(settings.default["expelled_elements_filename"], 0)
+    assert np.array_equal(cached_expelled.yields, expelled.yields)
+    assert cached_expelled.by_mass == expelled.by_mass
+
+    assert integration.call_count == 0
+    assert phi_integrated.call_count == 0
+    assert parsing.call_count == 0
+
+
+def test_warm_cache_from_settings(tmp_path, monkeypatch):
+    monkeypatch.setenv(cache.CACHE_DIR_ENV_VAR, str(tmp_path))
+    assert cache.warm_cache(settings.default) is None
+    assert cache.warm_cache({**settings.default, "warm_cache": True}).directory == str(tmp_path / "warm")
+    assert cache.warm_cache({**settings.default, "warm_cache": True}).max_size == cache.WARM_CACHE_MAX_SIZE * 1024 * 1024
+
+    warm_cache = cache.warm_cache({**settings.default, "warm_cache": True, "cache_dir": str(tmp_path / "results"), "cache_max_size": 10})
+    assert warm_cache.directory == str(tmp_path / "results" / cache.WARM_CACHE_DIRNAME)
+    assert warm_cache.max_size == 10 * 1024 * 1024
+    assert cache.ResultCache(str(tmp_path / "results")).entries() == []
+
+
+def test_warm_cache_is_used_only_by_models_with_the_setting_on(tmp_path, mocker):
+    warm_cache = cache.WarmCache(str(tmp_path / cache.WARM_CACHE_DIRNAME))
+    params = {"total_time_steps": 10, "imf": "kroupa2002", "dtd_sn": "strolger-fit1", "cache_dir": str(tmp_path)}
+    dtds.strolger_normalization_rate.cache_clear()
+
+    Model(settings.validate({**params, "warm_cache": True})).run(write_output=False)
+    assert cache.active_warm_cache() is None
+    assert any(name.startswith("imf-") for name in warm_cache.entries())
+    assert any(name.startswith("strolger-") for name in warm_cache.entries())
+
+    warm_values = mocker.spy(cache.WarmCache, "load_values")
+    store_values = mocker.spy(cache.WarmCache, "store_values")
+    Model(settings.validate({**params, "imf": "chabrier"})).run(write_output=False)
+
+    warm_values.assert_not_called()
+    store_values.assert_not_called()
@@ -1,11 +1,17 @@
 import argparse
 import os
 import shutil
+import subprocess
+import sys
 import pytest
 from pytest_mock import mocker
+import starmatrix
+import starmatrix.cache as cache
 import starmatrix.cli as cli
 import starmatrix.model as model
+import starmatrix.readers as readers
 import starmatrix.settings as settings
+import starmatrix.sweep as sweep
 import numpy.random as npr
 
 
@@ -91,3 +97,93 @@ def test_existent_output_directory(mocker, deactivate_os_actions, mock_config_fi
     cli.main()
     os.makedirs.assert_not_called()
     model.Model.assert_called()
+
+
+def test_convert_command(mocker, deactivate_os_actions):
+    argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(command="convert", path="archive", format="mmap", jobs=4)
+    mocker.patch.object(readers, "convert_tree")
+    readers.convert_tree.return_value = ["archive/run-1"]
+
+    assert cli.main() == ["archive/run-1"]
+    readers.convert_tree.assert_called_once_with("archive", "mmap", workers=4)
+    model.Model.assert_not_called()
+
+
+def test_sweep_command(mocker, deactivate_os_actions):
+    argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(command="sweep", config=None, axes="axes.yml", jobs=2)
+    mocker.patch.object(cli, "read_config_file")
+    cli.read_config_file.return_value = {"z": [0.01, 0.02]}
+    mocker.patch.object(sweep, "run_sweep")
+    sweep.run_sweep.return_value = ([{"z": 0.01}, {"z": 0.02}], [])
+
+    assert cli.main() == [{"z": 0.01}, {"z": 0.02}]
+    sweep.run_sweep.assert_called_once_with({}, {"z": [0.01, 0.02]}, output_dir=settings.default["output_dir"], workers=2)
+    model.Model.assert_not_called()
+
+
+def test_results_restored_from_cache(mocker, deactivate_os_actions, tmp_path):
+    mocker.patch.object(cli, "read_config_file")
+    cli.read_config_file.return_value = {"result_cache": True, "cache_dir": str(tmp_path)}
+    argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(generate_config=False, config="cached.yml")
+    mocker.patch.object(cache.ResultCache, "restore")
+    mocker.patch.object(cache.ResultCache, "store")
+
+    cache.ResultCache.restore.return_value = False
+    cli.main()
+    model.Model.assert_called_once()
+    cache.ResultCache.store.assert_called_once()
+
+    cache.ResultCache.restore.return_value = True
+    cli.main()
+    model.Model.assert_called_once()
+    cache.ResultCache.store.assert_called_once()
+
+
+def test_metallicity_grid_writes_a_library(mocker, deactivate_os_actions):
+    mocker.patch.object(cli, "read_config_file")
+    cli.read_config_file.return_value = {"z_grid": [0.02, 0.004], "output_dir": "grid"}
+    argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(generate_config=False, config="grid.yml")
+
+    cli.main()
+    model.Model.return_value.run_metallicity_grid.assert_called_once_with([0.004, 0.02])
+    model.Model.return_value.run_metallicity_grid.return_value.save.assert_called_once_with("grid")
+    model.Model.return_value.run.assert_not_called()
+
+
+def test_metallicity_grid_library_is_cached(mocker, deactivate_os_actions, tmp_path):
+    mocker.patch.object(cli, "read_config_file")
+    cli.read_config_file.return_value = {"z_grid": [0.02, 0.004], "result_cache": True, "cache_dir": str(tmp_path)}
+    argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(generate_config=False, config="grid.yml")
+    mocker.patch.object(cache.ResultCache, "restore", return_value=False)
+    mocker.patch.object(cache.ResultCache, "store")
+
+    cli.main()
+    model.Model.return_value.run_metallicity_grid.return_value.save.assert_called_once()
+    cache.ResultCache.store.assert_called_once()
+
+
+def test_jobs_option_sets_workers(mocker, deactivate_os_actions):
+    argparse.ArgumentParser.parse_args.return_value = argparse.Namespace(generate_config=False, config=None, jobs=4)
+    mocker.spy(settings, "validate")
+
+    cli.main()
+    settings.validate.assert_called_once_with({"workers": 4})
+
+
+def imported_modules(args, cwd):
+    """
+    Top level names of the modules imported by `starmatrix args`, from the output of python -X importtime
+
+    """
+    code = f"import sys; sys.argv = ['starmatrix'] + {args!r}; import starmatrix.cli; starmatrix.cli.main()"
+    env = {**os.environ, "PYTHONPATH": os.path.dirname(os.path.dirname(starmatrix.__file__))}
+    process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd, env=env, capture_output=True, text=True)
+    return {line.split("|")[-1].strip().split(".")[0] for line in process.stderr.splitlines() if line.startswith("import time:")}
+
+
+@pytest.mark.parametrize("args", [["--version"], ["--generate-config"]])
+def test_metadata_commands_do_not_import_scientific_stack(args, tmp_path):
+    modules = imported_modules(args, str(tmp_path))
+
+    assert "starmatrix" in modules
+    assert not modules & {"numpy", "scipy", "yaml"}
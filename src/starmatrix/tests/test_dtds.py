@@ -1,11 +1,14 @@
+import pickle
 import pytest
 import numpy as np
+import scipy.integrate
 import starmatrix.settings as settings
 import starmatrix.functions as functions
 import starmatrix.constants as constants
 from starmatrix.dtds import select_dtd
 from starmatrix.dtds import dtd_capped_at_max_mass
 from starmatrix.dtds import dtd_correction
+from starmatrix.dtds import dtd_integration_table
 from starmatrix.dtds import dtd_ruiz_lapuente
 from starmatrix.dtds import dtd_maoz_graur
 from starmatrix.dtds import dtd_castrillo
@@ -79,3 +82,45 @@ def test_dtd_capped_at_max_mass(available_dtds):
         assert dtd_capped_default_m_max(min_age_default_m_max - 0.001) == 0.0
         assert dtd_capped_default_m_max(min_age_default_m_max) == dtd(min_age_default_m_max)
         assert dtd_capped_default_m_max(lower_mass_age) == dtd(lower_mass_age)
+
+
+def test_dtd_integration_table(available_dtds):
+    min_age = functions.stellar_lifetime(constants.B_MAX, 0.02)
+    for dtd_name in ["rlp", "maoz", "greggio", "greggio-CDD1", "strolger-fit2"]:
+        dtd = select_dtd(dtd_name)
+        table = dtd_integration_table(dtd, 0.02, constants.B_MAX)
+        dtd_capped = dtd_capped_at_max_mass(dtd, 0.02)
+
+        assert table.integral(0.001, min_age) == 0.0
+        for t_inf, t_sup in [(0.01, 0.1), (0.3, 0.45), (1.0, 1.3), (2.0, constants.TOTAL_TIME)]:
+            expected = scipy.integrate.quad(dtd_capped, t_inf, t_sup, points=[min_age], limit=200)[0]
+            assert np.isclose(table.integral(t_inf, t_sup), expected, rtol=1e-6)
+
+
+def test_dtd_integration_table_is_cached():
+    table = dtd_integration_table(dtd_maoz_graur, 0.02, 7)
+    assert dtd_integration_table(dtd_maoz_graur, 0.02, 7) is table
+    assert dtd_integration_table(dtd_maoz_graur, 0.02, 8) is not table
+    assert dtd_integration_table(dtd_maoz_graur, 0.01, 7) is not table
+
+
+def test_dtds_are_vectorized(available_dtds):
+    times = np.concatenate([[-1, 0, 0.001, 0.04, 0.05, 0.12], np.logspace(-3, 1.15, 300)])
+    for dtd_name in available_dtds:
+        dtd = select_dtd(dtd_name)
+        values = dtd(times)
+
+        assert values.shape == times.shape
+        assert isinstance(dtd(0.5), float)
+        assert np.allclose(values, [dtd(t) for t in times], rtol=1e-9, atol=0)
+
+
+def test_dtds_can_be_pickled(available_dtds):
+    for dtd_name in available_dtds:
+        dtd = select_dtd(dtd_name)
+        dtd_capped = dtd_capped_at_max_mass(dtd, 0.02, 7)
+        unpickled = pickle.loads(pickle.dumps(dtd_capped))
+
+        assert pickle.loads(pickle.dumps(dtd)) == dtd
+        assert unpickled == dtd_capped and hash(unpickled) == hash(dtd_capped)
+        assert np.array_equal(unpickled(np.array([0.01, 0.1, 1.0])), dtd_capped(np.array([0.01, 0.1, 1.0])))
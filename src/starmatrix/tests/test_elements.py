@@ -1,7 +1,9 @@
+import pickle
 import pytest
 from pytest_mock import mocker
 import math
 import numpy as np
+import starmatrix.elements as elements
 from starmatrix.elements import Expelled
 import starmatrix.settings as settings
 
@@ -93,3 +95,50 @@ def test_cri_lim_exception(mocker):
     mocker.patch.object(Expelled, "read_expelled_elements_file")
     cri_lim_expelled = Expelled("expelled_CRI-LIM-elements_filename")
     assert cri_lim_expelled.cri_lim_yields is True
+
+
+def test_yields_table(expelled):
+    assert expelled.yields.shape == (80, len(expelled.elements_list))
+    assert expelled.yields.flags["C_CONTIGUOUS"]
+    assert expelled.masses.shape == (80,)
+    assert list(expelled.masses) == expelled.mass_points
+    for i, mass in enumerate(expelled.mass_points):
+        assert list(expelled.yields[i]) == [expelled.by_mass[mass][element] for element in expelled.elements_list]
+
+
+def test_for_masses_matches_for_mass(expelled):
+    masses = np.concatenate([np.random.rand(20) * 100, [0.8, 1, 8, 100, 120]])
+    corrections = {"Mg": 2, "Fe": 3.45}
+
+    for yield_corrections in [{}, corrections]:
+        for_masses = expelled.for_masses(masses, yield_corrections)
+        assert for_masses.shape == (len(masses), len(expelled.elements_list))
+        for i, m in enumerate(masses):
+            for_mass = expelled.for_mass(m, yield_corrections)
+            assert list(for_masses[i]) == [for_mass[element] for element in expelled.elements_list]
+
+
+def test_corrections_vector(expelled):
+    vector = expelled.corrections_vector({"Mg": 2, "Fe": 3.45})
+    assert len(vector) == len(expelled.elements_list)
+    for i, element in enumerate(expelled.elements_list):
+        assert vector[i] == {"Mg": 2, "Fe": 3.45}.get(element, 1.0)
+
+
+def test_load_expelled_parses_each_file_once(mocker):
+    elements.cached_expelled.cache_clear()
+    mocker.spy(Expelled, "read_expelled_elements_file")
+
+    expelled = elements.load_expelled(settings.default["expelled_elements_filename"])
+
+    assert elements.load_expelled(settings.default["expelled_elements_filename"]) is expelled
+    assert Expelled.read_expelled_elements_file.call_count == 1
+
+
+def test_pickled_expelled(expelled):
+    unpickled = pickle.loads(pickle.dumps(expelled))
+
+    assert unpickled.mass_points == expelled.mass_points
+    assert unpickled.by_mass == expelled.by_mass
+    assert np.array_equal(unpickled.yields, expelled.yields)
+    assert unpickled.cri_lim_yields is expelled.cri_lim_yields
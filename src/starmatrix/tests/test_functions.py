@@ -1,5 +1,6 @@
 import pytest
 import numpy as np
+import scipy.integrate
 import starmatrix.functions as functions
 import starmatrix.constants as constants
 import starmatrix.settings as settings
@@ -37,6 +38,24 @@ def test_mean_lifetime_stellar_mass_relation():
     assert np.isclose(functions.stellar_lifetime(stellar_mass, z), lifetime_test, rtol=0.005)
 
 
+def test_stellar_functions_for_arrays():
+    z = 0.02
+    masses = np.array([1, 4, 8, 40])
+    times = np.array([-1, 0, 1e-5, 0.01, 1])
+
+    assert np.allclose(functions.stellar_lifetime(masses, z), [functions.stellar_lifetime(m, z) for m in masses])
+    assert np.allclose(functions.stellar_mass(times[3:], z), [functions.stellar_mass(t, z) for t in times[3:]])
+    assert np.array_equal(functions.total_energy_ejected(times), [functions.total_energy_ejected(t) for t in times])
+
+
+def test_stellar_functions_for_metallicity_arrays():
+    zs = np.array([0.0001, 0.004, 0.02, 0.05])
+
+    assert np.array_equal(functions.max_mass_allowed(zs), [functions.max_mass_allowed(z) for z in zs])
+    assert np.allclose(functions.stellar_lifetime(4.0, zs), [functions.stellar_lifetime(4.0, z) for z in zs])
+    assert np.allclose(functions.stellar_mass(0.15, zs), [functions.stellar_mass(0.15, z) for z in zs])
+
+
 def test_total_energy_no_negative_time_values():
     t = -1
     assert functions.total_energy_ejected(t) == 0.0
@@ -135,3 +154,86 @@ def test_return_fractions():
         )
 
     assert functions.return_fraction(1, 100, stellar_yields, imf) == expected
+
+
+def test_integration_grid_includes_breakpoints():
+    edges = functions.integration_grid(0.8, 40, [0.5, 3, 8, 16, 50])
+
+    assert edges[0] == 0.8
+    assert edges[-1] == 40
+    assert np.all(np.diff(edges) > 0)
+    for breakpoint in [3, 8, 16]:
+        assert breakpoint in edges
+    assert 0.5 not in edges and 50 not in edges
+    assert np.max(np.diff(np.log10(edges))) <= 1.0 / functions.CELLS_PER_DEX
+
+
+def test_integration_table_integrates_polynomials():
+    table = functions.IntegrationTable(functions.integration_grid(1, 10, [2.5]), lambda x: 3 * x ** 2 + 1)
+    a = np.array([1, 1.3, 2.5, 7.77])
+    b = np.array([10, 2.6, 2.5, 9.1])
+
+    assert np.allclose(table.integral(a, b), (b ** 3 + b) - (a ** 3 + a), rtol=1e-12)
+    assert np.isclose(table.integral(2, 3), 20, rtol=1e-12)
+
+
+def test_integration_table_is_zero_outside_grid():
+    table = functions.IntegrationTable(functions.integration_grid(1, 10), lambda x: np.ones(len(x)))
+
+    assert np.isclose(table.integral(0, 20), 9)
+    assert table.integral(0.1, 0.9) == 0
+    assert table.integral(11, 20) == 0
+
+
+def test_integration_table_with_array_values():
+    def f(x):
+        return np.stack([np.ones(len(x)), x, x ** 2], axis=-1)
+
+    table = functions.IntegrationTable(functions.integration_grid(1, 4), f)
+    integrals = table.integral(np.array([1, 2]), np.array([4, 3]))
+
+    assert integrals.shape == (2, 3)
+    assert np.allclose(integrals[0], [3, 7.5, 21])
+    assert np.allclose(integrals[1], [1, 2.5, 19 / 3])
+
+
+def test_integration_table_interpolates_values():
+    table = functions.IntegrationTable(functions.integration_grid(1, 10, [2.5]), lambda x: 3 * x ** 2 + 1)
+    x = np.array([1, 1.3, 2.5, 7.77, 10])
+
+    assert np.allclose(table.interpolate(x), 3 * x ** 2 + 1, rtol=1e-12)
+    assert table.interpolate(0.5) == 0
+    assert table.interpolate(11) == 0
+
+
+def test_binary_imf_tables_match_binary_imfs():
+    imf_name = np.random.choice(settings.valid_values["imf"])
+    imf = select_imf(imf_name, settings.default)
+    primary, secondary = functions.binary_imf_tables(imf)
+
+    assert functions.binary_imf_tables(imf) == (primary, secondary)
+    assert functions.binary_imf_tables(select_imf(imf_name, settings.default)) == (primary, secondary)
+    for m in [2.2, 4, 7.5, 9, 12]:
+        expected_primary = scipy.integrate.quad(functions.phi_primary(m, imf), max(constants.B_MIN, m), min(constants.B_MAX, 2 * m))[0]
+        assert np.isclose(primary.interpolate(m), expected_primary, rtol=1e-8)
+    for m in [1, 2.2, 4, 7.5]:
+        expected_secondary = scipy.integrate.quad(functions.phi_secondary(m, imf), max(constants.B_MIN, 2 * m), constants.M_SNII + m)[0]
+        assert np.isclose(secondary.interpolate(m), expected_secondary, rtol=1e-8)
+    assert primary.interpolate(1) == 0
+    assert secondary.interpolate(9) == 0
+
+
+def test_global_imf_uses_binary_fraction():
+    imf = select_imf(np.random.choice(settings.valid_values["imf"]), settings.default)
+
+    for m in [1, 4, 10]:
+        binaries = functions.global_imf(m, imf, 0.3) - functions.imf_zero(m, imf, 0.3)
+        assert np.isclose(binaries, 2 * (functions.global_imf(m, imf, 0.15) - functions.imf_zero(m, imf, 0.15)))
+
+
+def test_global_imf_for_masses():
+    imf = select_imf(np.random.choice(settings.valid_values["imf"]), settings.default)
+    masses = np.array([0.5, constants.M_MIN, 1, 2.2, 4, 8, 10, 16, 40, 100])
+
+    assert np.allclose(functions.global_imf_for_masses(masses, imf), [functions.global_imf(m, imf) for m in masses], rtol=1e-14)
+    assert np.allclose(functions.imf_supernovae_II_for_masses(masses, imf), [functions.imf_supernovae_II(m, imf) for m in masses], rtol=1e-14)
@@ -1,3 +1,4 @@
+import pickle
 import pytest
 import math
 import numpy as np
@@ -83,3 +84,56 @@ def test_stars_per_mass_unit(available_imfs):
         selected_imf = select_imf(imf)
         expected = selected_imf.normalization_factor * selected_imf.integrated_phi_in_mass_interval()
         assert selected_imf.stars_per_mass_unit == expected
+
+
+def test_for_masses_matches_for_mass(available_imfs):
+    masses = np.concatenate([np.random.random(20) * 100, [-1, 0, 0.014, 0.015, 0.08, 0.5, 1, 2, 8, 35, 90]])
+    for imf in available_imfs:
+        selected_imf = select_imf(imf)
+        values = selected_imf.for_masses(masses)
+
+        assert values.shape == masses.shape
+        assert selected_imf.vectorized_m_phi is True
+        for i in range(len(masses)):
+            assert np.isclose(values[i], selected_imf.for_mass(masses[i]), rtol=1e-12, atol=0)
+
+
+def test_for_masses_falls_back_to_scalar_m_phi():
+    class CustomIMF(Salpeter):
+        def m_phi(self, m):
+            return m ** -1.5 if m > 1 else 0.0
+
+    custom_imf = CustomIMF()
+    masses = np.array([0, 0.5, 1, 2, 50])
+
+    assert custom_imf.vectorized_m_phi is False
+    assert list(custom_imf.for_masses(masses)) == [custom_imf.for_mass(m) for m in masses]
+
+
+def test_maschberger_precomputed_params():
+    maschberger = Maschberger()
+    assert maschberger.a_value == maschberger.a()
+    assert maschberger.mu_value == maschberger.mu()
+    assert maschberger.aalfa_value == maschberger.aalfa()
+    assert maschberger.beta_value == maschberger.beta()
+
+
+def test_pickled_imfs_are_not_normalized_again(mocker, available_imfs):
+    imf_instances = [select_imf(imf, {**settings.default, "imf_alpha": 2.7}) for imf in available_imfs]
+    mocker.spy(IMF, "integrated_m_phi_in_mass_interval")
+
+    for imf_instance in imf_instances:
+        unpickled = pickle.loads(pickle.dumps(imf_instance))
+        assert unpickled.params == {name: value for name, value in imf_instance.params.items() if name.startswith("imf")}
+        assert unpickled.normalization_factor == imf_instance.normalization_factor
+        assert np.array_equal(unpickled.for_masses([0.5, 1, 10]), imf_instance.for_masses([0.5, 1, 10]))
+    IMF.integrated_m_phi_in_mass_interval.assert_not_called()
+
+
+def test_imfs_with_equal_parameters_are_equal():
+    imf = select_imf("salpeter", settings.default)
+
+    assert imf == select_imf("salpeter", {**settings.default, "output_dir": "other"})
+    assert hash(imf) == hash(select_imf("salpeter", settings.default))
+    assert imf != select_imf("salpeter", {**settings.default, "imf_alpha": 2.0})
+    assert imf != select_imf("chabrier", settings.default)
@@ -0,0 +1,87 @@
+import pytest
+import numpy as np
+import starmatrix.constants as constants
+from starmatrix.library import QLibrary, LIBRARY_FILENAME
+import starmatrix.settings as settings
+from starmatrix.model import Model
+from starmatrix.results import Results
+
+
+def results_example(steps, value):
+    return Results(
+        q=np.full((steps, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS), value),
+        phi=np.full(steps, value),
+        sn_Ia_rates=np.full(steps, value),
+        sn_II_rates=np.full(steps, value),
+        energies=np.full(steps, value),
+        mass_intervals=np.full((steps, 2), value),
+    )
+
+
+def library_example():
+    return QLibrary.from_results([0.02, 0.0002, 0.002], [results_example(3, 3.0), results_example(3, 1.0), results_example(2, 2.0)])
+
+
+def test_library_is_sorted_by_z():
+    library = library_example()
+
+    assert len(library) == 3
+    assert np.array_equal(library.z, [0.0002, 0.002, 0.02])
+    assert library.q.shape == (3, 3, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    assert np.array_equal(library.arrays["steps"], [3, 2, 3])
+    assert np.array_equal(library.q[:, 0, 0, 0], [1.0, 2.0, 3.0])
+
+
+def test_interpolate_at_grid_points():
+    library = library_example()
+
+    for z, value, steps in zip(library.z, [1.0, 2.0, 3.0], [3, 2, 3]):
+        results = library.interpolate(z)
+        assert results.steps == steps
+        assert np.all(results.q == value)
+        assert np.all(results.phi == value)
+        assert np.all(results.mass_intervals == value)
+
+
+def test_interpolate_linear_in_log_z():
+    library = library_example()
+
+    results = library.interpolate(0.02 * 10 ** -0.25)
+    assert results.steps == 2
+    assert np.allclose(results.q, 2.75)
+    assert np.allclose(results.mass_intervals, 2.75)
+    assert np.allclose(library.interpolate(0.002 * 10 ** 0.5).sn_Ia_rates, 2.5)
+
+
+def test_interpolated_mass_intervals_follow_the_runs():
+    params = {"total_time_steps": 20}
+    library = Model(settings.validate({**params, "z_grid": [0.008, 0.02]})).run_metallicity_grid([0.008, 0.02])
+    expected = Model(settings.validate({**params, "z": 0.0126})).run(write_output=False)
+
+    results = library.interpolate(0.0126)
+    assert results.mass_intervals.shape == expected.mass_intervals.shape
+    assert np.allclose(results.mass_intervals, expected.mass_intervals, rtol=0.005)
+    assert not np.array_equal(library.arrays["mass_intervals"][0], library.arrays["mass_intervals"][1])
+
+
+def test_interpolate_outside_grid():
+    library = library_example()
+
+    with pytest.raises(ValueError):
+        library.interpolate(0.0001)
+    with pytest.raises(ValueError):
+        library.interpolate(0.03)
+
+
+def test_save_and_load_library(tmp_path):
+    library = library_example()
+    library.labels = {"sn_yields": ["iwa1998", "sei2013"]}
+    library.save(str(tmp_path))
+
+    assert (tmp_path / LIBRARY_FILENAME).exists()
+
+    loaded = QLibrary.load(str(tmp_path))
+    assert np.array_equal(loaded.z, library.z)
+    assert loaded.labels == library.labels
+    for name, values in library.arrays.items():
+        assert np.array_equal(loaded.arrays[name], values, equal_nan=True)
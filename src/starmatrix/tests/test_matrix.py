@@ -70,9 +70,11 @@ def test_q_applies_yield_corrections(mocker):
                 "yield_corrections": {"Mg": 2, "Fe": 3.45}
             }
 
-    mocker.spy(expelled, "for_mass")
+    mocker.spy(expelled, "for_masses")
     q = matrix.q(m, test_settings)
-    expelled.for_mass.assert_called_once_with(m, {"Mg": 2, "Fe": 3.45})
+    expelled.for_masses.assert_called_once()
+    assert expelled.for_masses.call_args[0][0].tolist() == [m]
+    assert expelled.for_masses.call_args[0][1] == {"Mg": 2, "Fe": 3.45}
 
 
 def test_q_with_no_yield_corrections(mocker):
@@ -84,9 +86,10 @@ def test_q_with_no_yield_corrections(mocker):
                 "expelled": expelled,
             }
 
-    mocker.spy(expelled, "for_mass")
+    mocker.spy(expelled, "for_masses")
     q = matrix.q(m, test_settings)
-    expelled.for_mass.assert_called_once_with(m, {})
+    expelled.for_masses.assert_called_once()
+    assert expelled.for_masses.call_args[0][1] == {}
 
 
 def test_cri_lim_exception(mocker):
@@ -108,3 +111,46 @@ def test_cri_lim_exception(mocker):
     q = matrix.q(4, test_settings)
 
     abundances.Abundances.corrected_abundance_CRI_LIM.assert_called_once()
+
+
+def test_q_batch_size():
+    masses = np.array([0.5, 0.8, 1, 2, 4, 6, 8, 10, 40, 90])
+    test_settings = {
+        "z": 0.02,
+        "abundances": abundances.select_abundances(np.random.choice(settings.valid_values["sol_ab"]), 0.02),
+        "expelled": elements.Expelled(settings.default["expelled_elements_filename"]),
+    }
+
+    q = matrix.q_batch(masses, test_settings)
+
+    assert q.shape == (len(masses), constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    assert np.all(q[0] == 0)
+
+
+def test_q_is_q_batch_for_one_mass():
+    masses = np.array([0.7, 1.5, 2, 3, 5, 8, 15, 25, 50, 60])
+    test_settings = {
+        "z": 0.02,
+        "abundances": abundances.select_abundances(np.random.choice(settings.valid_values["sol_ab"]), 0.02),
+        "expelled": elements.Expelled(settings.default["expelled_elements_filename"]),
+        "yield_corrections": {"Mg": 2, "remnants": 1.3, "H": 0.9},
+    }
+
+    q_batch = matrix.q_batch(masses, test_settings)
+
+    for i in range(len(masses)):
+        assert np.array_equal(q_batch[i], matrix.q(masses[i], test_settings))
+
+
+def test_q_batch_with_precomputed_yields():
+    masses = np.array([0.5, 1.2, 4, 9.5, 30])
+    test_settings = {
+        "z": 0.02,
+        "abundances": abundances.select_abundances(np.random.choice(settings.valid_values["sol_ab"]), 0.02),
+        "expelled": elements.Expelled(settings.default["expelled_elements_filename"]),
+        "yield_corrections": {"Mg": 2, "remnants": 1.3},
+    }
+
+    yields = test_settings["expelled"].for_masses(masses)
+
+    assert np.array_equal(matrix.q_batch(masses, test_settings, yields=yields), matrix.q_batch(masses, test_settings))
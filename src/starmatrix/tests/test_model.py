@@ -1,9 +1,16 @@
+import pickle
 import pytest
+from concurrent.futures import ThreadPoolExecutor
 from pytest_mock import mocker
 
 import numpy
+import numpy as np
+import scipy.integrate
 import starmatrix.model
+import starmatrix.constants as constants
+import starmatrix.parallel as parallel
 from starmatrix.model import Model
+from starmatrix.time_grids import TimeGrid
 import starmatrix.settings as settings
 import starmatrix.imfs as imfs
 import starmatrix.functions as functions
@@ -185,6 +192,18 @@ def test_explosive_nucleosynthesis_fixed_n_steps(mocker, deactivate_open_files):
     mocked_file.assert_called_once_with(f"{settings.default['output_dir']}/mass_intervals", "w+")
 
 
+def test_explosive_nucleosynthesis_for_custom_grid(mocker, deactivate_open_files):
+    mocked_file = deactivate_open_files
+    model = Model(settings.default)
+    model.explosive_nucleosynthesis_for_grid(TimeGrid([0.01, 0.03, 0.1, 1.0, 10.0]))
+
+    assert model.total_time_steps == 4
+    assert len(model.energies) == len(model.sn_Ia_rates) == 4
+    assert model.mass_intervals[1] == [functions.stellar_mass(0.1, model.z), functions.stellar_mass(0.03, model.z)]
+    assert np.isclose(model.sn_Ia_rates[2], model._dtd_integral(0.1, 1.0))
+    mocked_file.assert_called_once_with(f"{settings.default['output_dir']}/mass_intervals", "w+")
+
+
 def test_create_q_matrices(mocker, deactivate_open_files):
     mocker.spy(functions, "newton_cotes")
     mocked_file = deactivate_open_files
@@ -222,17 +241,47 @@ def test_create_q_matrices_all_zeros_files_if_wrong_data(mocker, deactivate_open
     assert numpy.savetxt.call_count == model.total_time_steps
 
 
+def test_create_q_matrices_returns_results(mocker, deactivate_open_files):
+    model = Model({**settings.default, **{"return_fractions": True}})
+    model.total_time_steps = 3
+    model.mass_intervals = [[1., 8.], [8., 33.], [8., 2.]]
+    model.sn_Ia_rates = [2e-4, 1e-4, 0.0]
+    model.energies = [3e-4, 1.2e-4, 0.0]
+
+    results = model.create_q_matrices()
+
+    assert results is model.results
+    assert results.q.shape == (3, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    assert np.array_equal(results.mass_intervals, model.mass_intervals)
+    assert np.array_equal(results.energies, model.energies)
+    assert results.return_fractions[0] > 0
+    assert np.all(results.q[2] == 0)
+    assert results.phi[2] == results.sn_Ia_rates[2] == results.sn_II_rates[2] == results.return_fractions[2] == 0
+
+
+def test_binary_output_format(mocker, deactivate_open_files):
+    mocked_file = deactivate_open_files
+    mocker.patch("starmatrix.results.Results.save")
+    mocker.spy(numpy, "savetxt")
+    model = Model(settings.validate({"output_format": "npz"}))
+    model.explosive_nucleosynthesis()
+    model.create_q_matrices()
+
+    mocked_file.assert_not_called()
+    assert numpy.savetxt.call_count == 0
+    model.results.save.assert_called_once_with(settings.default["output_dir"], "npz")
+
+
 def test_matrix_header():
     model = Model(settings.default)
     assert model.context["matrix_headers"] is True
-    assert model._matrix_header(100, 1) == "Q matrix for mass interval: [100, 1]"
+    assert parallel.matrix_header(100, 1, model.config.matrix_headers) == "Q matrix for mass interval: [100, 1]"
 
-    model.context["matrix_headers"] = False
-    assert model._matrix_header(100, 1) == ""
+    model.update(matrix_headers=False)
+    assert parallel.matrix_header(100, 1, model.config.matrix_headers) == ""
 
 
 def test_return_fractions(mocker, deactivate_open_files):
-    mocker.spy(functions, "return_fraction")
     mocked_file = deactivate_open_files
     model = Model({**settings.default, **{"return_fractions": True}})
     model.total_time_steps = 2
@@ -247,4 +296,225 @@ def test_return_fractions(mocker, deactivate_open_files):
              mocker.call(f"{settings.default['output_dir']}/qm-matrices", "w+"),
              mocker.call(f"{settings.default['output_dir']}/return_fractions", "w+")]
     mocked_file.assert_has_calls(calls)
-    functions.return_fraction.assert_has_calls
+    expected_r = scipy.integrate.quad(
+        lambda m: (functions.global_imf(m, model.initial_mass_function) / m) * (m - model.context["expelled"].for_mass(m)["remnants"]),
+        1., 8., points=[1.5, 3.0] + [m for m in model.context["expelled"].mass_points if 1. < m < 8.], limit=200)[0]
+    assert np.isclose(model._mass_integrals()["return_fraction"][0], expected_r, rtol=1e-6)
+
+
+def test_create_q_matrices_evaluates_all_nodes_in_one_batch(mocker, deactivate_open_files):
+    mocker.spy(starmatrix.matrix, "q_batch")
+    mocker.spy(starmatrix.matrix, "q")
+    model = Model(settings.default)
+    model.total_time_steps = 3
+    model.mass_intervals = [[1., 8.], [8., 33.], [0., 0.1]]
+    model.sn_Ia_rates = [2e-4, 1e-4, 0.0]
+    model.energies = [3e-4, 1.2e-4, 0.0]
+
+    model.create_q_matrices()
+
+    assert starmatrix.matrix.q_batch.call_count == 1
+    assert starmatrix.matrix.q.call_count == 0
+
+
+def test_mass_integrals_use_cumulative_tables():
+    model = Model(settings.default)
+    model.total_time_steps = 3
+    model.mass_intervals = [[1., 8.], [8., 33.], [8., 2.]]
+
+    integrals = model._mass_integrals()
+    binary_fraction = model.context["binary_fraction"]
+    imf_totals = model._imf_integration_table(model.m_max).integral(np.array([1.]), np.array([33.]))
+    mass_totals = model._mass_integration_table(model.m_max).integral(np.array([1.]), np.array([33.]))
+    totals = {**model._split_imf_integrands(imf_totals, binary_fraction), **model._split_mass_integrands(mass_totals, binary_fraction)}
+
+    assert integrals["q"].shape == (3, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    for name, total in totals.items():
+        assert np.allclose(integrals[name][0] + integrals[name][1], total[0], rtol=1e-10, atol=1e-15)
+
+    expected_phi = scipy.integrate.quad(lambda m: functions.global_imf(m, model.initial_mass_function),
+                                        8., 33., points=functions.IMF_MASS_BREAKPOINTS)[0]
+    assert np.isclose(integrals["phi"][1], expected_phi, rtol=1e-6)
+
+
+def test_run_without_writing_output(mocker, deactivate_open_files):
+    mocked_file = deactivate_open_files
+    model = Model(settings.validate({"total_time_steps": 10}))
+
+    results = model.run(write_output=False)
+
+    assert results.steps == 10
+    mocked_file.assert_not_called()
+
+
+def test_dependent_stages():
+    assert starmatrix.model.dependent_stages(settings=["sn_yields"]) == ["sn_ia_q"]
+    assert starmatrix.model.dependent_stages(settings=["dtd_sn"]) == ["dtd_rates"]
+    assert starmatrix.model.dependent_stages(settings=["output_dir"]) == []
+    assert starmatrix.model.dependent_stages(stages=["time_grid"]) == ["time_grid", "dtd_rates", "imf_integrals", "stellar_q_integrals"]
+    assert starmatrix.model.dependent_stages(settings=["imf"]) == ["imf_integrals", "stellar_q_integrals"]
+
+
+def test_update_only_recomputes_invalidated_stages(mocker, deactivate_open_files):
+    model = Model(settings.validate({"total_time_steps": 20}))
+    model.run(write_output=False)
+
+    mocker.spy(Model, "_stellar_q_integrals_stage")
+    mocker.spy(Model, "_imf_integrals_stage")
+    mocker.spy(Model, "explosive_nucleosynthesis")
+
+    assert model.update(sn_yields="sei2013", dtd_sn="maoz") == ["dtd_rates", "sn_ia_q"]
+    results = model.run(write_output=False)
+
+    Model._stellar_q_integrals_stage.assert_not_called()
+    Model._imf_integrals_stage.assert_not_called()
+    Model.explosive_nucleosynthesis.assert_not_called()
+
+    expected = Model(settings.validate({"total_time_steps": 20, "sn_yields": "sei2013", "dtd_sn": "maoz"})).run(write_output=False)
+    for name, values in expected.as_dict().items():
+        assert np.allclose(getattr(results, name), values, rtol=1e-12, atol=0)
+
+
+def test_update_time_grid_settings(mocker, deactivate_open_files):
+    model = Model(settings.validate({"total_time_steps": 20}))
+    model.run(write_output=False)
+
+    assert model.update(total_time_steps=10, output_dir="other") == ["time_grid", "dtd_rates", "imf_integrals", "stellar_q_integrals"]
+    results = model.run(write_output=False)
+
+    assert results.steps == model.total_time_steps == 10
+    assert model.update(total_time_steps=10) == []
+
+
+def test_run_binary_fractions(deactivate_open_files):
+    model = Model(settings.validate({"total_time_steps": 15, "return_fractions": True}))
+    results_list = model.run_binary_fractions([0.0, 0.15, 0.4])
+
+    assert model.update(binary_fraction=0.4) == []
+    for binary_fraction, results in zip([0.0, 0.15, 0.4], results_list):
+        expected = Model(settings.validate({"total_time_steps": 15, "return_fractions": True,
+                                            "binary_fraction": binary_fraction})).run(write_output=False)
+        for name, values in expected.as_dict().items():
+            assert np.allclose(getattr(results, name), values, rtol=1e-12, atol=1e-300)
+    deactivate_open_files.assert_not_called()
+
+
+def test_run_metallicity_grid(deactivate_open_files):
+    context = settings.validate({"total_time_steps": 10, "m_max": 100.0})
+    zs = [0.02, 0.0001, 0.004]
+    model = Model(context)
+
+    library = model.run_metallicity_grid(zs)
+
+    assert np.array_equal(library.z, sorted(zs))
+    assert library.q.shape == (3, 10, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    assert model.context["z"] == 0.02 and model.context["m_max"] == context["m_max"]
+    for i, z in enumerate(library.z):
+        expected = Model(settings.validate({"total_time_steps": 10, "m_max": 100.0, "z": z})).run(write_output=False)
+        for name, values in expected.as_dict().items():
+            assert np.allclose(library.arrays[name][i], values, rtol=1e-12, atol=1e-300)
+    deactivate_open_files.assert_not_called()
+
+
+def test_metallicity_grid_limits_m_max_for_every_z(deactivate_open_files):
+    # The maximum mass allowed for z=0.05 is lower than m_max, but not for the rest of metallicities
+    zs = [0.0001, 0.02, 0.05]
+    params = {"total_time_steps": 10, "z": 0.05, "m_max": 100.0}
+    expected = [Model(settings.validate({**params, "z": z})).run(write_output=False) for z in zs]
+
+    libraries = [Model(settings.validate({**params, "z_grid": zs})).run_metallicity_grid(zs),
+                 Model(settings.validate(params)).run_metallicity_grid(zs, m_max=100.0)]
+
+    for library in libraries:
+        for i, results in enumerate(expected):
+            assert np.array_equal(library.arrays["mass_intervals"][i], results.mass_intervals)
+            assert np.allclose(library.q[i], results.q, rtol=1e-12, atol=1e-300)
+
+
+def test_models_do_not_modify_settings():
+    context = settings.validate({"total_time_steps": 10})
+    original = dict(context)
+    model = Model(context)
+    model.update(sn_yields="sei2013")
+
+    assert context == original
+    assert model.config.sn_yields == "sei2013"
+    assert model.context["abundances"] is model.abundances
+    with pytest.raises(TypeError):
+        model.context["z"] = 0.01
+
+
+def test_model_accepts_dicts():
+    model = Model({**settings.default, "total_time_steps": 12})
+
+    assert model.config == settings.ModelConfig.from_mapping({**settings.default, "total_time_steps": 12})
+    assert model.total_time_steps == 12
+
+
+def test_models_in_threads_sharing_settings():
+    context = settings.validate({"total_time_steps": 10})
+    overrides = [{"z": 0.004}, {"z": 0.02, "sn_yields": "sei2013"}, {"imf": "salpeter"}, {"dtd_sn": "maoz"}]
+
+    def run(model_overrides):
+        model = Model(context)
+        model.update(**model_overrides)
+        return model.run(write_output=False)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results_list = list(executor.map(run, overrides))
+
+    for model_overrides, results in zip(overrides, results_list):
+        expected = Model(settings.validate({"total_time_steps": 10, **model_overrides})).run(write_output=False)
+        for name, values in expected.as_dict().items():
+            assert np.array_equal(getattr(results, name), values)
+
+
+def test_pickled_model_reuses_its_stages(mocker, deactivate_open_files):
+    model = Model(settings.validate({"total_time_steps": 10, "dtd_sn": "strolger-fit1", "return_fractions": True}))
+    results = model.run(write_output=False)
+
+    unpickled = pickle.loads(pickle.dumps(model))
+    assert not hasattr(unpickled, "results")
+    assert set(unpickled.stages.keys()) == set(model.stages.keys())
+
+    mocker.spy(Model, "stage")
+    mocker.spy(Model, "_stellar_q_integrals_stage")
+    for name, values in unpickled.run(write_output=False).as_dict().items():
+        assert np.array_equal(values, getattr(results, name))
+    Model._stellar_q_integrals_stage.assert_not_called()
+
+
+def test_run_with_several_sn_yields_datasets(deactivate_open_files):
+    mocked_file = deactivate_open_files
+    datasets = ["iwa1998", "sei2013", "ln2020"]
+    model = Model(settings.validate({"total_time_steps": 12, "sn_yields": datasets}))
+
+    results = model.run()
+
+    assert results.q.shape == (3, 12, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    assert results.steps == 12
+    assert results.sn_yields == datasets
+    for i, sn_yields in enumerate(datasets):
+        expected = Model(settings.validate({"total_time_steps": 12, "sn_yields": sn_yields})).run(write_output=False)
+        assert expected.sn_yields is None
+        assert np.allclose(results.q[i], expected.q, rtol=1e-12, atol=0)
+        mocked_file.assert_any_call(f"{settings.default['output_dir']}/qm-matrices-{sn_yields}", "w+")
+
+
+def test_run_with_several_dtds(deactivate_open_files):
+    mocked_file = deactivate_open_files
+    dtds_sn = ["rlp", "greggio-CDD04", "strolger-fit1"]
+    datasets = ["iwa1998", "sei2013"]
+    model = Model(settings.validate({"total_time_steps": 12, "dtd_sn": dtds_sn, "sn_yields": datasets}))
+
+    results = model.run()
+
+    assert results.q.shape == (3, 2, 12, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    assert results.sn_Ia_rates.shape == (3, 12)
+    assert results.dtd_sn == dtds_sn
+    for i, dtd_sn in enumerate(dtds_sn):
+        expected = Model(settings.validate({"total_time_steps": 12, "dtd_sn": dtd_sn, "sn_yields": datasets})).run(write_output=False)
+        assert np.array_equal(results.sn_Ia_rates[i], expected.sn_Ia_rates)
+        assert np.allclose(results.q[i], expected.q, rtol=1e-12, atol=0)
+        mocked_file.assert_any_call(f"{settings.default['output_dir']}/imf_supernova_rates-{dtd_sn}", "w+")
+        mocked_file.assert_any_call(f"{settings.default['output_dir']}/qm-matrices-{dtd_sn}-sei2013", "w+")
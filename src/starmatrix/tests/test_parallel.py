@@ -0,0 +1,44 @@
+import numpy as np
+import starmatrix.constants as constants
+import starmatrix.parallel as parallel
+
+
+def test_step_chunks():
+    assert parallel.step_chunks(10, 4) == [(0, 10)]
+    assert parallel.step_chunks(1000, 1) == [(0, 1000)]
+    assert parallel.step_chunks(1000, 4) == [(0, 500), (500, 1000)]
+    assert parallel.step_chunks(2001, 3) == [(0, 667), (667, 1334), (1334, 2001)]
+
+
+def test_matrix_header():
+    assert parallel.matrix_header(100, 1) == "Q matrix for mass interval: [100, 1]"
+    assert parallel.matrix_header(100, 1, False) == ""
+
+
+def test_parallel_output_is_written_in_step_order(mocker, tmp_path):
+    mocker.patch.object(parallel, "MIN_STEPS_PER_WORKER", 4)
+    q_stacks = np.random.rand(2, 13, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    mass_intervals = np.sort(np.random.rand(13, 2) * 40).tolist()
+
+    for workers in [1, 3]:
+        matrices_files = [open(tmp_path / f"qm-matrices-{workers}-{i}", "w+") for i in range(2)]
+        parallel.write_matrices_files(matrices_files, q_stacks, mass_intervals, True, workers)
+        for matrices_file in matrices_files:
+            matrices_file.close()
+
+    for i in range(2):
+        assert (tmp_path / f"qm-matrices-1-{i}").read_text() == (tmp_path / f"qm-matrices-3-{i}").read_text()
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(f"qm-matrices-{workers}-{i}" for workers in [1, 3] for i in range(2))
+
+
+def test_output_is_written_serially_without_shared_memory(mocker, tmp_path):
+    mocker.patch.object(parallel, "MIN_STEPS_PER_WORKER", 4)
+    mocker.patch.object(parallel, "shared_memory", None)
+    executor = mocker.patch.object(parallel, "ProcessPoolExecutor")
+    q_stacks = np.random.rand(1, 13, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+
+    with open(tmp_path / "qm-matrices", "w") as matrices_file:
+        parallel.write_matrices_files([matrices_file], q_stacks, np.ones((13, 2)).tolist(), True, 3)
+
+    executor.assert_not_called()
+    assert (tmp_path / "qm-matrices").read_text().count("Q matrix for mass interval") == 13
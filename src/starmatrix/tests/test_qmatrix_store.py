@@ -0,0 +1,66 @@
+import pytest
+import numpy as np
+import starmatrix
+import starmatrix.constants as constants
+import starmatrix.qmatrix_store as qmatrix_store
+from starmatrix.matrix import q_index
+
+
+def store_example(path, steps=4):
+    q = np.random.rand(steps, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    mass_intervals = np.random.rand(steps, 2)
+    qmatrix_store.write_qmatrices(str(path), q, mass_intervals)
+    return q, mass_intervals
+
+
+def test_load_qmatrices_as_memory_map(tmp_path):
+    path = tmp_path / qmatrix_store.QMATRICES_FILENAME
+    q, mass_intervals = store_example(path)
+
+    store = starmatrix.load_qmatrices(str(path))
+
+    assert isinstance(store.q, np.memmap)
+    assert not store.q.flags.writeable
+    assert np.array_equal(store.q, q)
+    assert np.array_equal(store.mass_intervals, mass_intervals)
+    assert len(store) == 4
+    assert np.array_equal(store[2], q[2])
+    assert store.rows.index("Fe") == q_index("Fe")
+    assert store.columns == store.rows[:constants.Q_MATRIX_COLUMNS]
+    assert store.q.offset % qmatrix_store.ALIGNMENT == 0
+
+
+def test_load_qmatrices_in_memory(tmp_path):
+    q, _ = store_example(tmp_path / qmatrix_store.QMATRICES_FILENAME)
+
+    store = qmatrix_store.load_qmatrices(str(tmp_path), mmap=False)
+
+    assert not isinstance(store.q, np.memmap)
+    assert np.array_equal(store.q, q)
+
+
+def test_store_with_several_dtds_is_indexed_by_step(tmp_path):
+    q = np.random.rand(2, 3, 5, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    qmatrix_store.write_qmatrices(str(tmp_path / "store"), q, np.random.rand(5, 2), sn_yields=["iwa1998", "sei2013", "ctm2015"],
+                                  dtd_sn=["rlp", "maoz"])
+
+    store = qmatrix_store.load_qmatrices(str(tmp_path / "store"))
+
+    assert store.dtd_sn == ["rlp", "maoz"]
+    assert len(store) == 5
+    assert np.array_equal(store[4], q[:, :, 4])
+    assert store[1:3].shape == (2, 3, 2, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+
+
+def test_empty_store(tmp_path):
+    store_example(tmp_path / "empty", steps=0)
+
+    assert len(qmatrix_store.load_qmatrices(str(tmp_path / "empty"))) == 0
+
+
+def test_load_invalid_file(tmp_path):
+    path = tmp_path / "qm-matrices"
+    path.write_text("0.0 0.0")
+
+    with pytest.raises(ValueError):
+        qmatrix_store.load_qmatrices(str(path))
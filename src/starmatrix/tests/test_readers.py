@@ -0,0 +1,83 @@
+import os
+import pytest
+import numpy as np
+import starmatrix.settings as settings
+import starmatrix.readers as readers
+from starmatrix.model import Model
+from starmatrix.results import Results
+
+
+def run_text_model(output_dir, params={}):
+    os.makedirs(output_dir, exist_ok=True)
+    return Model(settings.validate({**params, "output_dir": str(output_dir)})).run()
+
+
+@pytest.mark.parametrize("matrix_headers", [True, False])
+def test_read_qmatrices(tmp_path, matrix_headers):
+    results = run_text_model(tmp_path, {"matrix_headers": matrix_headers, "total_time_steps": 20})
+
+    q = readers.read_qmatrices(str(tmp_path / "qm-matrices"))
+
+    assert q.shape == results.q.shape
+    assert np.allclose(q, results.q, rtol=0, atol=1e-10)
+
+
+def test_read_text_results(tmp_path):
+    results = run_text_model(tmp_path, {"return_fractions": True, "total_time_steps": 20})
+
+    loaded = readers.read_text_results(str(tmp_path))
+
+    for name, values in results.as_dict().items():
+        assert np.allclose(getattr(loaded, name), values, rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize("integration_step,header_size", [("logt", 4), ("t", 4), ("two_steps_t", 6), ("fixed_n_steps", 6)])
+def test_read_mass_intervals(tmp_path, integration_step, header_size):
+    results = run_text_model(tmp_path, {"integration_step": integration_step})
+
+    header, mass_intervals = readers.read_mass_intervals(str(tmp_path / "mass_intervals"))
+
+    assert len(header) == header_size
+    assert np.allclose(mass_intervals, results.mass_intervals, rtol=0, atol=1e-10)
+
+
+def test_convert_tree(tmp_path):
+    for name in ["run-1", "campaign/run-2"]:
+        run_text_model(tmp_path / name, {"total_time_steps": 10})
+
+    converted = readers.convert_tree(str(tmp_path), "npz", workers=2)
+
+    assert converted == [str(tmp_path / "campaign/run-2"), str(tmp_path / "run-1")]
+    for directory in converted:
+        assert np.allclose(Results.load(directory).q, readers.read_qmatrices(os.path.join(directory, "qm-matrices")))
+
+
+def test_read_text_results_with_sn_yields_datasets(tmp_path):
+    results = run_text_model(tmp_path, {"sn_yields": ["sei2013", "iwa1998"], "total_time_steps": 10})
+
+    loaded = readers.read_text_results(str(tmp_path))
+
+    assert sorted(os.listdir(tmp_path))[-2:] == ["qm-matrices-iwa1998", "qm-matrices-sei2013"]
+    assert readers.results_directories(str(tmp_path)) == [str(tmp_path)]
+    assert loaded.sn_yields == ["iwa1998", "sei2013"]
+    assert np.allclose(loaded.q, results.q[::-1], rtol=0, atol=1e-10)
+
+
+def test_read_text_results_with_several_dtds(tmp_path):
+    results = run_text_model(tmp_path, {"dtd_sn": ["greggio", "greggio-CDD04"], "sn_yields": ["iwa1998", "ln2018-1"], "total_time_steps": 10})
+
+    loaded = readers.read_text_results(str(tmp_path))
+
+    assert loaded.dtd_sn == ["greggio", "greggio-CDD04"]
+    assert loaded.sn_yields == ["iwa1998", "ln2018-1"]
+    assert np.allclose(loaded.q, results.q, rtol=0, atol=1e-10)
+    assert np.allclose(loaded.sn_Ia_rates, results.sn_Ia_rates, rtol=0, atol=1e-10)
+
+
+@pytest.mark.parametrize("filename", [readers.IMF_SUPERNOVA_RATES_FILE, readers.QMATRICES_FILE])
+def test_read_text_results_with_missing_files(tmp_path, filename):
+    run_text_model(tmp_path, {"total_time_steps": 10})
+    os.remove(tmp_path / filename)
+
+    with pytest.raises(FileNotFoundError, match=filename):
+        readers.read_text_results(str(tmp_path))
@@ -0,0 +1,86 @@
+import pytest
+import numpy as np
+import starmatrix.constants as constants
+from starmatrix.results import Results, stack_results
+
+
+def results_example(return_fractions=None):
+    return Results(
+        q=np.random.rand(3, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS),
+        phi=np.random.rand(3),
+        sn_Ia_rates=np.random.rand(3),
+        sn_II_rates=np.random.rand(3),
+        energies=np.random.rand(3),
+        mass_intervals=np.array([[38.6, 40.], [37.3, 38.6], [36.1, 37.3]]),
+        return_fractions=return_fractions,
+    )
+
+
+def test_results_as_dict():
+    results = results_example()
+
+    assert results.steps == 3
+    assert "return_fractions" not in results.as_dict()
+    assert set(results_example(np.random.rand(3)).as_dict().keys()) == set(Results.arrays)
+
+
+@pytest.mark.parametrize("output_format", ["npz", "npy-dir"])
+def test_save_and_load_results(tmp_path, output_format):
+    results = results_example(np.random.rand(3))
+    results.save(tmp_path, output_format)
+
+    loaded = Results.load(str(tmp_path))
+
+    for name, values in results.as_dict().items():
+        assert np.array_equal(getattr(loaded, name), values)
+
+
+def test_load_npz_file(tmp_path):
+    results = results_example()
+    results.save(tmp_path, "npz")
+
+    loaded = Results.load(str(tmp_path / "results.npz"))
+
+    assert np.array_equal(loaded.q, results.q)
+    assert loaded.return_fractions is None
+
+
+def test_save_invalid_format(tmp_path):
+    with pytest.raises(ValueError):
+        results_example().save(tmp_path, "text")
+
+
+def test_save_and_load_mmap_results(tmp_path):
+    results = results_example()
+    results.save(tmp_path, "mmap")
+
+    loaded = Results.load(str(tmp_path))
+
+    assert isinstance(loaded.q, np.memmap)
+    assert np.array_equal(loaded.q, results.q)
+    assert np.array_equal(loaded.phi, results.phi)
+    assert np.array_equal(loaded.mass_intervals, results.mass_intervals)
+
+
+@pytest.mark.parametrize("output_format", ["npz", "npy-dir", "mmap"])
+def test_save_and_load_results_with_sn_yields_datasets(tmp_path, output_format):
+    results = results_example()
+    results.q = np.random.rand(2, 3, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    results.sn_yields = ["iwa1998", "sei2013"]
+    results.save(tmp_path, output_format)
+
+    loaded = Results.load(str(tmp_path))
+
+    assert loaded.steps == results.steps == 3
+    assert loaded.sn_yields == results.sn_yields
+    assert np.array_equal(loaded.q, results.q)
+
+
+def test_stack_results_with_different_shapes():
+    results = results_example()
+    with_sn_yields = results_example()
+    with_sn_yields.q = np.random.rand(2, 3, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+
+    assert stack_results([results, results_example()])["q"].shape == (2, 3, constants.Q_MATRIX_ROWS, constants.Q_MATRIX_COLUMNS)
+    with pytest.raises(ValueError, match="shapes of q differ"):
+        stack_results([results, with_sn_yields])
@@ -1,3 +1,5 @@
+import dataclasses
+import pickle
 import pytest
 import starmatrix.settings as settings
 from starmatrix.functions import max_mass_allowed
@@ -122,3 +124,66 @@ def test_deprecation_warnings():
 
     dw = settings.deprecation_warnings({"deprecation_warnings": "test"})
     assert len(dw) == 1
+
+
+def test_validate_sn_yields_lists():
+    assert settings.validate({"sn_yields": "all"})["sn_yields"] == settings.valid_values["sn_yields"]
+    assert settings.validate({"sn_yields": ["sei2013", "wrong", "iwa1998", "sei2013"]})["sn_yields"] == ["sei2013", "iwa1998"]
+    assert settings.validate({"sn_yields": ["wrong"]})["sn_yields"] == settings.default["sn_yields"]
+
+
+def test_validate_dtd_sn_lists():
+    assert settings.validate({"dtd_sn": "all"})["dtd_sn"] == settings.valid_values["dtd_sn"]
+    assert settings.validate({"dtd_sn": ["maoz", "invalid", "rlp"]})["dtd_sn"] == ["maoz", "rlp"]
+
+
+def test_validate_z_grid():
+    assert settings.validate({})["z_grid"] == []
+    assert settings.validate({"z_grid": [0.02, 0.001, -1, "wrong", 0.02, 1]})["z_grid"] == [0.001, 0.02, 1.0]
+    assert settings.validate({"z_grid": 0.02})["z_grid"] == []
+
+
+def test_validate_workers():
+    assert settings.validate({})["workers"] == 1
+    assert settings.validate({"workers": 8})["workers"] == 8
+    assert settings.validate({"workers": 0})["workers"] == 1
+    assert settings.validate({"workers": "all"})["workers"] == 1
+
+
+def test_validate_returns_a_model_config():
+    config = settings.validate({"sn_yields": ["sei2013", "iwa1998"], "yield_corrections": {"Mg": 3}})
+
+    assert isinstance(config, settings.ModelConfig)
+    assert config.sn_yields == ("sei2013", "iwa1998")
+    assert config["sn_yields"] == ["sei2013", "iwa1998"]
+    assert config.yield_corrections == (("Mg", 3),)
+    assert config["yield_corrections"] == {"Mg": 3}
+    assert config.total_time_steps == config["total_time_steps"] == 300
+    assert "integration_steps_stars_bigger_than_4Msun" not in config
+    assert "yield_corrections" not in settings.validate({})
+    assert dict(config) == {name: config[name] for name in config}
+
+
+def test_model_config_is_immutable_and_hashable():
+    config = settings.validate({"z": 0.01})
+
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        config.z = 0.02
+    with pytest.raises(TypeError):
+        config["z"] = 0.02
+
+    assert settings.validate({"z": 0.01}) == config
+    assert hash(settings.validate({"z": 0.01})) == hash(config)
+    assert {config: True}[settings.ModelConfig.from_mapping(dict(config))]
+    assert config.replace(z=0.02) != config and config.z == 0.01
+    assert pickle.loads(pickle.dumps(config)) == config
+
+
+def test_model_config_from_mapping():
+    config = settings.ModelConfig.from_mapping({"z": 0.01})
+
+    assert config.z == 0.01
+    assert config.imf == settings.default["imf"]
+    assert config.yield_corrections is None
+    with pytest.raises(ValueError):
+        settings.ModelConfig.from_mapping({"invalid_setting": 47})
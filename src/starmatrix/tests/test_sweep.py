@@ -0,0 +1,81 @@
+import pytest
+import numpy as np
+import starmatrix.settings as settings
+import starmatrix.sweep as sweep
+from starmatrix.model import Model
+
+
+def test_expand_axes():
+    configs = sweep.expand_axes({"m_max": 30.0, "z": 0.02}, {"z": [0.01, 0.02], "imf": ["salpeter", "chabrier", "ferrini"]})
+
+    assert len(configs) == 6
+    assert configs[0] == {"m_max": 30.0, "z": 0.01, "imf": "salpeter"}
+    assert configs[1] == {"m_max": 30.0, "z": 0.01, "imf": "chabrier"}
+    assert configs[-1] == {"m_max": 30.0, "z": 0.02, "imf": "ferrini"}
+
+
+def test_expand_axes_with_invalid_setting():
+    with pytest.raises(ValueError):
+        sweep.expand_axes({}, {"z": [0.01], "metallicity": [0.02]})
+
+
+def test_run_config_matches_model():
+    params = {"z": 0.01, "total_time_steps": 15}
+    results = sweep.run_config(params)
+    expected = Model(settings.validate(params)).run(write_output=False)
+
+    assert np.array_equal(results.q, expected.q)
+    assert np.array_equal(results.mass_intervals, expected.mass_intervals)
+
+
+def test_stack_results_pads_shorter_runs():
+    short = sweep.run_config({"total_time_steps": 10})
+    long = sweep.run_config({"total_time_steps": 12, "return_fractions": True})
+
+    arrays = sweep.stack_results([short, long])
+
+    assert np.array_equal(arrays["steps"], [10, 12])
+    assert arrays["q"].shape == (2, 12, 15, 9)
+    assert np.array_equal(arrays["q"][0, :10], short.q)
+    assert np.all(np.isnan(arrays["q"][0, 10:]))
+    assert np.all(np.isnan(arrays["return_fractions"][0]))
+    assert np.array_equal(arrays["return_fractions"][1], long.return_fractions)
+
+
+def test_run_sweep(tmp_path):
+    axes = {"z": [0.01, 0.02], "sn_yields": ["iwa1998", "sei2013"]}
+    configs, results_list = sweep.run_sweep({"total_time_steps": 10}, axes, output_dir=str(tmp_path), workers=2)
+
+    index, arrays = sweep.load_sweep(str(tmp_path))
+
+    assert len(configs) == len(results_list) == 4
+    assert index["axes"] == axes
+    assert index["runs"][1] == {"z": 0.01, "sn_yields": "sei2013"}
+    assert arrays["q"].shape == (4, 10, 15, 9)
+    for i, results in enumerate(results_list):
+        assert np.array_equal(arrays["q"][i], results.q)
+
+
+def test_binary_fraction_runs_share_a_model(mocker):
+    mocker.spy(Model, "run_binary_fractions")
+    configs = sweep.expand_axes({"total_time_steps": 10}, {"sn_yields": ["iwa1998", "sei2013"], "binary_fraction": [0.0, 0.1, 0.3]})
+
+    results_list = sweep.run_configs(configs, workers=1)
+
+    assert Model.run_binary_fractions.call_count == 2
+    for config, results in zip(configs, results_list):
+        expected = sweep.run_config(config)
+        assert np.allclose(results.q, expected.q, rtol=1e-12, atol=1e-300)
+        assert np.allclose(results.sn_II_rates, expected.sn_II_rates, rtol=1e-12, atol=0)
+
+
+def test_equivalent_configs_are_grouped(mocker):
+    configs = [{"total_time_steps": 10, "binary_fraction": 0.1},
+               {"total_time_steps": 10.0, "binary_fraction": 0.2, "sn_yields": settings.default["sn_yields"]},
+               {"total_time_steps": 10, "binary_fraction": 0.3, "z": 0.01}]
+
+    assert sweep.group_by_binary_fraction([sweep.validate_config(config) for config in configs]) == [[0, 1], [2]]
+
+    mocker.spy(Model, "run_binary_fractions")
+    sweep.run_configs(configs[:2], workers=1)
+    Model.run_binary_fractions.assert_called_once_with(mocker.ANY, [0.1, 0.2])
@@ -0,0 +1,59 @@
+import pytest
+import numpy as np
+import starmatrix.time_grids as time_grids
+
+
+def test_time_grid_steps():
+    grid = time_grids.TimeGrid([0.01, 0.1, 1, 10])
+
+    assert grid.steps == 3
+    assert np.array_equal(grid.t_inf, [0.01, 0.1, 1])
+    assert np.array_equal(grid.t_sup, [0.1, 1, 10])
+    assert grid.header == [0.01, 10, 3]
+    assert np.array_equal(grid.step_numbers(), [1, 2, 3])
+
+
+def test_time_grid_needs_at_least_one_step():
+    with pytest.raises(ValueError):
+        time_grids.TimeGrid([1.0])
+
+
+def test_logt_grid():
+    grid = time_grids.logt_grid(0.01, 10, 30)
+
+    assert grid.steps == 30
+    assert np.isclose(grid.edges[0], 0.01)
+    assert np.isclose(grid.edges[-1], 10)
+    assert np.allclose(np.diff(np.log10(grid.edges)), 0.1)
+    assert grid.header == [0.01, 10, 30, pytest.approx(0.1)]
+
+
+def test_t_grid():
+    grid = time_grids.t_grid(0.5, 10.5, 20)
+
+    assert grid.steps == 20
+    assert np.allclose(np.diff(grid.edges), 0.5)
+    assert grid.header == [0.5, 10.5, 20, 0.5]
+
+
+def test_two_steps_t_grid():
+    grid = time_grids.two_steps_t_grid(0.01, 0.2, 10, 0.003)
+    steps_1, steps_2 = grid.segments
+
+    assert steps_1 == 64
+    assert grid.steps == steps_1 + steps_2
+    assert np.allclose(np.diff(grid.edges[:steps_1 + 1]), 0.003)
+    assert np.allclose(np.diff(grid.edges[steps_1:]), grid.header[-1])
+    assert grid.header[-1] <= 50 * 0.003
+    assert np.isclose(grid.edges[-1], 10)
+    assert np.array_equal(grid.step_numbers()[steps_1 - 1:steps_1 + 1], [steps_1, 1])
+
+
+def test_fixed_n_steps_grid():
+    grid = time_grids.fixed_n_steps_grid(0.01, 0.2, 10, 15, 9)
+
+    assert grid.steps == 24
+    assert grid.segments == [15, 9]
+    assert np.isclose(grid.edges[15], 0.2)
+    assert np.allclose(np.diff(grid.edges[:16]), 0.19 / 15)
+    assert np.allclose(np.diff(grid.edges[15:]), 9.8 / 9)
@@ -0,0 +1,114 @@
+"""
+Time grids
+
+The integration steps of a model are given by a TimeGrid: the edges (in Gyr) of every time step.
+Contains constructors for the grids of the integration_step options:
+
+* logt: steps evenly spaced in log(t)
+* t: steps evenly spaced in t
+* two_steps_t: short steps for massive stars and longer steps for stars smaller than 4 Msun
+* fixed_n_steps: a fixed number of steps for stars bigger and smaller than 4 Msun
+
+Any other grid can be used creating a TimeGrid with an array of edges.
+
+"""
+
+import math
+import numpy as np
+
+
+class TimeGrid:
+    """
+    Edges of consecutive time steps: step i goes from edges[i] to edges[i + 1].
+
+    header contains the values describing the grid written at the top of the mass_intervals file,
+    segments the number of steps of each part of the grid (steps are numbered from 1 in each segment).
+
+    """
+
+    def __init__(self, edges, header=None, segments=None):
+        self.edges = np.asarray(edges, dtype=float)
+        if self.edges.ndim != 1 or len(self.edges) < 2:
+            raise ValueError("Time grid edges should be an array of at least two times")
+
+        if header is None:
+            header = [self.edges[0], self.edges[-1], self.steps]
+        if segments is None:
+            segments = [self.steps]
+
+        self.header = header
+        self.segments = segments
+
+    @property
+    def steps(self):
+        return len(self.edges) - 1
+
+    @property
+    def t_inf(self):
+        return self.edges[:-1]
+
+    @property
+    def t_sup(self):
+        return self.edges[1:]
+
+    def step_numbers(self):
+        return np.concatenate([np.arange(1, n + 1) for n in self.segments])
+
+
+def logt_grid(t_ini, t_end, steps):
+    t_ini_log = math.log10(t_ini * 1e9)
+    t_end_log = math.log10(t_end * 1e9)
+    delta_t_log = (t_end_log - t_ini_log) / steps
+
+    edges = np.power(10, t_ini_log + (delta_t_log * np.arange(steps + 1)) - 9)
+
+    return TimeGrid(edges, header=[t_ini, t_end, steps, delta_t_log])
+
+
+def t_grid(t_ini, t_end, steps):
+    delta_t = (t_end - t_ini) / steps
+
+    edges = t_ini + (delta_t * np.arange(steps + 1))
+
+    return TimeGrid(edges, header=[t_ini, t_end, steps, delta_t])
+
+
+def two_steps_t_grid(t_ini, t_limit, t_end, delta_t_1):
+    """
+    Steps of delta_t_1 up to t_limit (the last one may end after t_limit),
+    then steps 50 times longer, adjusted to end at t_end
+
+    """
+    delta_t_2 = 50 * delta_t_1
+
+    steps_with_delta_t_1 = math.ceil((t_limit - t_ini) / delta_t_1)
+    t_ini_for_delta_2 = t_ini + (delta_t_1 * steps_with_delta_t_1)
+    steps_with_delta_t_2 = math.ceil((t_end - t_ini_for_delta_2) / delta_t_2)
+    delta_t_2 = (t_end - t_ini_for_delta_2) / steps_with_delta_t_2
+
+    edges = np.concatenate([
+        t_ini + (delta_t_1 * np.arange(steps_with_delta_t_1)),
+        t_ini_for_delta_2 + (delta_t_2 * np.arange(steps_with_delta_t_2 + 1)),
+    ])
+
+    return TimeGrid(edges,
+                    header=[t_ini, t_end, steps_with_delta_t_1, steps_with_delta_t_2, delta_t_1, delta_t_2],
+                    segments=[steps_with_delta_t_1, steps_with_delta_t_2])
+
+
+def fixed_n_steps_grid(t_ini, t_limit, t_end, n_massive, n_small):
+    """
+    n_massive steps from t_ini to t_limit and n_small steps from t_limit to t_end
+
+    """
+    delta_t_1 = (t_limit - t_ini) / n_massive
+    delta_t_2 = (t_end - t_limit) / n_small
+
+    edges = np.concatenate([
+        t_ini + (delta_t_1 * np.arange(n_massive)),
+        t_limit + (delta_t_2 * np.arange(n_small + 1)),
+    ])
+
+    return TimeGrid(edges,
+                    header=[t_ini, t_end, n_massive, n_small, delta_t_1, delta_t_2],
+                    segments=[n_massive, n_small])